@@ -14,7 +14,9 @@ from typing import (Dict,
                     Optional,
                     Any)
 
-from rls.utils.tf2_utils import get_device
+from rls.utils.tf2_utils import (get_device,
+                                 trace_monitor)
+from rls.utils.summary_writer import AsyncSummaryWriter
 from rls.utils.display import colorize
 from rls.utils.sundry_utils import check_or_create
 from rls.utils.logging_utils import (get_logger,
@@ -52,6 +54,8 @@ class Base:
         self.global_step = tf.Variable(0, name="global_step", trainable=False, dtype=tf.int64)  # in TF 2.x must be tf.int64, because function set_step need args to be tf.int64.
         self._worker_params_dict = {}
         self._all_params_dict = dict(global_step=self.global_step)
+        self.summary_interval = int(kwargs.get('summary_interval', 1))  # aggregate training summaries of this many steps
+        self.summary_reduces = list(kwargs.get('summary_reduces', ['mean']))
         self.writer = self._create_writer(self.log_dir)  # TODO: Annotation
 
         if bool(kwargs.get('logger2file', False)):
@@ -86,10 +90,16 @@ class Base:
         self.checkpoint = tf.train.Checkpoint(**self._all_params_dict)
         self.saver = tf.train.CheckpointManager(self.checkpoint, directory=self.cp_dir, max_to_keep=5, checkpoint_name='ckpt')
 
-    def _create_writer(self, log_dir: str) -> tf.summary.SummaryWriter:
+    def _create_writer(self, log_dir: str) -> AsyncSummaryWriter:
         if not self.no_save:
             check_or_create(log_dir, 'logs(summaries)')
-            return tf.summary.create_file_writer(log_dir)
+            return AsyncSummaryWriter(tf.summary.create_file_writer(log_dir),
+                                      interval=self.summary_interval,
+                                      reduces=self.summary_reduces)
+
+    def _flush_writers(self) -> NoReturn:
+        if not self.no_save:
+            self.writer.flush()
 
     def init_or_restore(self, base_dir: Optional[str] = None) -> NoReturn:
         """
@@ -119,6 +129,7 @@ class Base:
         if not self.no_save:
             train_step = int(kwargs.get('train_step', 0))
             self.saver.save(checkpoint_number=train_step)
+            self._flush_writers()
             logger.info(colorize(f'Save checkpoint success. Training step: {train_step}', color='green'))
             self.write_training_info(kwargs)
 
@@ -147,33 +158,26 @@ class Base:
 
     def writer_summary(self,
                        global_step: Union[int, tf.Variable],
-                       writer: Optional[tf.summary.SummaryWriter] = None,
+                       writer: Optional[AsyncSummaryWriter] = None,
                        summaries: Dict = {}) -> NoReturn:
         """
-        record the data used to show in the tensorboard
+        record the data used to show in the tensorboard, episode summaries are not aggregated.
         """
         if not self.no_save:
             writer = writer or self.writer
-            writer.set_as_default()
-            tf.summary.experimental.set_step(global_step)
-            for k, v in summaries.items():
-                tf.summary.scalar('AGENT/' + k, v)
-            writer.flush()
+            writer.add(global_step, {'AGENT/' + k: v for k, v in summaries.items()}, reduce=False)
 
     def write_training_summaries(self,
                                  global_step: Union[int, tf.Variable],
                                  summaries: Dict = {},
-                                 writer: Optional[tf.summary.SummaryWriter] = None) -> NoReturn:
+                                 writer: Optional[AsyncSummaryWriter] = None) -> NoReturn:
         '''
-        write tf summaries showing in tensorboard.
+        write tf summaries showing in tensorboard, they are aggregated over summary_interval calls and written in the background.
+        numbers of retraces of functions decorated by relaxed_function are written with them.
         '''
         if not self.no_save:
             writer = writer or self.writer
-            writer.set_as_default()
-            tf.summary.experimental.set_step(global_step)
-            for key, value in summaries.items():
-                tf.summary.scalar(key, value)
-            writer.flush()
+            writer.add(global_step, dict(summaries, **trace_monitor.summaries()))
 
     def get_worker_params(self):
         weights_list = list(map(lambda x: x.numpy(), self._worker_params_list))
@@ -202,7 +206,8 @@ class Base:
         """
         end training, and export the training model
         """
-        pass
+        if not self.no_save:
+            self.writer.close()
 
     def get_global_step(self) -> int:
         """
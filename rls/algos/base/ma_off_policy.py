@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+import importlib
 import numpy as np
 import tensorflow as tf
 
@@ -12,7 +13,7 @@ from typing import (List,
 
 from rls.algos.base.ma_policy import MultiAgentPolicy
 from rls.common.yaml_ops import load_yaml
-from rls.memories.multi_replay_buffers import MultiAgentExperienceReplay
+from rls.utils.np_utils import int2one_hot
 from rls.utils.specs import (BatchExperiences,
                              NamedTupleStaticClass)
 
@@ -23,16 +24,24 @@ class MultiAgentOffPolicy(MultiAgentPolicy):
 
         self.buffer_size = int(kwargs.get('buffer_size', 10000))
         self.n_step = int(kwargs.get('n_step', 1))
+        self.use_priority = kwargs.get('use_priority', False)
+        self.use_isw = bool(kwargs.get('use_isw', False))
         self.train_times_per_step = int(kwargs.get('train_times_per_step', 1))
 
     def initialize_data_buffer(self) -> NoReturn:
         '''
         TODO: Annotation
         '''
+        _type = 'MultiAgentExperienceReplay'
         _buffer_args = dict(n_agents=self.n_agents_percopy, batch_size=self.batch_size, capacity=self.buffer_size)
-        default_buffer_args = load_yaml(f'rls/configs/off_policy_buffer.yaml')['MultiAgentExperienceReplay']
+        if self.use_priority:
+            _type = 'MultiAgentPrioritizedExperienceReplay'
+            _buffer_args.update(max_train_step=self.max_train_step)
+        default_buffer_args = load_yaml(f'rls/configs/off_policy_buffer.yaml')[_type]
         default_buffer_args.update(_buffer_args)
-        self.data = MultiAgentExperienceReplay(**default_buffer_args)
+
+        Buffer = getattr(importlib.import_module(f'rls.memories.multi_replay_buffers'), _type)
+        self.data = Buffer(**default_buffer_args)
 
     def store_data(self, expss: List[BatchExperiences]) -> NoReturn:
         """
@@ -48,9 +57,9 @@ class MultiAgentOffPolicy(MultiAgentPolicy):
     def _target_params_update(self):
         pass
 
-    def get_transitions(self) -> BatchExperiences:
+    def get_transitions(self) -> List[BatchExperiences]:
         '''
-        TODO: Annotation
+        batches of all agents are gathered by one index vector, then converted to tensors on self.device.
         '''
         expss = self.data.sample()   # 经验池取数据
         return self._data_process2dict(expss)
@@ -86,8 +95,21 @@ class MultiAgentOffPolicy(MultiAgentPolicy):
             self.intermediate_variable_reset()
             data = self.get_transitions()
 
-            # --------------------------------------训练主程序，返回可能用于PER权重更新的TD error，和需要输出tensorboard的信息
-            summaries = self._train(data)
+            # --------------------------------------优先经验回放部分，获取重要性比例
+            if self.use_priority and self.use_isw:
+                _isw = self.data.get_IS_w().reshape(-1, 1)  # [B, ] => [B, 1]
+                _isw = self.data_convert(_isw)
+            else:
+                _isw = tf.constant(value=1., dtype=self._tf_data_type)
+            # --------------------------------------
+
+            # --------------------------------------训练主程序，返回用于PER权重更新的每个智能体的TD error，和需要输出tensorboard的信息
+            td_errors, summaries = self._train(data, _isw)
+            # --------------------------------------
+
+            # --------------------------------------优先经验回放的更新部分
+            if self.use_priority:
+                self.data.update([td_error.numpy() for td_error in td_errors])
             # --------------------------------------
 
             # --------------------------------------target网络的更新部分
@@ -14,6 +14,7 @@ from typing import (List,
                     NoReturn)
 
 from rls.algos.base.base import Base
+from rls.utils.summary_writer import AsyncSummaryWriter
 from rls.nn.learningrate import ConsistentLearningRate
 from rls.utils.specs import (EnvGroupArgs,
                              VectorNetworkType,
@@ -48,6 +49,18 @@ class MultiAgentPolicy(Base):
 
         self.writers = [self._create_writer(self.log_dir + f'_{i}') for i in range(self.n_agents_percopy)]
 
+    def _flush_writers(self) -> NoReturn:
+        super()._flush_writers()
+        if not self.no_save:
+            for writer in self.writers:
+                writer.flush()
+
+    def close(self) -> Any:
+        super().close()
+        if not self.no_save:
+            for writer in self.writers:
+                writer.close()
+
     def init_lr(self, lr: float) -> Callable:
         if self.delay_lr:
             return tf.keras.optimizers.schedules.PolynomialDecay(lr, self.max_train_step, 1e-10, power=1.0)
@@ -98,7 +111,7 @@ class MultiAgentPolicy(Base):
     def write_training_summaries(self,
                                  global_step: Union[int, tf.Variable],
                                  summaries: Dict,
-                                 writer: Optional[tf.summary.SummaryWriter] = None) -> NoReturn:
+                                 writer: Optional[AsyncSummaryWriter] = None) -> NoReturn:
         '''
         write tf summaries showing in tensorboard.
         '''
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+import os
 import importlib
+import contextlib
 import numpy as np
 import tensorflow as tf
 
@@ -9,18 +11,25 @@ from typing import (Dict,
                     Union,
                     NoReturn,
                     List,
-                    Tuple)
+                    Tuple,
+                    Optional)
 
 from rls.utils.np_utils import int2one_hot
 from rls.algos.base.policy import Policy
 from rls.common.yaml_ops import load_yaml
+from rls.memories.prefetch_sampler import (LockedBuffer,
+                                           PrefetchSampler)
 from rls.utils.specs import (MemoryNetworkType,
                              BatchExperiences,
                              ModelObservations,
                              NamedTupleStaticClass)
+from rls.utils.tf2_utils import relaxed_function
 
 
 class Off_Policy(Policy):
+    # whether _target_params_update only changes tf.Variables, so that it can be traced into the fused update loop.
+    _graph_target_update = True
+
     def __init__(self, envspec, **kwargs):
         super().__init__(envspec=envspec, **kwargs)
         self.buffer_size = int(kwargs.get('buffer_size', 10000))
@@ -29,8 +38,18 @@ class Off_Policy(Policy):
         self.gamma = self.gamma ** self.n_step
         self.use_isw = bool(kwargs.get('use_isw', False))
         self.train_times_per_step = int(kwargs.get('train_times_per_step', 1))
-
-        self.burn_in_time_step = int(kwargs.get('burn_in_time_step', 10))
+        self.prefetch_batches = int(kwargs.get('prefetch_batches', 0))
+        self._prefetcher = None
+        self.fused_updates = bool(kwargs.get('fused_updates', False)) and self.train_times_per_step > 1
+        if self.fused_updates:
+            assert not self.use_rnn and not self.use_curiosity, 'fused updates do not support rnn or curiosity yet'
+            assert self._graph_target_update, f'target networks of {self.__class__.__name__} cannot be updated in graph'
+        self._fused_ready = False   # optimizers create their slots in the first normal update
+        self._fused_round = False   # whether the updates of the current learn() have been fused
+        self._learn_calls = 0
+
+        # training starts from the recorded cell state of a sequence, burn in is an opt-in refresh of stale states, like R2D2.
+        self.burn_in_time_step = int(kwargs.get('burn_in_time_step', 0))
         self.train_time_step = int(kwargs.get('train_time_step', 10))
         self.episode_batch_size = int(kwargs.get('episode_batch_size', 32))
         self.episode_buffer_size = int(kwargs.get('episode_buffer_size', 10000))
@@ -41,7 +60,7 @@ class Off_Policy(Policy):
         '''
         _buffer_args = {}
         if self.use_rnn:
-            _type = 'EpisodeExperienceReplay'
+            _type = 'SequenceExperienceReplay'
             _buffer_args.update(
                 batch_size=self.episode_batch_size,
                 capacity=self.episode_buffer_size,
@@ -49,6 +68,11 @@ class Off_Policy(Policy):
                 train_time_step=self.train_time_step,
                 agents_num=self.n_agents
             )
+            if self.use_priority:
+                _type = 'Prioritized' + _type
+                _buffer_args.update(
+                    max_train_step=self.max_train_step
+                )
         else:
             _type = 'ExperienceReplay'
             _buffer_args.update(
@@ -64,26 +88,73 @@ class Off_Policy(Policy):
                 _type = 'NStep' + _type
                 _buffer_args.update(
                     n_step=self.n_step,
-                    gamma=self.gamma,
+                    gamma=self.gamma ** (1 / self.n_step),  # discount of one step, self.gamma is powered by n_step already
                     agents_num=self.n_agents
                 )
 
         default_buffer_args = load_yaml(f'rls/configs/off_policy_buffer.yaml')[_type]
         default_buffer_args.update(_buffer_args)
+        if default_buffer_args.pop('memmap', False):
+            default_buffer_args.update(memmap_dir=os.path.join(self.base_dir, 'replay'))
 
         Buffer = getattr(importlib.import_module(f'rls.memories.single_replay_buffers'), _type)
         self.data = Buffer(**default_buffer_args)
+        if self.prefetch_batches > 0:
+            self.data = LockedBuffer(self.data)
+            self._data_lock = self.data.lock
+        else:
+            self._data_lock = contextlib.nullcontext()
+
+    def init_or_restore(self, base_dir: Optional[str] = None) -> NoReturn:
+        super().init_or_restore(base_dir)
+        if hasattr(self, 'data'):   # HIRO keeps buffers of its own
+            self.data.restore()
+
+    def save_checkpoint(self, **kwargs) -> NoReturn:
+        super().save_checkpoint(**kwargs)
+        if not self.no_save and hasattr(self, 'data'):
+            self._close_prefetcher()    # not sampling while the buffer is saved, the next learn starts it again
+            self.data.save_checkpoint()
 
-    def store_data(self, exps: BatchExperiences) -> NoReturn:
+    def close(self) -> NoReturn:
+        self._close_prefetcher()
+        super().close()
+
+    def reset(self) -> NoReturn:
+        super().reset()
+        self._stored_cell_state = self.cell_state
+
+    def truncate(self, env_ids: Optional[np.ndarray] = None) -> NoReturn:
+        if hasattr(self, 'data'):   # HIRO keeps buffers of its own
+            self.data.truncate(env_ids)
+
+    def partial_reset(self, done) -> NoReturn:
+        super().partial_reset(done)
+        self._stored_cell_state = self.cell_state   # the cell state before obs of the next step
+
+    def set_cell_state(self, cs) -> NoReturn:
+        super().set_cell_state(cs)
+        self._stored_cell_state = cs    # i.e. training resumes after evaluation
+
+    def store_data(self, exps: BatchExperiences, env_ids: Optional[np.ndarray] = None) -> NoReturn:
         """
         for off-policy training, use this function to store <s, a, r, s_, done> into ReplayBuffer.
+        env_ids: envs of exps if only some of the envs stepped, i.e. envs stepping asynchronously.
         """
         # self._running_average()
-        self.data.add(exps)
+        if self.use_rnn:
+            self.data.add(exps, cell_state=tuple(cs.numpy() for cs in self._stored_cell_state))
+        elif env_ids is not None and self.n_step > 1:   # n-step windows are kept by env
+            self.data.add(exps, env_ids=env_ids)
+        else:
+            self.data.add(exps)
 
     def no_op_store(self, exps: BatchExperiences) -> NoReturn:
         # self._running_average()
-        self.data.add(exps)
+        if self.use_rnn:
+            self.data.add(exps, cell_state=tuple(cs.numpy() for cs in self._stored_cell_state))
+        else:
+            self.data.add(exps)
 
     def get_transitions(self) -> BatchExperiences:
         '''
@@ -92,6 +163,47 @@ class Off_Policy(Policy):
         exps = self.data.sample()   # 经验池取数据
         return self._data_process2dict(exps)
 
+    def _sample_batch(self) -> Tuple:
+        '''
+        sample a batch and everything a train step needs from the buffer, then convert them to tensors on self.device.
+        it runs in the prefetch thread if prefetch_batches > 0.
+        return:
+            data, importance sampling weights, cell state to start from, observations to burn in, indexs for updating priorities
+        '''
+        cell_state, burn_in_obs = self.initial_cell_state(batch=self.episode_batch_size), None
+        with self._data_lock:
+            data = self.data.sample()   # 经验池取数据
+            isw = self.data.get_IS_w().reshape(-1, 1) if self.use_priority and self.use_isw else None   # [B, ] => [B, 1]
+            idxs = self.data.last_indexs if self.use_priority else None
+            if self.use_rnn:
+                _cell_state = self.data.get_burn_in_cell_state()
+                _burn_in_data = self.data.get_burn_in_data() if self.burn_in_time_step > 0 else None
+
+        data = self._data_process2dict(data)
+        isw = self.data_convert(isw) if isw is not None else tf.constant(value=1., dtype=self._tf_data_type)
+        if self.use_rnn:
+            if _cell_state:  # recorded when the sequences were collected, i.e. AC stores none
+                cell_state = self.data_convert(_cell_state)
+            if self.burn_in_time_step > 0:
+                burn_in_obs = NamedTupleStaticClass.data_convert(self.data_convert, _burn_in_data.obs)
+        return data, isw, cell_state, burn_in_obs, idxs
+
+    def _get_batch(self) -> Tuple:
+        '''
+        get a prefetched batch, the prefetch thread starts when the buffer has enough data.
+        '''
+        if self.prefetch_batches <= 0:
+            return self._sample_batch()
+        if self._prefetcher is None:
+            self._prefetcher = PrefetchSampler(self._sample_batch, self.prefetch_batches)
+            self._prefetcher.start()
+        return self._prefetcher.get()
+
+    def _close_prefetcher(self) -> NoReturn:
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
     def _data_process2dict(self, exps: BatchExperiences) -> BatchExperiences:
         # TODO 优化
         if not self.is_continuous:
@@ -124,15 +236,23 @@ class Off_Policy(Policy):
         _summary = function_dict.get('summary_dict', {})    # 记录输出到tensorboard的词典
         _use_stack = function_dict.get('use_stack', False)
 
+        if self.fused_updates:
+            # learn() calls this train_times_per_step times, the first call runs all of the updates.
+            first, self._learn_calls = self._learn_calls % self.train_times_per_step == 0, self._learn_calls + 1
+            if first:
+                self._fused_round = self._fused_ready and self.data.is_lg_batch_size
+                if self._fused_round:
+                    self._fused_learn(function_dict)
+            if self._fused_round:
+                return
+
         if self.data.is_lg_batch_size:
             self.intermediate_variable_reset()
-            data = self.get_transitions()
+            data, _isw, cell_state, _burn_in_obs, _idxs = self._get_batch()
 
             # --------------------------------------burn in隐状态部分
-            cell_state = self.initial_cell_state(batch=self.episode_batch_size)
-            if self.use_rnn and self.burn_in_time_step > 0:
-                _burn_in_data = self.data.get_burn_in_data()
-                _, cell_state = self._representation_net(_burn_in_data.obs, cell_state)
+            if _burn_in_obs is not None:
+                _, cell_state = self._representation_net(_burn_in_obs, cell_state)
             # --------------------------------------
 
             # --------------------------------------好奇心部分
@@ -149,14 +269,6 @@ class Off_Policy(Policy):
                 _summary.update(crsty_summaries)
             # --------------------------------------
 
-            # --------------------------------------优先经验回放部分，获取重要性比例
-            if self.use_priority and self.use_isw:
-                _isw = self.data.get_IS_w().reshape(-1, 1)  # [B, ] => [B, 1]
-                _isw = self.data_convert(_isw)
-            else:
-                _isw = tf.constant(value=1., dtype=self._tf_data_type)
-            # --------------------------------------
-
             # --------------------------------------如果使用RNN， 就将s和s‘状态进行拼接处理
             if _use_stack:
                 if self.use_rnn:
@@ -177,7 +289,7 @@ class Off_Policy(Policy):
             # --------------------------------------优先经验回放的更新部分
             if self.use_priority:
                 td_error = np.squeeze(td_error.numpy())
-                self.data.update(td_error)
+                self.data.update(td_error, _idxs)   # indexs of this batch, others may have been sampled since
             # --------------------------------------
 
             # --------------------------------------target网络的更新部分
@@ -191,6 +303,46 @@ class Off_Policy(Policy):
             # --------------------------------------写summary到tensorboard
             self.write_training_summaries(self.global_step, self.summaries)
             # --------------------------------------
+            self._fused_ready = True
+
+    def _fused_learn(self, function_dict: Dict) -> NoReturn:
+        '''
+        run train_times_per_step updates in one call of _fused_train, batches are stacked along a new axis, [K, B, ...],
+        priorities of all of them are updated at once.
+        '''
+        _summary = function_dict.get('summary_dict', {})
+        self.intermediate_variable_reset()
+        batches = [self._get_batch() for _ in range(self.train_times_per_step)]
+        data, isw = tf.nest.map_structure(lambda *x: tf.stack(x), *[(batch[0], batch[1]) for batch in batches])
+        td_errors, summaries = self._fused_train(data, isw, function_dict.get('use_stack', False))
+        _summary.update(summaries)
+        if self.use_priority:
+            self.data.update(np.reshape(td_errors.numpy(), -1), np.concatenate([batch[4] for batch in batches]))
+        self.summaries.update(_summary)
+        self.write_training_summaries(self.global_step, self.summaries)
+
+    @relaxed_function(batch_axis=1)
+    def _fused_train(self, data: BatchExperiences, isw: tf.Tensor, use_stack: bool):
+        '''
+        K gradient steps and target updates in a tf.while_loop.
+        return:
+            td errors of all steps, [K, B, 1], summaries of the last step
+        '''
+        def step(k):
+            _data = tf.nest.map_structure(lambda x: x[k], data)
+            if use_stack:
+                _data = _data._replace(obs=ModelObservations.stack(_data.obs, _data.obs_))
+            td_error, summaries = self._train(_data, isw[k], self.initial_cell_state(batch=self.batch_size))
+            self._target_params_update()
+            return td_error, summaries
+
+        td_error, summaries = step(0)
+        k = tf.shape(isw)[0]
+        td_errors = tf.TensorArray(td_error.dtype, size=k, element_shape=td_error.shape).write(0, td_error)
+        for i in tf.range(1, k):
+            td_error, summaries = step(i)
+            td_errors = td_errors.write(i, td_error)
+        return td_errors.stack(), summaries
 
     def _apex_learn(self, function_dict: Dict, data: BatchExperiences, priorities) -> np.ndarray:
         '''
@@ -51,6 +51,7 @@ class On_Policy(Policy):
         '''
         _cal_stics = function_dict.get('calculate_statistics', lambda *args: None)
         _train = function_dict.get('train_function', lambda *args: None)    # 训练过程
+        _train_epochs = function_dict.get('train_epochs_function', None)    # 一次完成所有epoch和minibatch的训练过程, 输入整个rollout, 不支持rnn
         _summary = function_dict.get('summary_dict', {})    # 记录输出到tensorboard的词典
 
         self.intermediate_variable_reset()
@@ -71,15 +72,20 @@ class On_Policy(Policy):
 
         _cal_stics()
 
-        if self.use_rnn:
-            all_data = self.data.sample_generater_rnn()
+        if _train_epochs is not None and not self.use_rnn:
+            # the whole rollout is converted once, minibatches are made by _train_epochs itself
+            data = NamedTupleStaticClass.data_convert(self.data_convert, self.data.sample_all())
+            summaries = _train_epochs(data)
         else:
-            all_data = self.data.sample_generater()
-
-        for data, cell_state in all_data:
-            data = NamedTupleStaticClass.data_convert(self.data_convert, data)
-            cell_state = self.data_convert(cell_state)
-            summaries = _train(data, cell_state)
+            if self.use_rnn:
+                all_data = self.data.sample_generater_rnn()
+            else:
+                all_data = self.data.sample_generater()
+
+            for data, cell_state in all_data:
+                data = NamedTupleStaticClass.data_convert(self.data_convert, data)
+                cell_state = self.data_convert(cell_state)
+                summaries = _train(data, cell_state)
 
         self.summaries.update(summaries)
         self.summaries.update(_summary)
@@ -24,9 +24,14 @@ from rls.utils.specs import (EnvGroupArgs,
                              MemoryNetworkType)
 from rls.utils.build_networks import DefaultRepresentationNetwork
 from rls.nn.modules import CuriosityModel
+from rls.nn.noise import OrnsteinUhlenbeckNoisedAction
+from rls.utils.tf2_utils import relaxed_function
 
 
 class Policy(Base):
+    # whether choose_action keeps states of every env besides cell states of rnn, i.e. options of the last step
+    _keeps_env_states = False
+
     def __init__(self, envspec: EnvGroupArgs, **kwargs):
         super().__init__(**kwargs)
 
@@ -100,10 +105,25 @@ class Policy(Base):
     def init_optimizer(self, lr: Callable, *args, **kwargs) -> tf.keras.optimizers.Optimizer:
         return tf.keras.optimizers.Adam(learning_rate=lr(self.train_step), *args, **kwargs)
 
+    @property
+    def keeps_env_states(self) -> bool:
+        '''
+        whether actions depend on states kept for every env between steps, i.e. cell states of rnn and OU noise,
+        then choose_action needs observations of all envs at once, and envs can not step asynchronously.
+        '''
+        return self._keeps_env_states or self.use_rnn \
+            or isinstance(getattr(self, 'noised_action', None), OrnsteinUhlenbeckNoisedAction)
+
     def reset(self) -> NoReturn:
         '''reset model for each new episode.'''
         self.cell_state = self.next_cell_state = self.initial_cell_state(batch=self.n_agents)
 
+    def truncate(self, env_ids: Optional[np.ndarray] = None) -> NoReturn:
+        '''
+        called when envs(all envs if env_ids is None) are reset without done, experiences assembled across steps are closed.
+        '''
+        pass
+
     def initial_cell_state(self, batch: int) -> Tuple[tf.Tensor]:
         if self.use_rnn:
             return tuple(tf.zeros((batch, self._representation_net.h_dim), dtype=tf.float32) for _ in range(self.cell_nums))
@@ -126,7 +146,7 @@ class Policy(Base):
         if self.cell_state[0] is not None and len(index) > 0:
             _arr = np.ones(shape=self.cell_state[0].shape, dtype=np.float32)    # h, c
             _arr[index] = 0.
-            self.cell_state = [c * _arr for c in self.cell_state]        # [A, B] * [A, B] => [A, B] 将某行全部替换为0.
+            self.cell_state = tuple(c * _arr for c in self.cell_state)   # [A, B] * [A, B] => [A, B] 将某行全部替换为0. tuple as initial_cell_state, to not retrace _get_action
 
     def intermediate_variable_reset(self) -> NoReturn:
         '''
@@ -147,7 +167,7 @@ class Policy(Base):
         '''
         pass
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, is_training: bool = True) -> Any:
         '''
         TODO: Annotation
@@ -12,7 +12,8 @@ from rls.nn.noise import ClippedNormalNoisedAction
 from rls.algos.base.off_policy import Off_Policy
 from rls.memories.single_replay_buffers import ExperienceReplay
 from rls.utils.np_utils import int2one_hot
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ADoubleCNetwork
 from rls.utils.specs import (OutputNetworkType,
                              BatchExperiences,
@@ -26,6 +27,7 @@ class HIRO(Off_Policy):
     '''
     Data-Efficient Hierarchical Reinforcement Learning, http://arxiv.org/abs/1805.08296
     '''
+    _keeps_env_states = True    # subgoals of every env
 
     def __init__(self,
                  envspec,
@@ -118,8 +120,10 @@ class HIRO(Off_Policy):
         self.low_ac_net = _create_low_ac_net('low_ac_net')
         self.low_ac_target_net = _create_low_ac_net('low_ac_target_net')
 
-        update_target_net_weights(self.low_ac_target_net.weights + self.high_ac_target_net.weights,
-                                  self.low_ac_net.weights + self.high_ac_net.weights)
+        self._low_target_updater = TargetNetUpdater(self.low_ac_target_net.weights, self.low_ac_net.weights, ployak=self.ployak)
+        self._high_target_updater = TargetNetUpdater(self.high_ac_target_net.weights, self.high_ac_net.weights, ployak=self.ployak)
+        self._low_target_updater.copy()
+        self._high_target_updater.copy()
 
         self.low_actor_lr, self.low_critic_lr = map(self.init_lr, [low_actor_lr, low_critic_lr])
         self.high_actor_lr, self.high_critic_lr = map(self.init_lr, [high_actor_lr, high_critic_lr])
@@ -214,7 +218,7 @@ class HIRO(Off_Policy):
             self._done[i] = []
             self._subgoals[i] = []
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, subgoal):
         with tf.device(self.device):
             feat = tf.concat([obs.flatten_vector(), subgoal], axis=-1)
@@ -235,7 +239,7 @@ class HIRO(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def get_subgoal(self, s):
         '''
         s 当前隐状态
@@ -255,12 +259,12 @@ class HIRO(Off_Policy):
                 summaries = self.train_low(low_data)
 
                 self.summaries.update(summaries)
-                update_target_net_weights(self.low_ac_target_net.weights, self.low_ac_net.weights, self.ployak)
+                self._low_target_updater.update()
                 if self.counts % self.sub_goal_steps == 0:
                     self.counts = 0
                     high_summaries = self.train_high(high_data)
                     self.summaries.update(high_summaries)
-                    update_target_net_weights(self.high_ac_target_net.weights, self.high_ac_net.weights, self.ployak)
+                    self._high_target_updater.update()
                 self.counts += 1
                 self.summaries.update(dict([
                     ['LEARNING_RATE/low_actor_lr', self.low_actor_lr(self.train_step)],
@@ -270,7 +274,7 @@ class HIRO(Off_Policy):
                 ]))
                 self.write_training_summaries(self.global_step, self.summaries)
 
-    @tf.function
+    @relaxed_function
     def train_low(self, BATCH: Low_BatchExperiences):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
@@ -305,7 +309,7 @@ class HIRO(Off_Policy):
                     mu = output
                 else:
                     logits = output
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     logp_all = tf.nn.log_softmax(logits)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
                     _pi_true_one_hot = tf.one_hot(tf.argmax(_pi, axis=-1), self.a_dim)
@@ -327,7 +331,7 @@ class HIRO(Off_Policy):
                 ['Statistics/low_q_max', tf.reduce_max(q)]
             ])
 
-    @tf.function
+    @relaxed_function
     def train_high(self, BATCH: High_BatchExperiences):
         # BATCH.obs_ : [B, N]
         # BATCH.obs, BATCH.action [B, T, *]
@@ -11,7 +11,8 @@ from rls.algos.base.off_policy import Off_Policy
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
                                  gaussian_entropy,
-                                 update_target_net_weights)
+                                 TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import (OutputNetworkType,
                              BatchExperiences)
@@ -24,6 +25,7 @@ class IOC(Off_Policy):
     Learning Options with Interest Functions, https://www.aaai.org/ojs/index.php/AAAI/article/view/5114/4987 
     Options of Interest: Temporal Abstraction with Interest Functions, http://arxiv.org/abs/2001.00271
     '''
+    _keeps_env_states = True    # options of every env
 
     def __init__(self,
                  envspec,
@@ -96,7 +98,9 @@ class IOC(Off_Policy):
         if self.is_continuous:
             self.log_std = tf.Variable(initial_value=-0.5 * np.ones((self.options_num, self.a_dim), dtype=np.float32), trainable=True)   # [P, A]
             self.actor_tv += [self.log_std]
-        update_target_net_weights(self.q_target_net.weights, self.q_net.weights)
+        self._target_updater = TargetNetUpdater(self.q_target_net.weights, self.q_net.weights,
+                                                interval=self.assign_interval, step=self.global_step)
+        self._target_updater.copy()
 
         self.q_lr, self.intra_option_lr, self.termination_lr, self.interest_lr = map(self.init_lr, [q_lr, intra_option_lr, termination_lr, interest_lr])
         self.q_optimizer = self.init_optimizer(self.q_lr, clipvalue=5.)
@@ -131,7 +135,7 @@ class IOC(Off_Policy):
         a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state, options):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -154,8 +158,7 @@ class IOC(Off_Policy):
         return a, new_options, cell_state
 
     def _target_params_update(self):
-        if self.global_step % self.assign_interval == 0:
-            update_target_net_weights(self.q_target_net.weights, self.q_net.weights)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -170,7 +173,7 @@ class IOC(Off_Policy):
                 ])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         last_options = tf.cast(BATCH.last_options, tf.int32)
         options = tf.cast(BATCH.options, tf.int32)
@@ -9,7 +9,8 @@ from collections import namedtuple
 
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import (OutputNetworkType,
@@ -129,7 +130,7 @@ class PPOC(On_Policy):
         self.options = new_options
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state, options):
         with tf.device(self.device):
             (q, pi, beta, o), cell_state = self.net(obs, cell_state=cell_state)  # [B, P], [B, P, A], [B, P], [B, P]
@@ -167,7 +168,7 @@ class PPOC(On_Policy):
         self.cell_state = self.next_cell_state
         self.oc_mask = tf.zeros_like(self.oc_mask)
 
-    @tf.function
+    @relaxed_function
     def _get_value(self, obs, options, cell_state):
         options = tf.cast(options, tf.int32)
         with tf.device(self.device):
@@ -179,9 +180,7 @@ class PPOC(On_Policy):
     def calculate_statistics(self):
         init_value, self.cell_state = self._get_value(self.data.last_data('obs_'), self.data.last_data('options'), cell_state=self.cell_state)
         init_value = init_value.numpy()
-        self.data.cal_dc_r(self.gamma, init_value)
-        self.data.cal_td_error(self.gamma, init_value)
-        self.data.cal_gae_adv(self.lambda_, self.gamma)
+        self.data.cal_gae_and_dc_r(self.gamma, self.lambda_, init_value)
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -221,7 +220,7 @@ class PPOC(On_Policy):
             'summary_dict': summary_dict
         })
 
-    @tf.function
+    @relaxed_function
     def share(self, BATCH, cell_state, kl_coef):
         last_options = tf.cast(BATCH.last_options, tf.int32)  # [B,]
         options = tf.cast(BATCH.options, tf.int32)
@@ -10,15 +10,65 @@ from typing import (List,
                     NoReturn,
                     Dict)
 
+from tensorflow.keras import Model as M
+
 from rls.utils.build_networks import (ValueNetwork,
                                       DefaultRepresentationNetwork,
                                       MultiAgentCentralCriticRepresentationNetwork)
+from rls.nn.layers import stacked_mlp
+from rls.nn.networks import get_stacked_vector_network
 from rls.nn.noise import OrnsteinUhlenbeckNoisedAction
 from rls.algos.base.ma_off_policy import MultiAgentOffPolicy
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.specs import OutputNetworkType
 
 
+class GroupedActor(M):
+    '''
+    actors of a group of homogeneous agents, stacked along a leading agent axis.
+    input: vector observations of all agents, [N, B, x] for every vector input
+    output: [N, B, output_shape]
+    '''
+
+    def __init__(self, n, vector_dims, vector_net_type, output_shape, network_settings, out_activation=None):
+        super().__init__()
+        self.vector_nets = [get_stacked_vector_network(n, dim, vector_net_type) for dim in vector_dims]
+        self.net = stacked_mlp(n, network_settings, output_shape=output_shape, out_activation=out_activation)
+        self(*(tf.zeros([n, 1, dim], dtype=tf.keras.backend.floatx()) for dim in vector_dims))
+
+    def call(self, *vectors):
+        feat = tf.concat([net(v) for net, v in zip(self.vector_nets, vectors)], axis=-1)
+        return self.net(feat)
+
+
+class GroupedCritic(M):
+    '''
+    centralized critics of a group of homogeneous agents, stacked along a leading agent axis,
+    every critic has its own vector nets for observations of all agents, like MultiAgentCentralCriticRepresentationNetwork.
+    input: vector observations of all agents, [N, B, x] for every vector input, actions of all agents seen by every critic, [N, B, N*A]
+    output: [N, B, 1]
+    '''
+
+    def __init__(self, n, vector_dims, vector_net_type, action_dim, network_settings):
+        super().__init__()
+        self.n = n
+        self.vector_nets = [get_stacked_vector_network(n * n, dim, vector_net_type) for dim in vector_dims]
+        self.net = stacked_mlp(n, network_settings, output_shape=1, out_activation=None)
+        self([tf.zeros([n, 1, dim], dtype=tf.keras.backend.floatx()) for dim in vector_dims],
+             tf.zeros([n, 1, action_dim], dtype=tf.keras.backend.floatx()))
+
+    def call(self, vectors, a):
+        feats = []
+        for net, v in zip(self.vector_nets, vectors):
+            x = tf.tile(v[tf.newaxis], [self.n, 1, 1, 1])   # [N(critic), N(agent), B, x]
+            x = net(tf.reshape(x, [self.n * self.n, -1, x.shape[-1]]))
+            feats.append(tf.reshape(x, [self.n, self.n, -1, x.shape[-1]]))
+        feat = tf.transpose(tf.concat(feats, axis=-1), [0, 2, 1, 3])   # [N(critic), B, N(agent), x]
+        feat = tf.reshape(feat, [self.n, -1, self.n * feat.shape[-1]])
+        return self.net(tf.concat([feat, a], axis=-1))
+
+
 class MADDPG(MultiAgentOffPolicy):
     '''
     Multi-Agent Deep Deterministic Policy Gradient, https://arxiv.org/abs/1706.02275
@@ -36,13 +86,21 @@ class MADDPG(MultiAgentOffPolicy):
                      'actor_discrete': [32, 32],
                      'q': [32, 32]
                  },
+                 grouped=False,
                  **kwargs):
         '''
-        TODO: Annotation
+        grouped: stack networks of all agents along a leading agent axis when they share the same EnvGroupArgs
+            and only have vector observations, without rnn or encoder, otherwise every agent has networks of its own.
         '''
         super().__init__(envspecs=envspecs, **kwargs)
         self.ployak = ployak
         self.discrete_tau = discrete_tau
+        self.grouped = grouped and self._groupable()
+        if self.grouped:
+            self._build_grouped_nets(actor_lr, critic_lr, network_settings)
+            self._model_post_process()
+            self.initialize_data_buffer()
+            return
 
         def _create_actor_net(name, i):
             return ValueNetwork(
@@ -79,11 +137,13 @@ class MADDPG(MultiAgentOffPolicy):
         self.critic_nets = [_create_critic_net(name='critic_net', i=i) for i in range(self.n_agents_percopy)]
         self.critic_target_nets = [_create_critic_net(name='critic_target_net', i=i) for i in range(self.n_agents_percopy)]
 
-        for i in range(self.n_agents_percopy):
-            update_target_net_weights(
-                self.actor_target_nets[i].weights + self.critic_target_nets[i].weights,
-                self.actor_nets[i].weights + self.critic_nets[i].weights
-            )
+        # target networks of all agents are updated together
+        self._target_updater = TargetNetUpdater(
+            sum([self.actor_target_nets[i].weights + self.critic_target_nets[i].weights for i in range(self.n_agents_percopy)], []),
+            sum([self.actor_nets[i].weights + self.critic_nets[i].weights for i in range(self.n_agents_percopy)], []),
+            ployak=self.ployak
+        )
+        self._target_updater.copy()
 
         self.actor_lrs = [self.init_lr(actor_lr) for i in range(self.n_agents_percopy)]
         self.critic_lrs = [self.init_lr(critic_lr) for i in range(self.n_agents_percopy)]
@@ -103,12 +163,59 @@ class MADDPG(MultiAgentOffPolicy):
         self._model_post_process()
         self.initialize_data_buffer()
 
+    def _groupable(self) -> bool:
+        envspec = self.envspecs[0]
+        return all(e == envspec for e in self.envspecs) \
+            and envspec.obs_spec.has_vector_observation \
+            and not envspec.obs_spec.has_visual_observation \
+            and not self.memory_net_kwargs.get('use_rnn', False) \
+            and not self.encoder_net_kwargs.get('use_encoder', False)
+
+    def _build_grouped_nets(self, actor_lr, critic_lr, network_settings) -> NoReturn:
+        envspec = self.envspecs[0]
+        n, vector_dims, vector_net_type = self.n_agents_percopy, envspec.obs_spec.vector_dims, self.vector_net_kwargs['network_type']
+
+        def _create_actor_net():
+            return GroupedActor(n, vector_dims, vector_net_type,
+                                output_shape=envspec.a_dim,
+                                network_settings=network_settings['actor_continuous'] if envspec.is_continuous else network_settings['actor_discrete'],
+                                out_activation='tanh' if envspec.is_continuous else None)
+
+        def _create_critic_net():
+            return GroupedCritic(n, vector_dims, vector_net_type,
+                                 action_dim=n * envspec.a_dim,
+                                 network_settings=network_settings['q'])
+
+        self.actor_net = _create_actor_net()
+        self.actor_target_net = _create_actor_net()
+        self.critic_net = _create_critic_net()
+        self.critic_target_net = _create_critic_net()
+        self._target_updater = TargetNetUpdater(
+            self.actor_target_net.weights + self.critic_target_net.weights,
+            self.actor_net.weights + self.critic_net.weights,
+            ployak=self.ployak
+        )
+        self._target_updater.copy()
+
+        # Adam updates every element on its own, so one optimizer for the stacked networks works like one per agent.
+        self.actor_lr, self.critic_lr = self.init_lr(actor_lr), self.init_lr(critic_lr)
+        self.optimizer_actor, self.optimizer_critic = self.init_optimizer(self.actor_lr), self.init_optimizer(self.critic_lr)
+        self.noised_actions = [OrnsteinUhlenbeckNoisedAction(sigma=0.2)]   # noise of all agents at once, [N, B, A]
+
+        self._worker_params_dict.update(grouped_actor=self.actor_net)
+        self._all_params_dict.update(grouped_actor=self.actor_net,
+                                     grouped_critic=self.critic_net,
+                                     optimizer_actor=self.optimizer_actor,
+                                     optimizer_critic=self.optimizer_critic)
+
     def reset(self):
         super().reset()
         for noised_action in self.noised_actions:
             noised_action.reset()
 
     def choose_action(self, obs: List, evaluation=False):
+        if self.grouped:
+            return self._choose_grouped_actions(obs, evaluation)
         actions = []
         for i in range(self.n_agents_percopy):
             output = self._get_action(obs[i], self.actor_nets[i])
@@ -124,29 +231,51 @@ class MADDPG(MultiAgentOffPolicy):
             actions.append(acts)
         return actions
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, net):
         with tf.device(self.device):
             output, _ = net(obs)
             return output
 
+    def _choose_grouped_actions(self, obs: List, evaluation=False):
+        vectors = [np.stack(v) for v in zip(*[o.vector for o in obs])]    # [N, B, x] for every vector input
+        if self.envspecs[0].is_continuous:
+            mu = self._get_grouped_actions(vectors)
+            pi = self.noised_actions[0](mu)
+        else:
+            mu, pi = self._get_grouped_actions(vectors)
+        acts = mu.numpy() if evaluation else pi.numpy()
+        return list(acts)
+
+    @relaxed_function(batch_axis=1)
+    def _get_grouped_actions(self, vectors):
+        '''
+        actions of all agents in one call, [N, B, A] for continuous, or greedy and sampled actions, [N, B], for discrete.
+        '''
+        with tf.device(self.device):
+            output = self.actor_net(*vectors)
+            if self.envspecs[0].is_continuous:
+                return output
+            logits = tf.reshape(output, [-1, output.shape[-1]])
+            pi = tf.reshape(tf.random.categorical(logits, 1), tf.shape(output)[:-1])
+            return tf.argmax(output, axis=-1), pi
+
     def _target_params_update(self):
-        for i in range(self.n_agents_percopy):
-            update_target_net_weights(
-                self.actor_target_nets[i].weights + self.critic_target_nets[i].weights,
-                self.actor_nets[i].weights + self.critic_nets[i].weights
-            )
+        self._target_updater.update()
 
     def learn(self, **kwargs) -> NoReturn:
         self.train_step = kwargs.get('train_step')
         for i in range(self.train_times_per_step):
             self._learn()
 
-    @tf.function
-    def _train(self, BATCHs):
+    @relaxed_function
+    def _train(self, BATCHs, isw):
         '''
         TODO: Annotation
         '''
+        if self.grouped:
+            return self._train_grouped(BATCHs, isw)
+        td_errors = []
         summaries = []
         with tf.device(self.device):
             target_actions = []
@@ -154,7 +283,7 @@ class MADDPG(MultiAgentOffPolicy):
                 if self.envspecs[i].is_continuous:
                     target_actions.append(self.actor_target_nets[i](BATCHs[i].obs_)[0])
                 else:
-                    target_logits = self.actor_target_nets[i](self.actor_target_nets[i](BATCHs[i].obs_))[0]
+                    target_logits = self.actor_target_nets[i](BATCHs[i].obs_)[0]
                     target_cate_dist = tfp.distributions.Categorical(logits=target_logits)
                     target_pi = target_cate_dist.sample()
                     action_target = tf.one_hot(target_pi, self.envspecs[i].a_dim, dtype=tf.float32)
@@ -170,7 +299,7 @@ class MADDPG(MultiAgentOffPolicy):
                     if self.envspecs[i].is_continuous:
                         mu, _ = self.actor_nets[i](BATCHs[i].obs)
                     else:
-                        gumbel_noise = tf.cast(self.gumbel_dists[i].sample(BATCHs[i].action.shape), dtype=tf.float32)
+                        gumbel_noise = tf.cast(self.gumbel_dists[i].sample(tf.shape(BATCHs[i].action)), dtype=tf.float32)
                         logits, _ = self.actor_nets[i](BATCHs[i].obs)
                         logp_all = tf.nn.log_softmax(logits)
                         _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
@@ -191,7 +320,7 @@ class MADDPG(MultiAgentOffPolicy):
                     dc_r = tf.stop_gradient(BATCHs[i].reward + self.gamma * q_targets[i] * (1 - BATCHs[i].done))
 
                     td_error = dc_r - q
-                    q_loss = 0.5 * tf.reduce_mean(tf.square(td_error))
+                    q_loss = 0.5 * tf.reduce_mean(tf.square(td_error) * isw)
 
                 self.optimizer_critics[i].apply_gradients(
                     zip(tape.gradient(q_loss, self.critic_nets[i].trainable_variables),
@@ -201,9 +330,72 @@ class MADDPG(MultiAgentOffPolicy):
                     zip(tape.gradient(actor_loss, self.actor_nets[i].trainable_variables),
                         self.actor_nets[i].trainable_variables)
                 )
+                td_errors.append(td_error)
                 summaries.append(dict([
                     [f'LOSS/actor_loss_{i}', actor_loss],
                     [f'LOSS/critic_loss_{i}', q_loss]
                 ]))
 
-        return summaries
+        return td_errors, summaries
+
+    def _train_grouped(self, BATCHs, isw):
+        '''
+        one step of all actors and critics, traced into _train.
+        critic i only sees the action of its own actor in the actor loss, the other actions come from the batch,
+        so gradients of the summed losses are the gradients of every agent.
+        '''
+        n, envspec = self.n_agents_percopy, self.envspecs[0]
+        with tf.device(self.device):
+            obs = [tf.stack(v) for v in zip(*[BATCH.obs.vector for BATCH in BATCHs])]  # [N, B, x] for every vector input
+            obs_ = [tf.stack(v) for v in zip(*[BATCH.obs_.vector for BATCH in BATCHs])]
+            action = tf.stack([BATCH.action for BATCH in BATCHs])   # [N, B, A]
+            reward = tf.stack([BATCH.reward for BATCH in BATCHs])   # [N, B, 1]
+            done = tf.stack([BATCH.done for BATCH in BATCHs])
+
+            def joint(actions):
+                # [N(critic), N(agent), B, A] => [N(critic), B, N*A]
+                return tf.reshape(tf.transpose(actions, [0, 2, 1, 3]), [n, -1, n * envspec.a_dim])
+
+            target_output = self.actor_target_net(*obs_)
+            if envspec.is_continuous:
+                target_actions = target_output
+            else:
+                target_pi = tf.random.categorical(tf.reshape(target_output, [-1, envspec.a_dim]), 1)
+                target_actions = tf.reshape(tf.one_hot(target_pi, envspec.a_dim, dtype=tf.float32), tf.shape(target_output))
+            q_target = self.critic_target_net(obs_, joint(tf.tile(target_actions[tf.newaxis], [n, 1, 1, 1])))
+            dc_r = tf.stop_gradient(reward + self.gamma * q_target * (1 - done))
+
+            with tf.GradientTape(persistent=True) as tape:
+                if envspec.is_continuous:
+                    mu = self.actor_net(*obs)
+                else:
+                    gumbel_noise = -tf.math.log(-tf.math.log(tf.random.uniform(tf.shape(action), minval=1e-10, maxval=1.)))
+                    logits = self.actor_net(*obs)
+                    logp_all = tf.nn.log_softmax(logits)
+                    _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
+                    _pi_true_one_hot = tf.one_hot(tf.argmax(_pi, axis=-1), envspec.a_dim)
+                    _pi_diff = tf.stop_gradient(_pi_true_one_hot - _pi)
+                    mu = _pi_diff + _pi
+
+                own = tf.eye(n)[:, :, tf.newaxis, tf.newaxis]    # [N(critic), N(agent), 1, 1]
+                q_actor = self.critic_net(obs, joint(own * mu[tf.newaxis] + (1 - own) * action[tf.newaxis]))
+                actor_loss = -tf.reduce_mean(q_actor, axis=[1, 2])  # [N, ]
+
+                q = self.critic_net(obs, joint(tf.tile(action[tf.newaxis], [n, 1, 1, 1])))
+                td_error = dc_r - q
+                q_loss = 0.5 * tf.reduce_mean(tf.square(td_error) * isw, axis=[1, 2])
+                total_actor_loss, total_q_loss = tf.reduce_sum(actor_loss), tf.reduce_sum(q_loss)
+
+            self.optimizer_critic.apply_gradients(
+                zip(tape.gradient(total_q_loss, self.critic_net.trainable_variables),
+                    self.critic_net.trainable_variables)
+            )
+            self.optimizer_actor.apply_gradients(
+                zip(tape.gradient(total_actor_loss, self.actor_net.trainable_variables),
+                    self.actor_net.trainable_variables)
+            )
+            summaries = [dict([
+                [f'LOSS/actor_loss_{i}', actor_loss[i]],
+                [f'LOSS/critic_loss_{i}', q_loss[i]]
+            ]) for i in range(n)]
+        return tf.unstack(td_error), summaries
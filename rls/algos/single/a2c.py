@@ -9,7 +9,8 @@ from collections import namedtuple
 
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.build_networks import ACNetwork
 from rls.utils.specs import OutputNetworkType
@@ -73,7 +74,7 @@ class A2C(On_Policy):
         a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.net(obs, cell_state=cell_state)
@@ -86,7 +87,7 @@ class A2C(On_Policy):
                 sample_op = norm_dist.sample()
         return sample_op, cell_state
 
-    @tf.function
+    @relaxed_function
     def _get_value(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -120,7 +121,7 @@ class A2C(On_Policy):
             ])
         })
 
-    @tf.function
+    @relaxed_function
     def train(self, BATCH, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
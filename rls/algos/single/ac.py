@@ -9,7 +9,8 @@ from collections import namedtuple
 
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.build_networks import ACNetwork
 from rls.utils.specs import (OutputNetworkType,
@@ -20,6 +21,8 @@ AC_BatchExperiences = namedtuple('AC_BatchExperiences', BatchExperiences._fields
 
 class AC(Off_Policy):
     # off-policy actor-critic
+    _keeps_env_states = True    # log probs of the last actions are stored with the next experiences
+
     def __init__(self,
                  envspec,
 
@@ -77,7 +80,7 @@ class AC(Off_Policy):
         self._log_prob = _lp.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.net(obs, cell_state=cell_state)
@@ -111,7 +114,7 @@ class AC(Off_Policy):
                 'use_stack': True
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -8,13 +8,38 @@ from typing import (Union,
                     List,
                     NoReturn)
 
+from tensorflow.keras import Model as M
+
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.expl_expt import ExplorationExploitationClass
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (update_target_net_weights,
+                                 update_stacked_target_net_weights,
+                                 relaxed_function)
 from rls.utils.build_networks import ValueNetwork
+from rls.nn.layers import stacked_mlp
+from rls.nn.networks import get_stacked_vector_network
 from rls.utils.specs import OutputNetworkType
 
 
+class StackedQNet(M):
+    '''
+    k q networks with only vector observations, stacked along a leading axis,
+    weights of every member are in the same order as ValueNetwork of a vector-only representation net and CriticQvalueAll.
+    input: vector observations, [B, x] for every vector input
+    output: [K, B, A]
+    '''
+
+    def __init__(self, k, vector_dims, vector_net_type, output_shape, network_settings):
+        super().__init__()
+        self.vector_nets = [get_stacked_vector_network(k, dim, vector_net_type) for dim in vector_dims]
+        self.net = stacked_mlp(k, network_settings, output_shape=output_shape, out_activation=None)
+        self(*(tf.zeros([1, dim], dtype=tf.keras.backend.floatx()) for dim in vector_dims))
+
+    def call(self, *vectors):
+        feat = tf.concat([net(v) for net, v in zip(self.vector_nets, vectors)], axis=-1)
+        return self.net(feat)
+
+
 class AveragedDQN(Off_Policy):
     '''
     Averaged-DQN, http://arxiv.org/abs/1611.01929
@@ -30,6 +55,7 @@ class AveragedDQN(Off_Policy):
                  eps_final: float = 0.01,
                  init2mid_annealing_step: int = 1000,
                  assign_interval: int = 1000,
+                 stacked_targets: bool = False,
                  network_settings: List[int] = [32, 32],
                  **kwargs):
         assert not envspec.is_continuous, 'dqn only support discrete action space'
@@ -43,7 +69,8 @@ class AveragedDQN(Off_Policy):
         self.target_k = target_k
         assert self.target_k > 0, "assert self.target_k > 0"
         self.target_nets = []
-        self.current_target_idx = 0
+        # the target network to replace next, a variable so that the rotation runs in graph and is checkpointed
+        self.current_target_idx = tf.Variable(0, dtype=tf.int32, trainable=False, name='current_target_idx')
 
         def _create_net(name, representation_net=None): return ValueNetwork(
             name=name,
@@ -53,13 +80,23 @@ class AveragedDQN(Off_Policy):
         )
         self.q_net = _create_net('dqn_q_net', self._representation_net)
 
-        for i in range(self.target_k):
-            target_q_net = _create_net(
-                'dqn_q_target_net' + str(i),
-                self._create_representation_net('_representation_target_net' + str(i))
-            )
-            update_target_net_weights(target_q_net.weights, self.q_net.weights)
-            self.target_nets.append(target_q_net)
+        # all target networks in one StackedQNet, evaluated by one batched matmul per layer instead of target_k calls
+        self.stacked_targets = stacked_targets and self._stackable()
+        if self.stacked_targets:
+            self.target_net = StackedQNet(self.target_k, self.obs_spec.vector_dims, self.vector_net_kwargs['network_type'],
+                                          output_shape=self.a_dim, network_settings=network_settings)
+            assert [w.shape[1:] for w in self.target_net.weights] == [w.shape for w in self.q_net.weights], \
+                'weights of stacked target networks do not match the q network'
+            for i in range(self.target_k):
+                update_stacked_target_net_weights(self.target_net.weights, self.q_net.weights, i)
+        else:
+            for i in range(self.target_k):
+                target_q_net = _create_net(
+                    'dqn_q_target_net' + str(i),
+                    self._create_representation_net('_representation_target_net' + str(i))
+                )
+                update_target_net_weights(target_q_net.weights, self.q_net.weights)
+                self.target_nets.append(target_q_net)
 
         self.lr = self.init_lr(lr)
         self.optimizer = self.init_optimizer(self.lr)
@@ -67,31 +104,54 @@ class AveragedDQN(Off_Policy):
         self._worker_params_dict.update(self.q_net._policy_models)
 
         self._all_params_dict.update(self.q_net._all_models)
-        self._all_params_dict.update(optimizer=self.optimizer)
+        self._all_params_dict.update(optimizer=self.optimizer,
+                                     current_target_idx=self.current_target_idx)
         self._model_post_process()
         self.initialize_data_buffer()
 
+    def _stackable(self) -> bool:
+        return self.obs_spec.has_vector_observation \
+            and not self.obs_spec.has_visual_observation \
+            and not self.use_rnn \
+            and not self.encoder_net_kwargs.get('use_encoder', False)
+
+    def _target_q_values(self, obs, cell_state):
+        '''
+        q values of all target networks, [K, B, A]
+        '''
+        if self.stacked_targets:
+            return self.target_net(*obs.vector)
+        return tf.stack([target_net(obs, cell_state=cell_state)[0] for target_net in self.target_nets])
+
     def choose_action(self, obs, evaluation: bool = False) -> np.ndarray:
         if np.random.uniform() < self.expl_expt_mng.get_esp(self.train_step, evaluation=evaluation):
-            a = np.random.randint(0, self.a_dim, self.n_agents)
+            a = np.random.randint(0, self.a_dim, obs.batch_size)
         else:
             a, self.cell_state = self._get_action(obs, self.cell_state)
             a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
-            q_values, cell_state = self.q_net(obs, cell_state=cell_state)
-            for i in range(1, self.target_k):
-                target_q_values, _ = self.target_nets[i](obs, cell_state=cell_state)
-                q_values += target_q_values
-        return tf.argmax(q_values, axis=1), cell_state  # 不取平均也可以
+            q_values, _cell_state = self.q_net(obs, cell_state=cell_state)
+            q_values += tf.reduce_sum(self._target_q_values(obs, cell_state)[1:], axis=0)
+        return tf.argmax(q_values, axis=1), _cell_state  # 不取平均也可以
 
+    @tf.function
     def _target_params_update(self):
+        '''
+        replace the oldest target network every assign_interval steps, the schedule and the rotation are decided in graph.
+        '''
         if self.global_step % self.assign_interval == 0:
-            update_target_net_weights(self.target_nets[self.current_target_idx].weights, self.q_net.weights)
-            self.current_target_idx = (self.current_target_idx + 1) % self.target_k
+            if self.stacked_targets:
+                update_stacked_target_net_weights(self.target_net.weights, self.q_net.weights, self.current_target_idx)
+            else:
+                tf.switch_case(self.current_target_idx.read_value(), [
+                    lambda target_net=target_net: update_target_net_weights(target_net.weights, self.q_net.weights)
+                    for target_net in self.target_nets
+                ])
+            self.current_target_idx.assign((self.current_target_idx + 1) % self.target_k)
 
     def learn(self, **kwargs) -> NoReturn:
         self.train_step = kwargs.get('train_step')
@@ -100,16 +160,12 @@ class AveragedDQN(Off_Policy):
                 'summary_dict': dict([['LEARNING_RATE/lr', self.lr(self.train_step)]])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
                 q, _ = self.q_net(BATCH.obs, cell_state=cell_state)
-                q_next, _ = self.target_nets[0](BATCH.obs_, cell_state=cell_state)
-                for i in range(1, self.target_k):
-                    target_q_values, _ = self.target_nets[i](BATCH.obs, cell_state=cell_state)
-                    q_next += target_q_values
-                q_next /= self.target_k
+                q_next = tf.reduce_mean(self._target_q_values(BATCH.obs_, cell_state), axis=0)
                 q_eval = tf.reduce_sum(tf.multiply(q, BATCH.action), axis=1, keepdims=True)
                 q_target = tf.stop_gradient(BATCH.reward + self.gamma * (1 - BATCH.done) * tf.reduce_max(q_next, axis=1, keepdims=True))
                 td_error = q_target - q_eval
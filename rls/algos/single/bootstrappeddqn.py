@@ -7,7 +7,8 @@ import tensorflow_probability as tfp
 
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.expl_expt import ExplorationExploitationClass
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -51,7 +52,9 @@ class BootstrappedDQN(Off_Policy):
         self.q_net = _create_net('q_net', self._representation_net)
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.q_target_net = _create_net('q_target_net', self._representation_target_net)
-        update_target_net_weights(self.q_target_net.weights, self.q_net.weights)
+        self._target_updater = TargetNetUpdater(self.q_target_net.weights, self.q_net.weights,
+                                                interval=self.assign_interval, step=self.global_step)
+        self._target_updater.copy()
         self.lr = self.init_lr(lr)
         self.optimizer = self.init_optimizer(self.lr)
 
@@ -68,22 +71,21 @@ class BootstrappedDQN(Off_Policy):
 
     def choose_action(self, obs, evaluation=False):
         if np.random.uniform() < self.expl_expt_mng.get_esp(self.train_step, evaluation=evaluation):
-            a = np.random.randint(0, self.a_dim, self.n_agents)
+            a = np.random.randint(0, self.a_dim, obs.batch_size)
         else:
             q, self.cell_state = self._get_action(obs, self.cell_state)
             q = q.numpy()
             a = np.argmax(q[self.now_head], axis=1)  # [H, B, A] => [B, A] => [B, ]
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             q_values, cell_state = self.q_net(obs, cell_state=cell_state)  # [H, B, A]
         return q_values, cell_state
 
     def _target_params_update(self):
-        if self.global_step % self.assign_interval == 0:
-            update_target_net_weights(self.q_target_net.weights, self.q_net.weights)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -92,7 +94,7 @@ class BootstrappedDQN(Off_Policy):
                 'summary_dict': dict([['LEARNING_RATE/lr', self.lr(self.train_step)]])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         batch_size = tf.shape(BATCH.action)[0]
         with tf.device(self.device):
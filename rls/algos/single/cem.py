@@ -4,47 +4,16 @@
 import numpy as np
 import tensorflow as tf
 
-from tensorflow.keras import Model as M
-
-from rls.nn.layers import mlp
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.specs import BatchExperiences
-
-
-class Model(M):
-
-    def __init__(self, vector_dim, output_shape, network_settings, is_continuous):
-        super().__init__()
-        self.is_continuous = is_continuous
-        out_activation = 'tanh' if self.is_continuous else None
-        self.net = mlp(network_settings, act_fn='tanh', output_shape=output_shape, out_activation=out_activation, out_layer=True)
-        self.weights_2dim = [[i, j] for i, j in zip([vector_dim] + network_settings, network_settings + [output_shape])]
-        self.weights_nums = np.asarray(self.weights_2dim).prod(axis=-1).tolist()
-        self.weights_total_nums = np.asarray(self.weights_2dim).prod(axis=-1).sum() + np.asarray(network_settings).sum() + output_shape
-        self(tf.keras.Input(shape=vector_dim))  # 初始化网络权重
-
-    @tf.function
-    def call(self, s):
-        if self.is_continuous:
-            return self.net(s)
-        else:
-            return tf.argmax(self.net(s), axis=-1)
-
-    def set_wb(self, weights):
-        start = 0
-        wbs = []
-        for dim_list, nums in zip(self.weights_2dim, self.weights_nums):
-            w = weights[start:start + nums].reshape(dim_list)
-            b = weights[start + nums:start + nums + dim_list[-1]]
-            wbs.append(w)
-            wbs.append(b)
-            start += nums + dim_list[-1]
-        self.set_weights(wbs)
+from rls.utils.tf2_utils import relaxed_function
 
 
 class CEM(On_Policy):
     '''
     Cross-Entropy Method
+    weights of all members of the population are stacked, [populations, in, out] for every layer,
+    so the whole population acts in one batched matmul per layer.
     '''
 
     def __init__(self,
@@ -67,30 +36,48 @@ class CEM(On_Policy):
         self.envs_per_popu = envs_per_popu
         self.extra_var_last_multiplier = extra_var_last_multiplier
         self.concat_vector_dim = self.obs_spec.total_vector_dim
+        # 每层的[输入维度, 输出维度]，一个成员的参数按层依次展开为 w, b
+        self.weights_2dim = [[i, j] for i, j in zip([self.concat_vector_dim] + network_settings, network_settings + [self.a_dim])]
+        self.weights_total_nums = sum(i * j + j for i, j in self.weights_2dim)
 
         self._model_post_process()
 
     def choose_action(self, obs, evaluation=False):
         self._check_agents()
-        a = [model(s_).numpy() for model, s_ in zip(self.cem_models, np.split(obs.flatten_vector(), self.populations, axis=0))]
+        s = obs.flatten_vector().reshape(self.populations, self.envs_per_popu, -1)   # 每个成员负责连续的envs_per_popu个环境
+        a = self._get_action(s).numpy()
         if self.is_continuous:
-            a = np.vstack(a)
+            return a.reshape(self.n_agents, -1)
         else:
-            a = np.hstack(a)
-        return a
+            return a.reshape(self.n_agents)
+
+    @relaxed_function
+    def _get_action(self, s):
+        '''
+        s: [populations, envs_per_popu, N] => actions of all members, [populations, envs_per_popu(, A)]
+        '''
+        with tf.device(self.device):
+            x = tf.cast(s, self._tf_data_type)
+            for i, (w, b) in enumerate(zip(self._ws, self._bs)):
+                x = tf.einsum('pen,pnm->pem', x, w) + b[:, tf.newaxis]
+                if i < len(self._ws) - 1:
+                    x = tf.tanh(x)
+            if self.is_continuous:
+                return tf.tanh(x)
+            else:
+                return tf.argmax(x, axis=-1)
 
     def store_data(self, exps: BatchExperiences):
-        self.returns += exps.reward * (1 - self.dones)
-        self.dones += exps.done
-        pass
+        self.returns += exps.reward * ~self.dones
+        self.dones |= exps.done.astype(bool)
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
-        rets = self.returns.reshape(-1, self.envs_per_popu).mean(axis=-1)
-        elites_idxs = rets.argsort()[-self.n_elite:]
-        elites_weights = np.array(self.models_weights)[elites_idxs, :]
-        self.mu = np.mean(elites_weights, axis=0)
-        self.sigma = np.var(elites_weights, axis=0)
+        rets = self.returns.reshape(self.populations, self.envs_per_popu).mean(axis=-1)
+        elites_idxs = np.argpartition(rets, -self.n_elite)[-self.n_elite:]
+        elites_weights = self.models_weights[elites_idxs]
+        self.mu = elites_weights.mean(axis=0)
+        self.sigma = elites_weights.var(axis=0)
         self._update_models_weights()
         self._reset_variables()
         self.write_training_summaries(self.train_step, dict([
@@ -99,10 +86,9 @@ class CEM(On_Policy):
             ['Statistics/sample_std', self.sample_std.mean()]
         ]))
 
-    def _check_agents(self, s):
+    def _check_agents(self):
         '''
         用于为实例赋予种群数量属性，并且初始化变量
-        params : 状态列表S，一个环境下有多少个智能体就包含多少个状态向量
         '''
         if not hasattr(self, 'populations'):
             assert self.n_agents % self.envs_per_popu == 0, '环境数必须可以整除envs_per_popu系数'
@@ -111,12 +97,13 @@ class CEM(On_Policy):
 
     def _build(self):
         '''
-        构建实体模型，初始化变量
+        构建种群的堆叠参数，初始化变量
         '''
         self.n_elite = max(int(np.round(self.populations * self.frac)), 1)
-        self.cem_models = [Model(self.concat_vector_dim, self.a_dim, self.network_settings, self.is_continuous) for i in range(self.populations)]
-        self.mu = np.random.randn(self.cem_models[0].weights_total_nums)
-        self.sigma = np.ones(self.cem_models[0].weights_total_nums) * self.init_var
+        self._ws = [tf.Variable(tf.zeros([self.populations, i, j], dtype=self._tf_data_type), trainable=False) for i, j in self.weights_2dim]
+        self._bs = [tf.Variable(tf.zeros([self.populations, j], dtype=self._tf_data_type), trainable=False) for _, j in self.weights_2dim]
+        self.mu = np.random.randn(self.weights_total_nums)
+        self.sigma = np.ones(self.weights_total_nums) * self.init_var
         self._update_models_weights()
         self._reset_variables()
 
@@ -129,9 +116,13 @@ class CEM(On_Policy):
 
     def _update_models_weights(self):
         '''
-        重新给模型赋参数
+        重新采样整个种群的参数, [populations, weights_total_nums], 并写入堆叠的参数
         '''
         extra_var_multiplier = max((1.0 - self.train_step / self.extra_decay_eps), self.extra_var_last_multiplier)
         self.sample_std = np.sqrt(self.sigma + np.square(self.extra_std) * extra_var_multiplier)
-        self.models_weights = [self.mu + self.sample_std * np.random.randn(self.mu.shape[0]) for i in range(self.populations)]
-        [m.set_wb(wb) for m, wb in zip(self.cem_models, self.models_weights)]
+        self.models_weights = self.mu + self.sample_std * np.random.randn(self.populations, self.weights_total_nums)
+        start = 0
+        for (i, j), w, b in zip(self.weights_2dim, self._ws, self._bs):
+            w.assign(self.models_weights[:, start:start + i * j].reshape(-1, i, j).astype(w.dtype.as_numpy_dtype))
+            b.assign(self.models_weights[:, start + i * j:start + i * j + j].astype(b.dtype.as_numpy_dtype))
+            start += i * j + j
@@ -15,7 +15,8 @@ from tensorflow.keras.layers import (Dense,
 
 from rls.utils.tf2_utils import (squash_rsample,
                                  gaussian_entropy,
-                                 update_target_net_weights)
+                                 TargetNetUpdater,
+                                 relaxed_function)
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.sundry_utils import LinearAnnealing
 from rls.nn.networks import get_visual_network_from_type
@@ -89,6 +90,7 @@ class CURL(Off_Policy):
                  last_alpha=0.01,
                  ployak=0.995,
                  discrete_tau=1.0,
+                 stacked_critics=False,
                  network_settings={
                      'actor_continuous': {
                          'share': [128, 128],
@@ -130,7 +132,8 @@ class CURL(Off_Policy):
             value_net_type=OutputNetworkType.CRITIC_QVALUE_ONE,
             value_net_kwargs=dict(vector_dim=self.concat_vector_dim + self.vis_feat_size,
                                   action_dim=self.a_dim,
-                                  network_settings=network_settings['q'])
+                                  network_settings=network_settings['q']),
+            stacked=stacked_critics
         )
 
         self.critic_net = _create_net('critic_net')
@@ -164,10 +167,12 @@ class CURL(Off_Policy):
 
         self.critic_tv = self.critic_net.trainable_variables + self.encoder.trainable_variables
 
-        update_target_net_weights(
+        self._target_updater = TargetNetUpdater(
             self.critic_target_net.weights + self.encoder_target.trainable_variables,
-            self.critic_net.weights + self.encoder.trainable_variables
+            self.critic_net.weights + self.encoder.trainable_variables,
+            ployak=self.ployak
         )
+        self._target_updater.copy()
         self.actor_lr, self.critic_lr, self.alpha_lr, self.curl_lr = map(self.init_lr, [actor_lr, critic_lr, alpha_lr, curl_lr])
         self.optimizer_actor, self.optimizer_critic, self.optimizer_alpha, self.optimizer_curl = map(self.init_optimizer, [self.actor_lr, self.critic_lr, self.alpha_lr, self.curl_lr])
 
@@ -191,7 +196,7 @@ class CURL(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, visual):
         with tf.device(self.device):
             feat = tf.concat([self.encoder(visual), obs.flatten_vector()], axis=-1)
@@ -215,9 +220,7 @@ class CURL(Off_Policy):
         return self.data_convert([visual, visual_, pos])
 
     def _target_params_update(self):
-        update_target_net_weights(self.critic_target_net.weights + self.encoder_target.trainable_variables,
-                                  self.critic_net.weights + self.encoder.trainable_variables,
-                                  self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -242,7 +245,7 @@ class CURL(Off_Policy):
             self.log_alpha.assign(tf.math.log(tf.cast(self.alpha_annealing(self.global_step.numpy()), tf.float32)))
         return td_error, summaries
 
-    @tf.function
+    @relaxed_function
     def train(self, BATCH, isw, cell_state, visual, visual_, pos):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -261,8 +264,8 @@ class CURL(Off_Policy):
                     target_pi = target_cate_dist.sample()
                     target_log_pi = target_cate_dist.log_prob(target_pi)
                     target_pi = tf.one_hot(target_pi, self.a_dim, dtype=tf.float32)
-                q1, q2 = self.critic_net.value_net(feat, BATCH.action)
-                q1_target, q2_target = self.critic_target_net.value_net(feat_, target_pi)
+                q1, q2 = self.critic_net.get_value(feat, BATCH.action)
+                q1_target, q2_target = self.critic_target_net.get_value(feat_, target_pi)
                 q_target = tf.minimum(q1_target, q2_target)
                 dc_r = tf.stop_gradient(BATCH.reward + self.gamma * (1 - BATCH.done) * (q_target - self.alpha * target_log_pi))
                 td_error1 = q1 - dc_r
@@ -293,7 +296,7 @@ class CURL(Off_Policy):
                 else:
                     logits = self.actor_net.value_net(feat)
                     logp_all = tf.nn.log_softmax(logits)
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
                     _pi_true_one_hot = tf.one_hot(tf.argmax(_pi, axis=-1), self.a_dim)
                     _pi_diff = tf.stop_gradient(_pi_true_one_hot - _pi)
@@ -6,7 +6,8 @@ import tensorflow as tf
 
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.expl_expt import ExplorationExploitationClass
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -50,7 +51,9 @@ class DDDQN(Off_Policy):
         self.dueling_net = _create_net('dueling_net', self._representation_net)
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.dueling_target_net = _create_net('dueling_target_net', self._representation_target_net)
-        update_target_net_weights(self.dueling_target_net.weights, self.dueling_net.weights)
+        self._target_updater = TargetNetUpdater(self.dueling_target_net.weights, self.dueling_net.weights,
+                                                interval=self.assign_interval, step=self.global_step)
+        self._target_updater.copy()
         self.lr = self.init_lr(lr)
         self.optimizer = self.init_optimizer(self.lr)
 
@@ -63,21 +66,20 @@ class DDDQN(Off_Policy):
 
     def choose_action(self, obs, evaluation=False):
         if np.random.uniform() < self.expl_expt_mng.get_esp(self.train_step, evaluation=evaluation):
-            a = np.random.randint(0, self.a_dim, self.n_agents)
+            a = np.random.randint(0, self.a_dim, obs.batch_size)
         else:
             a, self.cell_state = self._get_action(obs, self.cell_state)
             a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             q_values, cell_state = self.dueling_net(obs, cell_state=cell_state)
         return tf.argmax(q_values, axis=-1), cell_state
 
     def _target_params_update(self):
-        if self.global_step % self.assign_interval == 0:
-            update_target_net_weights(self.dueling_target_net.weights, self.dueling_net.weights)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -87,7 +89,7 @@ class DDDQN(Off_Policy):
                 'use_stack': True
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
@@ -8,7 +8,8 @@ import tensorflow_probability as tfp
 from rls.nn.noise import (OrnsteinUhlenbeckNoisedAction,
                           ClippedNormalNoisedAction)
 from rls.algos.base.off_policy import Off_Policy
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ACNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -76,7 +77,8 @@ class DDPG(Off_Policy):
         self.ac_net = _create_net('ac_net', self._representation_net)
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.ac_target_net = _create_net('ac_target_net', self._representation_target_net)
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights)
+        self._target_updater = TargetNetUpdater(self.ac_target_net.weights, self.ac_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.actor_lr, self.critic_lr = map(self.init_lr, [actor_lr, critic_lr])
         self.optimizer_actor, self.optimizer_critic = map(self.init_optimizer, [self.actor_lr, self.critic_lr])
 
@@ -98,7 +100,7 @@ class DDPG(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.ac_net(obs, cell_state=cell_state)
@@ -113,7 +115,7 @@ class DDPG(Off_Policy):
             return mu, pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -125,7 +127,7 @@ class DDPG(Off_Policy):
                 ])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -144,7 +146,7 @@ class DDPG(Off_Policy):
                     target_log_pi = target_cate_dist.log_prob(target_pi)
                     action_target = tf.one_hot(target_pi, self.a_dim, dtype=tf.float32)
 
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     logits = self.ac_net.policy_net(feat)
                     logp_all = tf.nn.log_softmax(logits)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
@@ -9,6 +9,7 @@ from typing import (Union,
                     NoReturn)
 
 from rls.algos.single.dqn import DQN
+from rls.utils.tf2_utils import relaxed_function
 
 
 class DDQN(DQN):
@@ -48,7 +49,7 @@ class DDQN(DQN):
                 'use_stack': True
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
@@ -13,6 +13,7 @@ from rls.nn.noise import (OrnsteinUhlenbeckNoisedAction,
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.build_networks import ACNetwork
 from rls.utils.specs import OutputNetworkType
+from rls.utils.tf2_utils import relaxed_function
 
 
 class DPG(Off_Policy):
@@ -89,7 +90,7 @@ class DPG(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.net(obs, cell_state=cell_state)
@@ -114,7 +115,7 @@ class DPG(Off_Policy):
                 'use_stack': True
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -7,7 +7,8 @@ import tensorflow_probability as tfp
 
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.expl_expt import ExplorationExploitationClass
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import DoubleValueNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -56,7 +57,8 @@ class MAXSQN(Off_Policy):
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.critic_target_net = _create_net('critic_target_net', self._representation_target_net)
 
-        update_target_net_weights(self.critic_target_net.weights, self.critic_net.weights)
+        self._target_updater = TargetNetUpdater(self.critic_target_net.weights, self.critic_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.q_lr, self.alpha_lr = map(self.init_lr, [q_lr, alpha_lr])
         self.optimizer_critic, self.optimizer_alpha = map(self.init_optimizer, [self.q_lr, self.alpha_lr])
 
@@ -74,13 +76,13 @@ class MAXSQN(Off_Policy):
 
     def choose_action(self, obs, evaluation=False):
         if self.use_epsilon and np.random.uniform() < self.expl_expt_mng.get_esp(self.train_step, evaluation=evaluation):
-            a = np.random.randint(0, self.a_dim, self.n_agents)
+            a = np.random.randint(0, self.a_dim, obs.batch_size)
         else:
             mu, pi, self.cell_state = self._get_action(obs, self.cell_state)
             a = pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             q, _, cell_state = self.critic_net(obs, cell_state=cell_state)
@@ -89,7 +91,7 @@ class MAXSQN(Off_Policy):
         return tf.argmax(q, axis=1), pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.critic_target_net.weights, self.critic_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -101,7 +103,7 @@ class MAXSQN(Off_Policy):
                 ])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -10,7 +10,8 @@ from collections import namedtuple
 from rls.nn.noise import (OrnsteinUhlenbeckNoisedAction,
                           ClippedNormalNoisedAction)
 from rls.algos.base.off_policy import Off_Policy
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ACCNetwork
 from rls.utils.specs import (OutputNetworkType,
                              BatchExperiences)
@@ -90,7 +91,8 @@ class PD_DDPG(Off_Policy):
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.ac_target_net = _create_net('ac_target_net', self._representation_target_net)
 
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights)
+        self._target_updater = TargetNetUpdater(self.ac_target_net.weights, self.ac_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.lambda_lr = lambda_lr
         self.actor_lr, self.reward_critic_lr, self.cost_critic_lr = map(self.init_lr, [actor_lr, reward_critic_lr, cost_critic_lr])
         self.optimizer_actor, self.optimizer_reward_critic, self.optimizer_cost_critic = map(self.init_optimizer, [self.actor_lr, self.reward_critic_lr, self.cost_critic_lr])
@@ -114,7 +116,7 @@ class PD_DDPG(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.ac_net(obs, cell_state=cell_state)
@@ -129,7 +131,7 @@ class PD_DDPG(Off_Policy):
             return mu, pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -142,7 +144,7 @@ class PD_DDPG(Off_Policy):
                 ])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -9,7 +9,8 @@ from collections import namedtuple
 
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import OutputNetworkType
@@ -62,7 +63,7 @@ class PG(On_Policy):
         a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.net(obs, cell_state=cell_state)
@@ -96,7 +97,7 @@ class PG(On_Policy):
             'summary_dict': dict([['LEARNING_RATE/lr', self.lr(self.train_step)]])
         })
 
-    @tf.function
+    @relaxed_function
     def train(self, BATCH, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
@@ -14,7 +14,8 @@ from collections import namedtuple
 from rls.utils.tf2_utils import (show_graph,
                                  gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.build_networks import (ValueNetwork,
                                       ACNetwork)
@@ -60,6 +61,7 @@ class PPO(On_Policy):
                  use_kl_loss: bool = False,
                  use_extra_loss: bool = False,
                  use_early_stop: bool = False,
+                 graph_epochs: bool = False,
                  network_settings: Dict = {
                      'share': {
                          'continuous': {
@@ -91,7 +93,7 @@ class PPO(On_Policy):
         self.kl_reverse = kl_reverse
         self.kl_target = kl_target
         self.kl_alpha = kl_alpha
-        self.kl_coef = tf.constant(kl_coef, dtype=tf.float32)
+        self.kl_coef = tf.Variable(kl_coef, dtype=tf.float32, trainable=False)
         self.extra_coef = extra_coef
         self.vf_coef = vf_coef
         self.max_grad_norm = max_grad_norm
@@ -109,6 +111,9 @@ class PPO(On_Policy):
         self.use_kl_loss = use_kl_loss
         self.use_extra_loss = use_extra_loss
         self.use_early_stop = use_early_stop
+        # rnn needs sequences of the rollout, it keeps training minibatch by minibatch in python
+        self.graph_epochs = graph_epochs and not self.use_rnn
+        self._graph_epochs_ready = False    # optimizers create their slots in the first normal update
 
         if self.share_net:
             if self.is_continuous:
@@ -179,7 +184,7 @@ class PPO(On_Policy):
         self._log_prob = log_prob.numpy() + 1e-10
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -209,7 +214,7 @@ class PPO(On_Policy):
             self.data.add_cell_state(tuple(cs.numpy() for cs in self.cell_state))
         self.cell_state = self.next_cell_state
 
-    @tf.function
+    @relaxed_function
     def _get_value(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -229,9 +234,7 @@ class PPO(On_Policy):
     def calculate_statistics(self) -> NoReturn:
         init_value, self.cell_state = self._get_value(self.data.last_data('obs_'), cell_state=self.cell_state)
         init_value = init_value.numpy()
-        self.data.cal_dc_r(self.gamma, init_value)
-        self.data.cal_td_error(self.gamma, init_value)
-        self.data.cal_gae_adv(self.lambda_, self.gamma, normalize=True)
+        self.data.cal_gae_and_dc_r(self.gamma, self.lambda_, init_value, normalize=True)
 
     # @show_graph(name='ppo_net')
     def learn(self, **kwargs) -> NoReturn:
@@ -268,14 +271,9 @@ class PPO(On_Policy):
                 ]))
 
             if self.use_kl_loss:
-                # ref: https://github.com/joschu/modular_rl/blob/6970cde3da265cf2a98537250fea5e0c0d9a7639/modular_rl/ppo.py#L93
-                if kl > self.kl_high:
-                    self.kl_coef *= self.kl_alpha
-                elif kl < self.kl_low:
-                    self.kl_coef /= self.kl_alpha
-
+                self._update_kl_coef(kl)
                 summaries.update(dict([
-                    ['Statistics/kl_coef', self.kl_coef]
+                    ['Statistics/kl_coef', self.kl_coef.read_value()]
                 ]))
             return summaries
 
@@ -290,12 +288,80 @@ class PPO(On_Policy):
         self._learn(function_dict={
             'calculate_statistics': self.calculate_statistics,
             'train_function': _train,
+            'train_epochs_function': self.train_epochs if self._graph_epochs_ready else None,
             'summary_dict': summary_dict,
             'train_data_type': PPO_Train_BatchExperiences
         })
+        self._graph_epochs_ready = self.graph_epochs
+
+    def _update_kl_coef(self, kl):
+        # ref: https://github.com/joschu/modular_rl/blob/6970cde3da265cf2a98537250fea5e0c0d9a7639/modular_rl/ppo.py#L93
+        if kl > self.kl_high:
+            self.kl_coef.assign(self.kl_coef * self.kl_alpha)
+        elif kl < self.kl_low:
+            self.kl_coef.assign(self.kl_coef / self.kl_alpha)
+
+    @relaxed_function
+    def train_epochs(self, BATCH):
+        '''
+        the same update as _train of learn for all minibatches, in one graph: BATCH is the whole rollout [T*B, ...],
+        it is shuffled and cut into minibatches of batch_size * n_agents here, every minibatch runs policy_epoch(and value_epoch)
+        steps with early stopping, then updates kl_coef. Steps are traced inline instead of calling the tf.functions of them.
+        return: summaries averaged over minibatches, of the last step of every minibatch like _train.
+        '''
+        with tf.device(self.device):
+            n = tf.shape(BATCH.action)[0]
+            mb_size = self.batch_size * self.n_agents
+            idxs = tf.random.shuffle(tf.range(n))
+            cell_state = (None,)
+            sum_actor_loss, sum_critic_loss, sum_kl, sum_entropy, sum_early_step = 0., 0., 0., 0., 0.
+            mb_nums = 0.
+            for start in tf.range(0, n, mb_size):
+                _idxs = idxs[start:start + mb_size]
+                data = tf.nest.map_structure(lambda x: tf.gather(x, _idxs), BATCH)
+                actor_loss, critic_loss, entropy, kl = 0., 0., 0., 0.
+                early_step = 0
+                for i in tf.range(self.policy_epoch):
+                    if self.share_net:
+                        actor_loss, critic_loss, entropy, kl = self._train_share(data, cell_state, self.kl_coef)
+                    else:
+                        actor_loss, entropy, kl = self._train_actor(data, cell_state, self.kl_coef)
+                    if self.use_early_stop and kl > self.kl_stop:
+                        early_step = i
+                        break
+                if not self.share_net:
+                    for _ in tf.range(self.value_epoch):
+                        critic_loss = self._train_critic(data, cell_state)
+                if self.use_kl_loss:
+                    self._update_kl_coef(kl)
+                sum_actor_loss += actor_loss
+                sum_critic_loss += critic_loss
+                sum_kl += kl
+                sum_entropy += entropy
+                sum_early_step += tf.cast(early_step, tf.float32)
+                mb_nums += 1.
 
-    @tf.function
+            summaries = dict([
+                ['LOSS/actor_loss', sum_actor_loss / mb_nums],
+                ['LOSS/critic_loss', sum_critic_loss / mb_nums],
+                ['Statistics/kl', sum_kl / mb_nums],
+                ['Statistics/entropy', sum_entropy / mb_nums]
+            ])
+            if self.use_early_stop:
+                summaries.update(dict([
+                    ['Statistics/early_step', sum_early_step / mb_nums]
+                ]))
+            if self.use_kl_loss:
+                summaries.update(dict([
+                    ['Statistics/kl_coef', self.kl_coef.read_value()]
+                ]))
+            return summaries
+
+    @relaxed_function
     def train_share(self, BATCH, cell_state, kl_coef):
+        return self._train_share(BATCH, cell_state, kl_coef)
+
+    def _train_share(self, BATCH, cell_state, kl_coef):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
                 output, cell_state = self.net(BATCH.obs, cell_state=cell_state)
@@ -355,8 +421,11 @@ class PPO(On_Policy):
             self.global_step.assign_add(1)
             return actor_loss, value_loss, entropy, kl
 
-    @tf.function
+    @relaxed_function
     def train_actor(self, BATCH, cell_state, kl_coef):
+        return self._train_actor(BATCH, cell_state, kl_coef)
+
+    def _train_actor(self, BATCH, cell_state, kl_coef):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
                 output, _ = self.net(BATCH.obs, cell_state=cell_state)
@@ -398,8 +467,11 @@ class PPO(On_Policy):
             self.global_step.assign_add(1)
             return actor_loss, entropy, kl
 
-    @tf.function
+    @relaxed_function
     def train_critic(self, BATCH, cell_state):
+        return self._train_critic(BATCH, cell_state)
+
+    def _train_critic(self, BATCH, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
                 feat, _ = self._representation_net(BATCH.obs, cell_state=cell_state)
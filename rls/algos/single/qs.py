@@ -14,6 +14,7 @@ class QS:
     '''
     Q-learning/Sarsa/Expected Sarsa.
     '''
+    keeps_env_states = True    # next actions of every env for sarsa
 
     def __init__(self,
                  envspec,
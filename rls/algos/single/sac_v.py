@@ -8,7 +8,8 @@ import tensorflow_probability as tfp
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.tf2_utils import (squash_rsample,
                                  gaussian_entropy,
-                                 update_target_net_weights)
+                                 TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.sundry_utils import LinearAnnealing
 from rls.utils.build_networks import (ValueNetwork,
                                       DoubleValueNetwork)
@@ -110,7 +111,8 @@ class SAC_V(Off_Policy):
                                       network_settings=network_settings['q'])
             )
 
-        update_target_net_weights(self.v_target_net.weights, self.v_net.weights)
+        self._target_updater = TargetNetUpdater(self.v_target_net.weights, self.v_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.actor_lr, self.critic_lr, self.alpha_lr = map(self.init_lr, [actor_lr, critic_lr, alpha_lr])
         self.optimizer_actor, self.optimizer_critic, self.optimizer_alpha = map(self.init_optimizer, [self.actor_lr, self.critic_lr, self.alpha_lr])
 
@@ -136,7 +138,7 @@ class SAC_V(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -152,7 +154,7 @@ class SAC_V(Off_Policy):
             return mu, pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.v_target_net.weights, self.v_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -175,7 +177,7 @@ class SAC_V(Off_Policy):
             self.log_alpha.assign(tf.math.log(tf.cast(self.alpha_annealing(self.global_step.numpy()), tf.float32)))
         return td_error, summaries
 
-    @tf.function
+    @relaxed_function
     def train_continuous(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -190,7 +192,7 @@ class SAC_V(Off_Policy):
                 else:
                     logits = self.actor_net.value_net(feat)
                     logp_all = tf.nn.log_softmax(logits)
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
                     _pi_true_one_hot = tf.one_hot(tf.argmax(_pi, axis=-1), self.a_dim)
                     _pi_diff = tf.stop_gradient(_pi_true_one_hot - _pi)
@@ -245,7 +247,7 @@ class SAC_V(Off_Policy):
                 })
             return (td_error1 + td_error2) / 2, summaries
 
-    @tf.function
+    @relaxed_function
     def train_discrete(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -6,7 +6,8 @@ import tensorflow as tf
 import tensorflow_probability as tfp
 
 from rls.algos.base.off_policy import Off_Policy
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ValueNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -44,7 +45,8 @@ class SQL(Off_Policy):
         self.lr = self.init_lr(lr)
         self.optimizer = self.init_optimizer(self.lr)
 
-        update_target_net_weights(self.q_target_net.weights, self.q_net.weights)
+        self._target_updater = TargetNetUpdater(self.q_target_net.weights, self.q_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
 
         self._worker_params_dict.update(self.q_net._policy_models)
 
@@ -58,7 +60,7 @@ class SQL(Off_Policy):
         a = a.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             q_values, cell_state = self.q_net(obs, cell_state=cell_state)
@@ -75,7 +77,7 @@ class SQL(Off_Policy):
         return v
 
     def _target_params_update(self):
-        update_target_net_weights(self.q_target_net.weights, self.q_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -84,7 +86,7 @@ class SQL(Off_Policy):
                 'summary_dict': dict([['LEARNING_RATE/lr', self.lr(self.train_step)]])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
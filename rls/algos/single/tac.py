@@ -8,7 +8,8 @@ import tensorflow_probability as tfp
 from rls.algos.base.off_policy import Off_Policy
 from rls.utils.tf2_utils import (tsallis_squash_rsample,
                                  gaussian_entropy,
-                                 update_target_net_weights)
+                                 TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.sundry_utils import LinearAnnealing
 from rls.utils.build_networks import (ValueNetwork,
                                       DoubleValueNetwork)
@@ -90,7 +91,8 @@ class TAC(Off_Policy):
         # entropy = -log(1/|A|) = log |A|
         self.target_entropy = 0.98 * (-self.a_dim if self.is_continuous else np.log(self.a_dim))
 
-        update_target_net_weights(self.critic_target_net.weights, self.critic_net.weights)
+        self._target_updater = TargetNetUpdater(self.critic_target_net.weights, self.critic_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.actor_lr, self.critic_lr, self.alpha_lr = map(self.init_lr, [actor_lr, critic_lr, alpha_lr])
         self.optimizer_actor, self.optimizer_critic, self.optimizer_alpha = map(self.init_optimizer, [self.actor_lr, self.critic_lr, self.alpha_lr])
 
@@ -115,7 +117,7 @@ class TAC(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -131,7 +133,7 @@ class TAC(Off_Policy):
             return mu, pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.critic_target_net.weights, self.critic_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -152,7 +154,7 @@ class TAC(Off_Policy):
             self.log_alpha.assign(tf.math.log(tf.cast(self.alpha_annealing(self.global_step.numpy()), tf.float32)))
         return td_error, summaries
 
-    @tf.function
+    @relaxed_function
     def train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -166,7 +168,7 @@ class TAC(Off_Policy):
                 else:
                     logits = self.actor_net.value_net(feat)
                     logp_all = tf.nn.log_softmax(logits)
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
                     _pi_true_one_hot = tf.one_hot(tf.argmax(_pi, axis=-1), self.a_dim)
                     _pi_diff = tf.stop_gradient(_pi_true_one_hot - _pi)
@@ -7,7 +7,8 @@ import tensorflow_probability as tfp
 
 from rls.nn.noise import ClippedNormalNoisedAction
 from rls.algos.base.off_policy import Off_Policy
-from rls.utils.tf2_utils import update_target_net_weights
+from rls.utils.tf2_utils import (TargetNetUpdater,
+                                 relaxed_function)
 from rls.utils.build_networks import ADoubleCNetwork
 from rls.utils.specs import OutputNetworkType
 
@@ -27,6 +28,7 @@ class TD3(Off_Policy):
                  actor_lr=5.0e-4,
                  critic_lr=1.0e-3,
                  discrete_tau=1.0,
+                 stacked_critics=False,
                  network_settings={
                      'actor_continuous': [32, 32],
                      'actor_discrete': [32, 32],
@@ -39,6 +41,7 @@ class TD3(Off_Policy):
         self.discrete_tau = discrete_tau
         self.gaussian_noise_sigma = gaussian_noise_sigma
         self.gaussian_noise_bound = gaussian_noise_bound
+        self.stacked_critics = stacked_critics
 
         if self.is_continuous:
             def _create_net(name, representation_net=None): return ADoubleCNetwork(
@@ -49,7 +52,8 @@ class TD3(Off_Policy):
                                        network_settings=network_settings['actor_continuous']),
                 value_net_type=OutputNetworkType.CRITIC_QVALUE_ONE,
                 value_net_kwargs=dict(action_dim=self.a_dim,
-                                      network_settings=network_settings['q'])
+                                      network_settings=network_settings['q']),
+                stacked=self.stacked_critics
             )
             self.noised_action = self.target_noised_action = ClippedNormalNoisedAction(sigma=self.gaussian_noise_sigma, noise_bound=self.gaussian_noise_bound)
         else:
@@ -61,7 +65,8 @@ class TD3(Off_Policy):
                                        network_settings=network_settings['actor_discrete']),
                 value_net_type=OutputNetworkType.CRITIC_QVALUE_ONE,
                 value_net_kwargs=dict(action_dim=self.a_dim,
-                                      network_settings=network_settings['q'])
+                                      network_settings=network_settings['q']),
+                stacked=self.stacked_critics
             )
             self.gumbel_dist = tfp.distributions.Gumbel(0, 1)
 
@@ -69,7 +74,8 @@ class TD3(Off_Policy):
         self._representation_target_net = self._create_representation_net('_representation_target_net')
         self.ac_target_net = _create_net('ac_target_net', self._representation_target_net)
 
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights)
+        self._target_updater = TargetNetUpdater(self.ac_target_net.weights, self.ac_net.weights, ployak=self.ployak)
+        self._target_updater.copy()
         self.actor_lr, self.critic_lr = map(self.init_lr, [actor_lr, critic_lr])
         self.optimizer_actor, self.optimizer_critic = map(self.init_optimizer, [self.actor_lr, self.critic_lr])
 
@@ -91,7 +97,7 @@ class TD3(Off_Policy):
         a = mu.numpy() if evaluation else pi.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             output, cell_state = self.ac_net(obs, cell_state=cell_state)
@@ -106,7 +112,7 @@ class TD3(Off_Policy):
             return mu, pi, cell_state
 
     def _target_params_update(self):
-        update_target_net_weights(self.ac_target_net.weights, self.ac_net.weights, self.ployak)
+        self._target_updater.update()
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
@@ -118,7 +124,7 @@ class TD3(Off_Policy):
                 ])
             })
 
-    @tf.function
+    @relaxed_function
     def _train(self, BATCH, isw, cell_state):
         with tf.device(self.device):
             with tf.GradientTape(persistent=True) as tape:
@@ -134,7 +140,7 @@ class TD3(Off_Policy):
                     target_log_pi = target_cate_dist.log_prob(target_pi)
                     action_target = tf.one_hot(target_pi, self.a_dim, dtype=tf.float32)
 
-                    gumbel_noise = tf.cast(self.gumbel_dist.sample(BATCH.action.shape), dtype=tf.float32)
+                    gumbel_noise = tf.cast(self.gumbel_dist.sample(tf.shape(BATCH.action)), dtype=tf.float32)
                     logits = self.ac_net.policy_net(feat)
                     logp_all = tf.nn.log_softmax(logits)
                     _pi = tf.nn.softmax((logp_all + gumbel_noise) / self.discrete_tau)
@@ -142,7 +148,10 @@ class TD3(Off_Policy):
                     _pi_diff = tf.stop_gradient(_pi_true_one_hot - _pi)
                     mu = _pi_diff + _pi
                 q1, q2 = self.ac_net.get_value(feat, BATCH.action)
-                q1_actor = self.ac_net.value_net(feat, mu)
+                if self.stacked_critics:
+                    q1_actor = self.ac_net.value_net(feat, mu)[0]
+                else:
+                    q1_actor = self.ac_net.value_net(feat, mu)
                 q_target = self.ac_target_net.get_min(feat_, action_target)
                 dc_r = tf.stop_gradient(BATCH.reward + self.gamma * q_target * (1 - BATCH.done))
                 td_error1 = q1 - dc_r
@@ -9,7 +9,8 @@ from collections import namedtuple
 
 from rls.utils.tf2_utils import (gaussian_clip_rsample,
                                  gaussian_likelihood_sum,
-                                 gaussian_entropy)
+                                 gaussian_entropy,
+                                 relaxed_function)
 from rls.algos.base.on_policy import On_Policy
 from rls.utils.build_networks import ACNetwork
 from rls.utils.specs import (OutputNetworkType,
@@ -54,6 +55,7 @@ class TRPO(On_Policy):
                  damping_coeff=0.1,
                  backtrack_iters=10,
                  backtrack_coeff=0.8,
+                 fvp_sample_frac=1.0,
                  epsilon=0.2,
                  critic_lr=1e-3,
                  network_settings={
@@ -71,6 +73,7 @@ class TRPO(On_Policy):
         self.damping_coeff = damping_coeff
         self.backtrack_iters = backtrack_iters
         self.backtrack_coeff = backtrack_coeff
+        self.fvp_sample_frac = fvp_sample_frac  # fraction of the minibatch used by fisher-vector products, not used with rnn
         self.train_v_iters = train_v_iters
 
         if self.is_continuous:
@@ -122,7 +125,7 @@ class TRPO(On_Policy):
             self._logp_all = _morlpa.numpy()
         return a
 
-    @tf.function
+    @relaxed_function
     def _get_action(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -152,7 +155,7 @@ class TRPO(On_Policy):
             self.data.add_cell_state(tuple(cs.numpy() for cs in self.cell_state))
         self.cell_state = self.next_cell_state
 
-    @tf.function
+    @relaxed_function
     def _get_value(self, obs, cell_state):
         with tf.device(self.device):
             feat, cell_state = self._representation_net(obs, cell_state=cell_state)
@@ -162,21 +165,13 @@ class TRPO(On_Policy):
     def calculate_statistics(self):
         init_value, self.cell_state = self._get_value(self.data.last_data('obs_'), cell_state=self.cell_state)
         init_value = init_value.numpy()
-        self.data.cal_dc_r(self.gamma, init_value)
-        self.data.cal_td_error(self.gamma, init_value)
-        self.data.cal_gae_adv(self.lambda_, self.gamma)
+        self.data.cal_gae_and_dc_r(self.gamma, self.lambda_, init_value)
 
     def learn(self, **kwargs):
         self.train_step = kwargs.get('train_step')
 
         def _train(data, cell_state):
-            actor_loss, entropy, gradients = self.train_actor(data, cell_state)
-
-            x = self.cg(self.Hx, gradients.numpy(), data, cell_state)
-            x = tf.convert_to_tensor(x)
-            alpha = np.sqrt(2 * self.delta / (np.dot(x, self.Hx(x, data, cell_state)) + 1e-8))
-            for i in range(self.backtrack_iters):
-                assign_params_from_flat(alpha * x * (self.backtrack_coeff ** i), self.net.actor_trainable_variables)
+            actor_loss, entropy, kl, backtrack_steps = self.train_actor(data, cell_state)
 
             for _ in range(self.train_v_iters):
                 critic_loss = self.train_critic(data, cell_state)
@@ -184,7 +179,9 @@ class TRPO(On_Policy):
             summaries = dict([
                 ['LOSS/actor_loss', actor_loss],
                 ['LOSS/critic_loss', critic_loss],
-                ['Statistics/entropy', entropy]
+                ['Statistics/entropy', entropy],
+                ['Statistics/kl', kl],
+                ['Statistics/backtrack_steps', backtrack_steps]
             ])
             return summaries
 
@@ -196,52 +193,95 @@ class TRPO(On_Policy):
             ])
         })
 
-    @tf.function
+    @relaxed_function
     def train_actor(self, BATCH, cell_state):
+        '''
+        the whole natural gradient step in one graph: conjugate gradient solve of x = H^-1 g,
+        step size from the trust region, and backtracking line search which keeps the first step
+        with kl <= delta and a lower surrogate loss, or restores the old parameters if there is none.
+        '''
         with tf.device(self.device):
+            params = self.net.actor_trainable_variables
             with tf.GradientTape() as tape:
                 output, _ = self.net(BATCH.obs, cell_state=cell_state)
-                if self.is_continuous:
-                    mu, log_std = output
-                    new_log_prob = gaussian_likelihood_sum(BATCH.action, mu, log_std)
-                    entropy = gaussian_entropy(log_std)
-                else:
-                    logits = output
-                    logp_all = tf.nn.log_softmax(logits)
-                    new_log_prob = tf.reduce_sum(BATCH.action * logp_all, axis=1, keepdims=True)
-                    entropy = -tf.reduce_mean(tf.reduce_sum(tf.exp(logp_all) * logp_all, axis=1, keepdims=True))
-                ratio = tf.exp(new_log_prob - BATCH.log_prob)
-                actor_loss = -tf.reduce_mean(ratio * BATCH.gae_adv)
-            actor_grads = tape.gradient(actor_loss, self.net.actor_trainable_variables)
-            gradients = flat_concat(actor_grads)
+                actor_loss, entropy = self._surrogate_loss(output, BATCH)
+            g = flat_concat(tape.gradient(actor_loss, params))
+
+            fvp_BATCH, fvp_cell_state = self._fvp_batch(BATCH, cell_state)
+            x = self.cg(lambda v: self.Hx(v, fvp_BATCH, fvp_cell_state), g)
+            alpha = tf.sqrt(2 * self.delta / (tf.reduce_sum(x * self.Hx(x, fvp_BATCH, fvp_cell_state)) + 1e-8))
+
+            old_params = flat_concat(params)
+            kl = tf.constant(0., dtype=actor_loss.dtype)
+            accepted = tf.constant(False)
+            backtrack_steps = tf.constant(0)
+            for i in tf.range(self.backtrack_iters):
+                assign_params_from_flat(old_params - alpha * x * tf.pow(self.backtrack_coeff, tf.cast(i, x.dtype)), params)
+                output, _ = self.net(BATCH.obs, cell_state=cell_state)
+                new_loss, _ = self._surrogate_loss(output, BATCH)
+                kl = self._kl(output, BATCH)
+                backtrack_steps = i + 1
+                if kl <= self.delta and new_loss <= actor_loss:
+                    accepted = tf.constant(True)
+                    break
+            if not accepted:
+                assign_params_from_flat(old_params, params)
+                kl = tf.constant(0., dtype=actor_loss.dtype)
             self.global_step.assign_add(1)
-            return actor_loss, entropy, gradients
+            return actor_loss, entropy, kl, backtrack_steps
+
+    def _surrogate_loss(self, output, BATCH):
+        if self.is_continuous:
+            mu, log_std = output
+            new_log_prob = gaussian_likelihood_sum(BATCH.action, mu, log_std)
+            entropy = gaussian_entropy(log_std)
+        else:
+            logits = output
+            logp_all = tf.nn.log_softmax(logits)
+            new_log_prob = tf.reduce_sum(BATCH.action * logp_all, axis=1, keepdims=True)
+            entropy = -tf.reduce_mean(tf.reduce_sum(tf.exp(logp_all) * logp_all, axis=1, keepdims=True))
+        ratio = tf.exp(new_log_prob - BATCH.log_prob)
+        actor_loss = -tf.reduce_mean(ratio * BATCH.gae_adv)
+        return actor_loss, entropy
+
+    def _kl(self, output, BATCH):
+        '''
+        mean kl divergence between the policy that collected BATCH and the current one.
+        '''
+        if self.is_continuous:
+            mu, log_std = output
+            var0, var1 = tf.exp(2 * log_std), tf.exp(2 * BATCH.log_std)
+            pre_sum = 0.5 * (((BATCH.mu - mu)**2 + var0) / (var1 + 1e-8) - 1) + BATCH.log_std - log_std
+            all_kls = tf.reduce_sum(pre_sum, axis=1)
+        else:
+            logits = output
+            logp_all = tf.nn.log_softmax(logits)
+            all_kls = tf.reduce_sum(tf.exp(BATCH.logp_all) * (BATCH.logp_all - logp_all), axis=1)
+        return tf.reduce_mean(all_kls)
+
+    def _fvp_batch(self, BATCH, cell_state):
+        '''
+        a random subset of the minibatch for fisher-vector products, which cost most of a natural gradient step.
+        '''
+        if self.fvp_sample_frac >= 1. or self.use_rnn:
+            return BATCH, cell_state
+        n = tf.shape(BATCH.action)[0]
+        k = tf.maximum(tf.cast(tf.cast(n, tf.float32) * self.fvp_sample_frac, tf.int32), 1)
+        idxs = tf.random.shuffle(tf.range(n))[:k]
+        return tf.nest.map_structure(lambda x: tf.gather(x, idxs), BATCH), cell_state
 
-    @tf.function
     def Hx(self, x, BATCH, cell_state):
-        with tf.device(self.device):
-            with tf.GradientTape(persistent=True) as tape:
-                output, _ = self.net(BATCH.obs, cell_state=cell_state)
-                if self.is_continuous:
-                    mu, log_std = output
-                    var0, var1 = tf.exp(2 * log_std), tf.exp(2 * BATCH.log_std)
-                    pre_sum = 0.5 * (((BATCH.mu - mu)**2 + var0) / (var1 + 1e-8) - 1) + BATCH.log_std - log_std
-                    all_kls = tf.reduce_sum(pre_sum, axis=1)
-                    kl = tf.reduce_mean(all_kls)
-                else:
-                    logits = output
-                    logp_all = tf.nn.log_softmax(logits)
-                    all_kls = tf.reduce_sum(tf.exp(BATCH.logp_all) * (BATCH.logp_all - logp_all), axis=1)
-                    kl = tf.reduce_mean(all_kls)
-
-                g = flat_concat(tape.gradient(kl, self.net.actor_trainable_variables))
-                _g = tf.reduce_sum(g * x)
-            hvp = flat_concat(tape.gradient(_g, self.net.actor_trainable_variables))
-            if self.damping_coeff > 0:
-                hvp += self.damping_coeff * x
-            return hvp
-
-    @tf.function
+        with tf.GradientTape(persistent=True) as tape:
+            output, _ = self.net(BATCH.obs, cell_state=cell_state)
+            kl = self._kl(output, BATCH)
+            g = flat_concat(tape.gradient(kl, self.net.actor_trainable_variables))
+            _g = tf.reduce_sum(g * x)
+        hvp = flat_concat(tape.gradient(_g, self.net.actor_trainable_variables))
+        if self.damping_coeff > 0:
+            hvp += self.damping_coeff * x
+        return hvp
+
+    @relaxed_function
     def train_critic(self, BATCH, cell_state):
         with tf.device(self.device):
             with tf.GradientTape() as tape:
@@ -255,21 +295,21 @@ class TRPO(On_Policy):
             )
             return value_loss
 
-    def cg(self, Ax, b, BATCH, cell_state):
+    def cg(self, Ax, b):
         """
-        Conjugate gradient algorithm
+        Conjugate gradient algorithm, traced into train_actor as a tf.while_loop.
         (see https://en.wikipedia.org/wiki/Conjugate_gradient_method)
         """
-        x = np.zeros_like(b)
-        r = b.copy()  # Note: should be 'b - Ax(x)', but for x=0, Ax(x)=0. Change if doing warm start.
-        p = r.copy()
-        r_dot_old = np.dot(r, r)
-        for _ in range(self.cg_iters):
-            z = Ax(tf.convert_to_tensor(p), BATCH, cell_state)
-            alpha = r_dot_old / (np.dot(p, z) + 1e-8)
+        x = tf.zeros_like(b)
+        r = tf.identity(b)  # Note: should be 'b - Ax(x)', but for x=0, Ax(x)=0. Change if doing warm start.
+        p = tf.identity(r)
+        r_dot_old = tf.reduce_sum(r * r)
+        for _ in tf.range(self.cg_iters):
+            z = Ax(p)
+            alpha = r_dot_old / (tf.reduce_sum(p * z) + 1e-8)
             x += alpha * p
             r -= alpha * z
-            r_dot_new = np.dot(r, r)
+            r_dot_new = tf.reduce_sum(r * r)
             p = r + (r_dot_new / r_dot_old) * p
             r_dot_old = r_dot_new
         return x
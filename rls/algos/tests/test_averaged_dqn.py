@@ -0,0 +1,29 @@
+import sys
+sys.path.append('../..')
+import tempfile
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from rls.algos.register import get_model_info
+from rls.utils.specs import (EnvGroupArgs,
+                             ObsSpec)
+
+
+@pytest.mark.parametrize('stacked_targets', [False, True])
+def test_target_networks_rotate_in_graph(stacked_targets):
+    MODEL, args, _, _ = get_model_info('averaged_dqn')
+    model = MODEL(envspec=EnvGroupArgs(ObsSpec([5], []), 3, False, 4),
+                  **dict(args, base_dir=tempfile.mkdtemp(), no_save=True, stacked_targets=stacked_targets, target_k=3, assign_interval=2))
+    assert model.stacked_targets == stacked_targets
+    for step in range(1, 9):
+        model.global_step.assign(step)
+        for w in model.q_net.weights:
+            w.assign(tf.fill(w.shape, float(step)))
+        model._target_params_update()
+    if stacked_targets:
+        firsts = [model.target_net.weights[0][i][0, 0].numpy() for i in range(3)]
+    else:
+        firsts = [target_net.weights[0][0, 0].numpy() for target_net in model.target_nets]
+    assert np.allclose(firsts, [8., 4., 6.])   # replaced at steps 2, 4, 6, then the first one again at step 8
+    assert model.current_target_idx.numpy() == 1
@@ -0,0 +1,62 @@
+import sys
+sys.path.append('../..')
+import tempfile
+import numpy as np
+import tensorflow as tf
+
+from rls.algos.register import get_model_info
+from rls.utils.specs import (BatchExperiences,
+                             EnvGroupArgs,
+                             ModelObservations,
+                             NamedTupleStaticClass,
+                             ObsSpec)
+
+B, K, a_dim = 8, 4, 3
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(B, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(B, 0, 'visual')
+
+
+def _model():
+    MODEL, args, _, _ = get_model_info('dqn')
+    return MODEL(envspec=EnvGroupArgs(ObsSpec([5], []), a_dim, False, 2),
+                 **dict(args, base_dir=tempfile.mkdtemp(), no_save=True, batch_size=B, assign_interval=2,
+                        train_times_per_step=K, fused_updates=True))
+
+
+def _batch():
+    def obs(): return ModelObservations(vector=Vector(tf.random.normal((B, 5))), visual=Visual())
+    action = tf.one_hot(np.random.randint(0, a_dim, B), a_dim)
+    return BatchExperiences(obs=obs(), action=action, reward=tf.random.normal((B, 1)), obs_=obs(),
+                            done=tf.cast(tf.random.uniform((B, 1)) < 0.2, tf.float32)), tf.ones((B, 1))
+
+
+def _weights(model):
+    return [w.numpy() for w in model.q_net.weights], [w.numpy() for w in model.q_target_net.weights]
+
+
+def test_fused_steps_match_unfused_steps():
+    np.random.seed(0)
+    tf.random.set_seed(0)
+    unfused, fused = _model(), _model()
+    for a, b in zip(unfused.q_net.weights + unfused.q_target_net.weights, fused.q_net.weights + fused.q_target_net.weights):
+        b.assign(a)
+    # the first normal update creates the slots of optimizers, like _learn before the updates are fused
+    data, isw = _batch()
+    for model in [unfused, fused]:
+        model._train(data, isw, model.initial_cell_state(batch=B))
+        model._target_params_update()
+    _, targets = _weights(fused)
+
+    batches = [_batch() for _ in range(K)]
+    for data, isw in batches:
+        unfused._train(data, isw, unfused.initial_cell_state(batch=B))
+        unfused._target_params_update()
+    data, isw = tf.nest.map_structure(lambda *x: tf.stack(x), *batches)
+    td_errors, _ = fused._fused_train(data, isw, False)
+
+    assert td_errors.shape == (K, B, 1)
+    assert fused.global_step.numpy() == unfused.global_step.numpy() == K + 1
+    for x, y in zip(sum(_weights(unfused), []), sum(_weights(fused), [])):
+        assert np.allclose(x, y, atol=1e-5)
+    # targets are updated at step 2 and 4 inside the loop, not once after it at step 5
+    assert not all(np.allclose(x, y) for x, y in zip(targets, _weights(fused)[1]))
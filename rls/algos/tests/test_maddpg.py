@@ -0,0 +1,86 @@
+import sys
+sys.path.append('../..')
+import tempfile
+import numpy as np
+import pytest
+import tensorflow as tf
+
+pytest.importorskip('tensorflow_probability')
+
+from rls.algos.register import get_model_info
+from rls.utils.specs import (BatchExperiences,
+                             EnvGroupArgs,
+                             ModelObservations,
+                             NamedTupleStaticClass,
+                             ObsSpec)
+
+n, B, dims, a_dim = 3, 8, [5, 3], 2
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(B, len(dims), 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(B, 0, 'visual')
+
+
+def _models(is_continuous):
+    '''
+    per-agent and grouped MADDPG, per-agent weights are loaded into the stacked networks of the grouped one.
+    '''
+    MODEL, args, _, _ = get_model_info('maddpg')
+    envspec = EnvGroupArgs(ObsSpec(dims, []), a_dim, is_continuous, 4)
+    per_agent, grouped = [MODEL(envspecs=[envspec] * n, **dict(args, base_dir=tempfile.mkdtemp(), no_save=True, batch_size=B, grouped=g))
+                          for g in [False, True]]
+    assert not per_agent.grouped and grouped.grouped
+    for i in range(n):
+        for w, s in zip(grouped.actor_net.weights, per_agent.actor_nets[i].weights):
+            w[i].assign(s)
+        # critic i has vector nets for observations of every agent j, stacked at i * n + j
+        reps = per_agent.critic_nets[i].representation_net.representation_nets
+        for k, vector_net in enumerate(grouped.critic_net.vector_nets):
+            for j in range(n):
+                for w, s in zip(vector_net.weights, reps[j].vector_net.nets[k].weights):
+                    w[i * n + j].assign(s)
+        for w, s in zip(grouped.critic_net.net.weights, per_agent.critic_nets[i].value_net.weights):
+            w[i].assign(s)
+    grouped._target_updater.copy()
+    return per_agent, grouped
+
+
+def _batches(is_continuous):
+    def obs(): return ModelObservations(vector=Vector(*[np.random.randn(B, d).astype(np.float32) for d in dims]), visual=Visual())
+    batches = []
+    for _ in range(n):
+        action = np.random.rand(B, a_dim) if is_continuous else np.eye(a_dim)[np.random.randint(0, a_dim, B)]
+        batches.append(BatchExperiences(obs=obs(), action=action.astype(np.float32), reward=np.random.rand(B, 1).astype(np.float32),
+                                        obs_=obs(), done=np.zeros((B, 1), np.float32)))
+    return [tf.nest.map_structure(tf.convert_to_tensor, batch) for batch in batches]
+
+
+@pytest.mark.parametrize('is_continuous', [True, False])
+def test_grouped_nets_match_per_agent_nets(is_continuous):
+    np.random.seed(0)
+    per_agent, grouped = _models(is_continuous)
+    BATCHs = _batches(is_continuous)
+    vectors = [tf.stack(v) for v in zip(*[BATCH.obs.vector for BATCH in BATCHs])]  # [N, B, x]
+
+    outputs = np.stack([per_agent.actor_nets[i](BATCHs[i].obs)[0].numpy() for i in range(n)])
+    assert np.allclose(grouped.actor_net(*vectors).numpy(), outputs, atol=1e-5)
+    if is_continuous:
+        assert np.allclose(grouped._get_grouped_actions(vectors).numpy(), outputs, atol=1e-5)
+    else:
+        assert (grouped._get_grouped_actions(vectors)[0].numpy() == outputs.argmax(-1)).all()
+
+    actions = tf.concat([BATCH.action for BATCH in BATCHs], axis=-1)    # [B, N*A], seen by every critic
+    q = np.stack([per_agent.critic_nets[i]([BATCH.obs for BATCH in BATCHs], actions)[0].numpy() for i in range(n)])
+    assert np.allclose(grouped.critic_net(vectors, tf.tile(actions[tf.newaxis], [n, 1, 1])).numpy(), q, atol=1e-5)
+    assert np.allclose(grouped.critic_target_net(vectors, tf.tile(actions[tf.newaxis], [n, 1, 1])).numpy(), q, atol=1e-5)
+
+
+def test_grouped_train_step_matches_per_agent_steps():
+    np.random.seed(0)
+    per_agent, grouped = _models(True)
+    BATCHs = _batches(True)
+    td_errors, summaries = per_agent._train(BATCHs, tf.constant(1.))
+    grouped_td_errors, grouped_summaries = grouped._train(BATCHs, tf.constant(1.))
+    for i in range(n):
+        assert np.allclose(grouped_td_errors[i].numpy(), td_errors[i].numpy(), atol=1e-5)
+        assert np.isclose(grouped_summaries[i][f'LOSS/critic_loss_{i}'], summaries[i][f'LOSS/critic_loss_{i}'], atol=1e-5)
+        for w, s in zip(grouped.actor_net.weights, per_agent.actor_nets[i].weights):
+            assert np.allclose(w[i].numpy(), s.numpy(), atol=1e-5)
@@ -0,0 +1,73 @@
+import sys
+sys.path.append('../..')
+import tempfile
+import numpy as np
+import pytest
+import tensorflow as tf
+
+pytest.importorskip('tensorflow_probability')
+
+from rls.algos.register import get_model_info
+from rls.utils.specs import (BatchExperiences,
+                             EnvGroupArgs,
+                             ModelObservations,
+                             NamedTupleStaticClass,
+                             ObsSpec)
+from rls.utils.tf2_utils import trace_monitor
+
+n, T, batch_size = 4, 20, 8
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(n, 0, 'visual')
+
+
+def _obs():
+    return ModelObservations(vector=Vector(np.random.randn(n, 3).astype(np.float32)), visual=Visual())
+
+
+def _learn(model, train_step):
+    '''
+    one rollout of T steps, then one learn.
+    return:
+        steps of the optimizer, summaries of the learn
+    '''
+    model.reset()
+    obs = _obs()
+    for _ in range(T):
+        action = model.choose_action(obs=obs)
+        obs_ = _obs()
+        done = np.random.rand(n) < 0.1
+        model.store_data(BatchExperiences(obs=obs, action=action, reward=np.random.rand(n, 1).astype(np.float32),
+                                          obs_=obs_, done=done[:, np.newaxis].astype(np.float32)))
+        model.partial_reset(done)
+        obs = obs_
+    iterations = model.optimizer.iterations.numpy()
+    model.learn(episode=train_step, train_step=train_step)
+    return model.optimizer.iterations.numpy() - iterations, model.summaries
+
+
+@pytest.mark.parametrize('kl_target_earlystop', [-1., 1e3])
+def test_graph_epochs_match_python_minibatches(kl_target_earlystop):
+    np.random.seed(0)
+    tf.random.set_seed(0)
+    trace_monitor.reset()
+    MODEL, args, _, _ = get_model_info('ppo')
+    model = MODEL(envspec=EnvGroupArgs(ObsSpec([3], []), 2, False, n),
+                  **dict(args, base_dir=tempfile.mkdtemp(), no_save=True, batch_size=batch_size, share_net=True,
+                         policy_epoch=3, graph_epochs=True, use_early_stop=True, use_kl_loss=True,
+                         kl_target=1., kl_target_earlystop=kl_target_earlystop, kl_beta=[0.7, 1.3], kl_alpha=2., kl_coef=1.))
+    mb_nums = int(np.ceil(T / batch_size))  # minibatches of batch_size * n_agents
+    epochs = 1 if kl_target_earlystop < 0 else 3    # a negative kl_stop stops every minibatch after its first step
+
+    assert not model._graph_epochs_ready    # optimizers create their slots in the first learn, in python
+    steps, summaries = _learn(model, 0)
+    assert steps == mb_nums * epochs and summaries['Statistics/early_step'] == 0
+    assert np.isclose(model.kl_coef.numpy(), 0.5 ** mb_nums)     # kl < kl_low, kl_coef /= kl_alpha for every minibatch
+    assert trace_monitor.traces['PPO.train_epochs'] == 0
+
+    assert model._graph_epochs_ready
+    steps, summaries = _learn(model, 1)
+    assert trace_monitor.traces['PPO.train_epochs'] == 1
+    assert steps == mb_nums * epochs and summaries['Statistics/early_step'] == 0
+    assert np.isclose(model.kl_coef.numpy(), 0.5 ** (2 * mb_nums))
+    assert np.isclose(summaries['Statistics/kl_coef'], model.kl_coef.numpy())
+    assert all(np.isfinite(summaries[k]) for k in ['LOSS/actor_loss', 'LOSS/critic_loss', 'Statistics/kl', 'Statistics/entropy'])
@@ -0,0 +1,59 @@
+import sys
+sys.path.append('../..')
+import tempfile
+import numpy as np
+import pytest
+import tensorflow as tf
+
+pytest.importorskip('tensorflow_probability')
+
+from rls.algos.register import get_model_info
+from rls.algos.single.trpo import flat_concat
+from rls.utils.specs import (BatchExperiences,
+                             EnvGroupArgs,
+                             ModelObservations,
+                             NamedTupleStaticClass,
+                             ObsSpec)
+
+n, T = 4, 16
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(n, 0, 'visual')
+
+
+def _model(**kwargs):
+    MODEL, args, _, _ = get_model_info('trpo')
+    return MODEL(envspec=EnvGroupArgs(ObsSpec([3], []), 2, False, n),
+                 **dict(args, base_dir=tempfile.mkdtemp(), no_save=True, batch_size=T, **kwargs))
+
+
+def test_cg_solves_spd_system():
+    np.random.seed(0)
+    model = _model()
+    model.cg_iters = 5
+    m = np.random.randn(5, 5)
+    A = (m @ m.T + 5 * np.eye(5)).astype(np.float32)
+    b = np.random.randn(5).astype(np.float32)
+    x = tf.function(lambda b: model.cg(lambda v: tf.linalg.matvec(A, v), b))(tf.constant(b))
+    assert np.allclose(x.numpy(), np.linalg.solve(A, b), atol=1e-4)
+
+
+def test_params_are_restored_without_accepted_step():
+    np.random.seed(0)
+    model = _model(backtrack_iters=3)
+    model.reset()
+    for _ in range(T):
+        obs = ModelObservations(vector=Vector(np.random.randn(n, 3).astype(np.float32)), visual=Visual())
+        action = model.choose_action(obs=obs)
+        model.store_data(BatchExperiences(obs=obs, action=action, reward=np.random.rand(n, 1).astype(np.float32),
+                                          obs_=obs, done=np.zeros((n, 1), np.float32)))
+    model.data.convert_action2one_hot(model.a_dim)
+    model.calculate_statistics()
+    data, cell_state = next(model.data.sample_generater())
+    data, cell_state = NamedTupleStaticClass.data_convert(model.data_convert, data), model.data_convert(cell_state)
+
+    kl = model._kl
+    model._kl = lambda output, BATCH: kl(output, BATCH) + 1e3     # no step is within the trust region
+    old_params = flat_concat(model.net.actor_trainable_variables).numpy()
+    _, _, kl, backtrack_steps = model.train_actor(data, cell_state)
+    assert backtrack_steps.numpy() == 3 and kl.numpy() == 0.
+    assert (flat_concat(model.net.actor_trainable_variables).numpy() == old_params).all()
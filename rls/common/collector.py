@@ -5,6 +5,9 @@ import time
 import numpy as np
 
 from copy import deepcopy
+from collections import deque
+from typing import (List,
+                    NoReturn)
 
 from rls.utils.np_utils import (SMA,
                                 arrprint)
@@ -65,11 +68,25 @@ class GymCollector(object):
             time.sleep(5)
 
     @staticmethod
-    def run_exps_stream(env, model):
+    def run_exps_stream(env, model, compression='none', block_size=256):
+        '''
+        yield blocks of n-step experiences, td errors of a whole block are calculated by one forward pass.
+        '''
         n = env.n
         i = 1 if env.obs_type == 'visual' else 0
         state = [np.full((n, 0), []), np.full((n, 0), [])]
         new_state = [np.full((n, 0), []), np.full((n, 0), [])]
+        n_step = getattr(model, 'n_step', 1)
+        assembler = NStepExpsAssembler(n_step=n_step,
+                                       gamma=model.gamma ** (1 / n_step),    # model.gamma has been powered by n_step
+                                       block_size=block_size)
+
+        def _block2proto(exps):
+            td_error = model.apex_cal_td(deepcopy(exps))
+            return exps_and_tderror2proto(
+                exps=exps,
+                td_error=td_error,
+                compression=compression)
 
         model.reset()
         state[i] = env.reset()
@@ -78,21 +95,22 @@ class GymCollector(object):
         while True:
             action = model.choose_action(s=state[0], visual_s=state[1], evaluation=True)
             new_state[i], reward, done, info, correct_new_state = env.step(action)
-            exps = [*state, action, reward[:, np.newaxis], *new_state, done[:, np.newaxis]]
-            td_error = model.apex_cal_td(deepcopy(exps))
-            yield exps_and_tderror2proto(
-                exps=exps,
-                td_error=td_error)
+            assembler.add([*state, action, reward[:, np.newaxis], *new_state, done[:, np.newaxis]])
+            if assembler.is_ready:
+                yield _block2proto(assembler.pop_block())
             model.partial_reset(done)
             state[i] = correct_new_state
             dones_flag = np.sign(dones_flag + done)
             if all(dones_flag):
                 break
 
+        assembler.flush()
+        if assembler.size > 0:
+            yield _block2proto(assembler.pop_block())
         logger.info('run_exps_stream success')
 
     @staticmethod
-    def run_trajectory(env, model):
+    def run_trajectory(env, model, compression='none'):
         n = env.n
         i = 1 if env.obs_type == 'visual' else 0
         state = [np.full((n, 0), []), np.full((n, 0), [])]
@@ -118,11 +136,74 @@ class GymCollector(object):
                 break
 
         for traj in trajectories:
-            yield batch_numpy2proto([np.asarray(arg) for arg in zip(*traj)])
+            yield batch_numpy2proto([np.asarray(arg) for arg in zip(*traj)], compression)
 
         logger.info('run_trajectory success')
 
 
+class NStepExpsAssembler(object):
+    '''
+    assemble n-step experiences of all envs at once from a window of the latest n steps,
+    and group them into blocks of block_size experiences.
+    every experience is a list of arrays [s, visual_s, a, r, s_, visual_s_, done], and each array is [n, ...].
+    '''
+
+    def __init__(self, n_step: int, gamma: float, block_size: int):
+        self.n_step = n_step
+        self.block_size = block_size
+        self._discounts = np.power(gamma, np.arange(n_step))[:, np.newaxis, np.newaxis]  # [T, 1, 1]
+        self._window = deque(maxlen=n_step)
+        self._exps = []
+        self._size = 0
+
+    def add(self, exps: List[np.ndarray]) -> NoReturn:
+        self._window.append(exps)
+        if len(self._window) == self.n_step:
+            self._assemble()
+
+    def flush(self) -> NoReturn:
+        '''
+        assemble the rest of window with less than n steps, i.e. at the end of a rollout.
+        only experiences that end with done are kept, others would be bootstrapped by the learner with gamma^n
+        instead of gamma^t, so they are dropped.
+        '''
+        while self._window:
+            self._assemble(drop_truncated=True)
+
+    def _assemble(self, drop_truncated: bool = False) -> NoReturn:
+        '''
+        pop the oldest step of window, and accumulate rewards until the first done of every env.
+        '''
+        t = len(self._window)
+        s, visual_s, a, _, _, _, _ = self._window[0]
+        r, s_, visual_s_, done = [np.stack([exps[k] for exps in self._window]) for k in [3, 4, 5, 6]]  # [T, n, ...]
+        alive = np.cumprod(np.concatenate([np.ones_like(done[:1], dtype=bool), done[:-1] == 0]), axis=0)    # steps before the first done
+        reward = (self._discounts[:t] * alive * r).sum(0)
+        last = t - 1 - np.argmax(alive[::-1, :, 0] > 0, axis=0)   # the last alive step of every env, [n,]
+        envs = np.arange(last.shape[0])
+        exps = [s, visual_s, a, reward, s_[last, envs], visual_s_[last, envs], done[last, envs]]
+        if drop_truncated and t < self.n_step:
+            keep = done[last, envs, 0] > 0    # truncated windows that end without done can not be bootstrapped by gamma^n
+            exps = [e[keep] for e in exps]
+        self._exps.append(exps)
+        self._size += exps[3].shape[0]
+        self._window.popleft()
+
+    @property
+    def is_ready(self) -> bool:
+        return self._size >= self.block_size
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def pop_block(self) -> List[np.ndarray]:
+        block = [np.concatenate(arrs) for arrs in zip(*self._exps)]
+        self._exps.clear()
+        self._size = 0
+        return block
+
+
 class UnityCollector(object):
 
     def __init__(self):
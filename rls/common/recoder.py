@@ -106,6 +106,56 @@ class SimpleMovingAverageRecoder(Recoder):
         return _str
 
 
+class AsyncMovingAverageRecoder(SimpleMovingAverageRecoder):
+    '''
+    Record episodes of envs stepping asynchronously, every env is tracked by its id and its episode ends on its own.
+    Every n_agents finished env-episodes are grouped as one episode, so statistics are comparable with lock-step training.
+    '''
+
+    def __init__(self,
+                 n_agents,
+                 gamma=0.99,
+                 verbose=False,
+                 length=10):
+        self._running_steps = np.zeros(n_agents, dtype=int)
+        self._running_returns = np.zeros(n_agents, dtype=float)
+        self._running_discounted_returns = np.zeros(n_agents, dtype=float)
+        self._finished = []  # (steps, total_return, discounted_return) of finished env-episodes
+        super().__init__(n_agents=n_agents, gamma=gamma, verbose=verbose, length=length)
+
+    def step_update(self, rewards, dones, env_ids):
+        '''
+        rewards, dones: [K, ], results of envs of env_ids
+        '''
+        rewards, dones = np.asarray(rewards), np.asarray(dones)
+        self._running_discounted_returns[env_ids] += (self.gamma ** self._running_steps[env_ids]) * rewards
+        self._running_returns[env_ids] += rewards
+        self._running_steps[env_ids] += 1
+        self.total_step += 1
+        for i in np.asarray(env_ids)[np.where(dones)[0]]:
+            self._finished.append((self._running_steps[i], self._running_returns[i], self._running_discounted_returns[i]))
+            self._running_steps[i] = 0
+            self._running_returns[i] = 0.
+            self._running_discounted_returns[i] = 0.
+
+    def episode_end(self):
+        '''
+        collect the first n_agents finished env-episodes as one episode.
+        '''
+        assert self.is_all_done, 'episodes of not enough envs have finished.'
+        steps, total_returns, discounted_returns = zip(*self._finished[:self.n_agents])
+        del self._finished[:self.n_agents]
+        self.steps = np.asarray(steps, dtype=int)
+        self.total_returns = np.asarray(total_returns, dtype=float)
+        self.discounted_returns = np.asarray(discounted_returns, dtype=float)
+        self.already_dones = np.ones(self.n_agents)
+        super().episode_end()
+
+    @property
+    def is_all_done(self):
+        return len(self._finished) >= self.n_agents
+
+
 class SimpleMovingAverageMultiAgentRecoder(Recoder):
 
     def __init__(self,
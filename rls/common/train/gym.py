@@ -7,16 +7,26 @@ from tqdm import trange
 from copy import deepcopy
 from typing import (Tuple,
                     List,
+                    Dict,
                     Callable,
                     NoReturn)
 
-from rls.common.recoder import SimpleMovingAverageRecoder
+from rls.common.recoder import (SimpleMovingAverageRecoder,
+                                AsyncMovingAverageRecoder)
+from rls.memories.columnar_storage import ColumnarStorage
 from rls.utils.specs import BatchExperiences
 from rls.utils.logging_utils import get_logger
 logger = get_logger(__name__)
 bar_format = '{l_bar}{bar}| {n_fmt}/{total_fmt} [{elapsed}<{remaining}]'
 
 
+def _episode_summaries(env, recoder) -> Dict:
+    '''
+    episode summaries of the recoder, with latency(ms) of env operations if the vectorized envs measure it.
+    '''
+    return dict(recoder.summary_dict, **{f'env_latency_{op}': ms for op, ms in env.latency.items()})
+
+
 def gym_train(env, model,
               print_func: Callable[[str], None],
               begin_train_step: int,
@@ -42,6 +52,24 @@ def gym_train(env, model,
     """
     TODO: Annotation
     """
+    if env.is_async:
+        if eval_while_train or add_noise2buffer or off_policy_eval_interval > 0:
+            logger.warning('evaluation and adding noise are not supported while envs step asynchronously, skip them.')
+        return gym_train_async(env, model,
+                               print_func=print_func,
+                               begin_train_step=begin_train_step,
+                               begin_frame_step=begin_frame_step,
+                               begin_episode=begin_episode,
+                               render=render,
+                               render_episode=render_episode,
+                               save_frequency=save_frequency,
+                               max_step_per_episode=max_step_per_episode,
+                               max_train_episode=max_train_episode,
+                               off_policy_train_interval=off_policy_train_interval,
+                               policy_mode=policy_mode,
+                               moving_average_episode=moving_average_episode,
+                               max_train_step=max_train_step,
+                               max_frame_step=max_frame_step)
 
     recoder = SimpleMovingAverageRecoder(n_agents=env.n, gamma=0.99, verbose=True,
                                          length=moving_average_episode)
@@ -50,6 +78,7 @@ def gym_train(env, model,
 
     for episode in range(begin_episode, max_train_episode):
         model.reset()
+        model.truncate()    # envs are reset, windows of the last episode never complete
         obs = env.reset()
         recoder.episode_reset(episode=episode)
         for _ in range(max_step_per_episode):
@@ -90,7 +119,7 @@ def gym_train(env, model,
             train_step += 1
             if train_step % save_frequency == 0:
                 model.save_checkpoint(train_step=train_step, episode=episode, frame_step=frame_step)
-        model.writer_summary(episode, recoder.summary_dict)
+        model.writer_summary(episode, _episode_summaries(env, recoder))
         print_func(str(recoder), out_time=True)
 
         if add_noise2buffer and episode % add_noise2buffer_episode_interval == 0:
@@ -102,6 +131,89 @@ def gym_train(env, model,
                 gym_evaluate(env, model, max_step_per_episode, max_eval_episode, print_func)
 
 
+def gym_train_async(env, model,
+                    print_func: Callable[[str], None],
+                    begin_train_step: int,
+                    begin_frame_step: int,
+                    begin_episode: int,
+                    render: bool,
+                    render_episode: int,
+                    save_frequency: int,
+                    max_step_per_episode: int,
+                    max_train_episode: int,
+                    off_policy_train_interval: int,
+                    policy_mode: str,
+                    moving_average_episode: int,
+                    max_train_step: int,
+                    max_frame_step: int) -> NoReturn:
+    """
+    Training with envs stepping asynchronously, every iteration consumes the first env.async_batch_size envs that finish,
+    so slow envs never stall the others. Envs are tracked by their ids, and each of them ends its episode on its own.
+    The policy chooses actions only for the returned envs, and n-step windows of the replay buffer are kept by env id,
+    so the model must not keep states of every env between steps, see Policy.keeps_env_states.
+    """
+    recoder = AsyncMovingAverageRecoder(n_agents=env.n, gamma=0.99, verbose=True,
+                                        length=moving_average_episode)
+    frame_step = begin_frame_step
+    train_step = begin_train_step
+    episode = begin_episode
+    all_ids = np.arange(env.n)
+    episode_steps = np.zeros(env.n, dtype=int)
+
+    model.reset()
+    model.truncate()
+    recoder.episode_reset(episode=episode)
+    # the latest observation and the action in flight of every env, indexed by env id
+    obs = ColumnarStorage(env.n)
+    obs.put(all_ids, env.reset())
+    action = model.choose_action(obs=obs.data)
+    actions = ColumnarStorage(env.n)
+    actions.put(all_ids, (action,))
+    env.send(action, all_ids)
+
+    while episode < max_train_episode:
+        if render or episode > render_episode:
+            env.render(record=False)
+        env_ids, ret = env.recv()
+        model.store_data(BatchExperiences(obs=obs.get(env_ids),
+                                          action=actions.get(env_ids)[0],
+                                          reward=ret.reward[:, np.newaxis],  # [K, ] => [K, 1]
+                                          obs_=ret.obs,
+                                          done=ret.done[:, np.newaxis]),
+                         env_ids=env_ids)
+        obs.put(env_ids, ret.corrected_obs)
+        episode_steps[env_ids] = np.where(ret.done, 0, episode_steps[env_ids] + 1)
+        truncated = episode_steps[env_ids] >= max_step_per_episode  # break but not done, like lock-step training
+        if truncated.any():
+            episode_steps[env_ids[truncated]] = 0
+            model.truncate(env_ids[truncated])
+            obs.put(env_ids[truncated], env.reset(env_ids[truncated]))
+        recoder.step_update(rewards=ret.reward, dones=ret.done | truncated, env_ids=env_ids)
+
+        action = model.choose_action(obs=obs.get(env_ids))
+        actions.put(env_ids, (action,))
+        env.send(action, env_ids)
+
+        if recoder.total_step % off_policy_train_interval == 0:
+            model.learn(episode=episode, train_step=train_step)
+            train_step += 1
+            if train_step % save_frequency == 0:
+                model.save_checkpoint(train_step=train_step, episode=episode, frame_step=frame_step)
+
+        frame_step += env_ids.shape[0]
+        if 0 < max_train_step <= train_step or 0 < max_frame_step <= frame_step:
+            model.save_checkpoint(train_step=train_step, episode=episode, frame_step=frame_step)
+            logger.info(f'End Training, learn step: {train_step}, frame_step: {frame_step}')
+            return
+
+        if recoder.is_all_done:
+            recoder.episode_end()
+            model.writer_summary(episode, _episode_summaries(env, recoder))
+            print_func(str(recoder), out_time=True)
+            episode += 1
+            recoder.episode_reset(episode=episode)
+
+
 def gym_step_eval(env, model,
                   train_step: int,
                   episodes_num: int,
@@ -183,6 +295,7 @@ def gym_no_op(env, model,
         return
 
     model.reset()
+    model.truncate()
     obs = env.reset()
 
     for _ in trange(0, pre_fill_steps, env.n, unit_scale=env.n, ncols=80, desc=desc, bar_format=bar_format):
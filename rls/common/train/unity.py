@@ -50,6 +50,7 @@ def unity_train(env, model,
 
     for episode in range(begin_episode, max_train_episode):
         model.reset()
+        model.truncate()    # envs are reset, windows of the last episode never complete
         ret = env.reset(reset_config={})
         recoder.episode_reset(episode=episode)
 
@@ -110,6 +111,7 @@ def unity_no_op(env, model,
     if pre_fill_steps == 0:
         return
     model.reset()
+    model.truncate()
     ret = env.reset(reset_config={})
 
     for _ in trange(0, pre_fill_steps, n, unit_scale=n, ncols=80, desc=desc, bar_format=bar_format):
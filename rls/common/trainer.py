@@ -100,7 +100,16 @@ class Trainer:
             'base_dir': self.train_args.base_dir
         })
         self.model = self.MODEL(**self.algo_args)
+        if self.env_args['type'] == 'gym' and self.env.is_async:
+            if self.train_args['policy_mode'] != 'off-policy':
+                raise Exception('asynchronous envs only support off-policy algorithms, set async_batch_size to 0.')
+            if self.model.keeps_env_states:
+                raise Exception(f"{self.train_args['algo']} keeps states of every env, i.e. rnn or OU noise, "
+                                "which needs envs to step in lock-step, set async_batch_size to 0.")
         self.model.init_or_restore(self.train_args.load_model_path)
+        if self.train_args['policy_mode'] == 'off-policy' and hasattr(self.model, 'data'):
+            # experiences restored from memmap files count towards pre-filling
+            self.train_args['pre_fill_steps'] = max(0, int(self.train_args['pre_fill_steps']) - self.model.data.size)
 
         _train_info = self.model.get_init_training_info()
         self.train_args['begin_train_step'] = _train_info['train_step']
@@ -1,9 +1,13 @@
 import grpc
 import time
+import queue
 import threading
+import numpy as np
 
+from collections import deque
 from concurrent import futures
-from typing import Iterator
+from typing import (Iterator,
+                    NoReturn)
 
 from rls.distribute.pb2 import (apex_datatype_pb2,
                                 apex_buffer_pb2_grpc,
@@ -19,54 +23,151 @@ from rls.utils.logging_utils import get_logger
 logger = get_logger(__name__)
 
 
+class ApexBuffer(object):
+    '''
+    PER shared by the grpc servicer, the sample thread and the learn thread.
+    the lock only guards in-memory operations, encoding and rpc are done outside of it.
+    every slot has a version that increases when it is overwritten,
+    so priorities that come back after their slots have been replaced are dropped.
+    '''
+
+    def __init__(self, buffer_args):
+        self.buffer = PrioritizedExperienceReplay(**buffer_args)
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._versions = np.zeros(self.buffer.capacity, dtype=np.int64)
+        self.ingested = 0
+        self.sampled = 0
+        self.dropped = 0
+
+    def add(self, data, td_error=None) -> NoReturn:
+        '''
+        experiences without td errors are added with the max priority.
+        '''
+        num = len(data[0])
+        with self._ready:
+            idxs = (np.arange(num) + self.buffer.tree.now) % self.buffer.capacity
+            self._versions[idxs] += 1
+            if td_error is None:
+                self.buffer.add_batch(tuple(data))
+            else:
+                self.buffer.apex_add_batch(td_error, *data)
+            self.ingested += num
+            if self.buffer.is_lg_batch_size:
+                self._ready.notify_all()
+
+    def sample(self):
+        '''
+        block until there are enough experiences instead of spinning.
+        return:
+            exps, importance sampling weights, tree indexs, versions of sampled slots
+        '''
+        with self._ready:
+            self._ready.wait_for(lambda: self.buffer.is_lg_batch_size)
+            exps, idxs = self.buffer.sample(return_index=True)
+            prios = self.buffer.get_IS_w().reshape(-1, 1)
+            versions = self._versions[idxs - self.buffer.tree.tree_data_offset]
+            self.sampled += len(idxs)
+        return exps, prios, idxs, versions
+
+    def update(self, td_error, idxs, versions) -> NoReturn:
+        with self._lock:
+            fresh = self._versions[idxs - self.buffer.tree.tree_data_offset] == versions
+            self.dropped += len(idxs) - fresh.sum()
+            if fresh.any():
+                self.buffer.update(td_error[fresh], idxs[fresh])
+
+
+class SampleThread(threading.Thread):
+    '''
+    keep prefetch_size encoded batches ready for the learner.
+    '''
+
+    def __init__(self, buffer: ApexBuffer, prefetch_size: int):
+        super().__init__(daemon=True)
+        self.buffer = buffer
+        self.queue = queue.Queue(maxsize=prefetch_size)
+
+    def run(self):
+        while True:
+            exps, prios, idxs, versions = self.buffer.sample()
+            self.queue.put((exps_and_prios2proto(exps=exps, prios=prios), idxs, versions))
+
+
 class LearnThread(threading.Thread):
+    '''
+    stream prefetched batches to the learner through one bidirectional rpc, and update priorities as they come back.
+    '''
 
-    def __init__(self, learner_ip, learner_port, buffer, lock):
-        super().__init__()
+    def __init__(self, learner_ip, learner_port, buffer: ApexBuffer, prefetch_size: int):
+        super().__init__(daemon=True)
         self.learner_channel = grpc.insecure_channel(':'.join([learner_ip, learner_port]))
         self.learner_stub = apex_learner_pb2_grpc.LearnerStub(self.learner_channel)
         self.buffer = buffer
-        self.lock = lock
+        self.sampler = SampleThread(buffer, prefetch_size)
+        self._in_flight = deque()   # (idxs, versions) of batches sent but not answered, in order
+        # grpc pulls requests as fast as it can, so the number of batches in flight needs a limit of its own,
+        # otherwise priorities of most batches would be stale before they are sampled.
+        self._slots = threading.Semaphore(prefetch_size)
 
-    def run(self):
+    def _requests(self) -> Iterator[apex_datatype_pb2.ExpsAndPrios]:
         while True:
-            if self.buffer.is_lg_batch_size:
-                with self.lock:
-                    exps, idxs = self.buffer.sample(return_index=True)
-                    prios = self.buffer.get_IS_w().reshape(-1, 1)
-                    td_error = self.learner_stub.SendExperienceGetPriorities(
-                        exps_and_prios2proto(
-                            exps=exps,
-                            prios=prios))
-                    td_error = proto2numpy(td_error)
-                    self.buffer.update(td_error, idxs)
+            self._slots.acquire()
+            request, idxs, versions = self.sampler.queue.get()
+            self._in_flight.append((idxs, versions))
+            yield request
+
+    def run(self):
+        self.sampler.start()
+        for td_error in self.learner_stub.StreamExperienceGetPriorities(self._requests()):
+            idxs, versions = self._in_flight.popleft()
+            self._slots.release()
+            self.buffer.update(proto2numpy(td_error), idxs, versions)
         self.learner_channel.close()
 
 
+class ReportThread(threading.Thread):
+
+    def __init__(self, buffer: ApexBuffer, prefetch_queue: queue.Queue, interval: float):
+        super().__init__(daemon=True)
+        self.buffer = buffer
+        self.prefetch_queue = prefetch_queue
+        self.interval = interval
+
+    def run(self):
+        last_ingested, last_sampled, last_time = 0, 0, time.time()
+        while True:
+            time.sleep(self.interval)
+            ingested, sampled, now = self.buffer.ingested, self.buffer.sampled, time.time()
+            logger.info(f'size: {self.buffer.buffer.size} | '
+                        f'ingest: {(ingested - last_ingested) / (now - last_time):.1f} exps/s | '
+                        f'sample: {(sampled - last_sampled) / (now - last_time):.1f} exps/s | '
+                        f'prefetch: {self.prefetch_queue.qsize()}/{self.prefetch_queue.maxsize} | '
+                        f'dropped priorities: {self.buffer.dropped}')
+            last_ingested, last_sampled, last_time = ingested, sampled, now
+
+
 class BufferServicer(apex_buffer_pb2_grpc.BufferServicer):
 
-    def __init__(self, buffer, lock):
+    def __init__(self, buffer: ApexBuffer):
         self.buffer = buffer
-        self.lock = lock
 
     def SendTrajectories(self, request_iterator: Iterator[apex_datatype_pb2.ListNDarray], context) -> apex_datatype_pb2.Nothing:
         '''
         worker向buffer发送一批trajectory
         '''
         for traj in request_iterator:
-            self.buffer.add(*batch_proto2numpy(traj))
+            self.buffer.add(batch_proto2numpy(traj))
         logger.info('receive Trajectories from worker.')
         return apex_datatype_pb2.Nothing()
 
     def SendExperiences(self, request_iterator: Iterator[apex_datatype_pb2.ExpsAndTDerror], context) -> apex_datatype_pb2.Nothing:
         '''
-        worker向buffer发送一批经验
+        worker向buffer发送一批经验, decoding is done outside of the lock
         '''
-        with self.lock:
-            for request in request_iterator:
-                data, td_error = proto2exps_and_tderror(request)
-                self.buffer.apex_add_batch(td_error, *data)
-            logger.info('receive Experiences from worker.')
+        for request in request_iterator:
+            data, td_error = proto2exps_and_tderror(request)
+            self.buffer.add(data, td_error)
         return apex_datatype_pb2.Nothing()
 
 
@@ -79,16 +180,19 @@ def buffer(
 
     check_port_in_use(port, ip, try_times=10, server_name='buffer')
 
-    buffer = PrioritizedExperienceReplay(**buffer_args)
-    threadLock = threading.Lock()
+    buffer_args = dict(buffer_args)
+    prefetch_size = buffer_args.pop('prefetch_size', 4)
+    report_interval = buffer_args.pop('report_interval', 10)
+    buffer = ApexBuffer(buffer_args)
 
     server = grpc.server(futures.ThreadPoolExecutor())
-    apex_buffer_pb2_grpc.add_BufferServicer_to_server(BufferServicer(buffer=buffer, lock=threadLock), server)
+    apex_buffer_pb2_grpc.add_BufferServicer_to_server(BufferServicer(buffer=buffer), server)
     server.add_insecure_port(':'.join([ip, port]))
     server.start()
     logger.info(colorize('start buffer success.', color='green'))
 
-    learn_thread = LearnThread(learner_ip, learner_port, buffer, threadLock)
+    learn_thread = LearnThread(learner_ip, learner_port, buffer, prefetch_size)
     learn_thread.start()
+    ReportThread(buffer, learn_thread.sampler.queue, report_interval).start()
 
     server.wait_for_termination()
@@ -4,6 +4,7 @@ import threading
 import numpy as np
 
 from concurrent import futures
+from typing import Iterator
 
 from rls.utils.np_utils import (SMA,
                                 arrprint)
@@ -97,15 +98,26 @@ class LearnerServicer(apex_learner_pb2_grpc.LearnerServicer):
         # logger.info('send params to worker.')
         return params
 
-    def SendExperienceGetPriorities(self, request: apex_datatype_pb2.ExpsAndPrios, context) -> apex_datatype_pb2.NDarray:
+    def _learn(self, request: apex_datatype_pb2.ExpsAndPrios) -> apex_datatype_pb2.NDarray:
         data, prios = proto2exps_and_prios(request)
         td_error = numpy2proto(self.model.apex_learn(self.train_step, data, prios))
         self.train_step += 1
         if self.train_step % 100 == 0:
             self.model.save_checkpoint(train_step=self.train_step)
+        return td_error
+
+    def SendExperienceGetPriorities(self, request: apex_datatype_pb2.ExpsAndPrios, context) -> apex_datatype_pb2.NDarray:
+        td_error = self._learn(request)
         logger.info('send new priorities to buffer...')
         return td_error
 
+    def StreamExperienceGetPriorities(self, request_iterator: Iterator[apex_datatype_pb2.ExpsAndPrios], context) -> Iterator[apex_datatype_pb2.NDarray]:
+        '''
+        buffer keeps streaming prefetched batches, new priorities are sent back in the same order.
+        '''
+        for request in request_iterator:
+            yield self._learn(request)
+
 
 def learner(env, model, ip, port):
     check_port_in_use(port, ip, try_times=10, server_name='learner')
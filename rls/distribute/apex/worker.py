@@ -1,7 +1,12 @@
 import grpc
 import time
+import queue
+import threading
 import numpy as np
 
+from typing import (Callable,
+                    List)
+
 from rls.distribute.pb2 import (apex_datatype_pb2,
                                 apex_learner_pb2_grpc,
                                 apex_buffer_pb2,
@@ -9,28 +14,61 @@ from rls.distribute.pb2 import (apex_datatype_pb2,
 from rls.distribute.utils.apex_utils import (numpy2proto,
                                              batch_numpy2proto,
                                              batch_proto2numpy)
+from rls.distribute.utils.numpy import check_compression
 from rls.common.collector import GymCollector
 from rls.utils.logging_utils import get_logger
 logger = get_logger(__name__)
 
 
+class UploadThread(threading.Thread):
+    '''
+    send requests to buffer in background, so that uploading overlaps with the next rollout.
+    the queue is bounded, rollout blocks when buffer cannot keep up with it.
+    '''
+
+    def __init__(self, max_queue_size):
+        super().__init__(daemon=True)
+        self.queue = queue.Queue(maxsize=max_queue_size)
+
+    def put(self, rpc: Callable, requests: List) -> None:
+        self.queue.put((rpc, requests))
+
+    def run(self):
+        while True:
+            rpc, requests = self.queue.get()
+            try:
+                rpc(iter(requests))
+            except grpc.RpcError as e:
+                logger.error(f'send to buffer failed: {e}')
+            finally:
+                self.queue.task_done()
+
+
 class WorkerCls(object):
 
-    def __init__(self, env, model, worker_args, callback_func):
+    def __init__(self, env, model, buffer_stub, worker_args, callback_func):
         self.env = env
         self.model = model
+        self.buffer_stub = buffer_stub
         self.callback_func = callback_func
         for k, v in worker_args.items():
             setattr(self, k, v)
+        self.compression = check_compression(getattr(self, 'compression', 'none'))
+        self.uploader = UploadThread(getattr(self, 'upload_queue_size', 4))
+        self.uploader.start()
 
     def run(self):
         while True:
-            model.set_worker_params(self.callback_func())
+            self.model.set_worker_params(self.callback_func())
             if self.is_send_traj:
-                buffer_stub.SendTrajectories(GymCollector.run_trajectory(env, model))
+                self.uploader.put(self.buffer_stub.SendTrajectories,
+                                  list(GymCollector.run_trajectory(self.env, self.model, compression=self.compression)))
             else:
                 for _ in range(10):
-                    buffer_stub.SendExperiences(GymCollector.run_exps_stream(env, model))
+                    for block in GymCollector.run_exps_stream(self.env, self.model,
+                                                              compression=self.compression,
+                                                              block_size=getattr(self, 'block_size', 256)):
+                        self.uploader.put(self.buffer_stub.SendExperiences, [block])
             time.sleep(self.rollout_interval)
 
 
@@ -53,7 +91,7 @@ def worker(env,
     # arr_list = [np.arange(4).reshape(2, 2), np.arange(3).astype(np.int32), np.array([])]
     # learner_stub.SendBatchNumpyArray(batch_numpy2proto(arr_list))
 
-    workercls = WorkerCls(env, model, worker_args, callback_func=lambda: batch_proto2numpy(learner_stub.GetParams(apex_datatype_pb2.Nothing())))
+    workercls = WorkerCls(env, model, buffer_stub, worker_args, callback_func=lambda: batch_proto2numpy(learner_stub.GetParams(apex_datatype_pb2.Nothing())))
     workercls.run()
 
     learner_channel.close()
@@ -2,6 +2,7 @@
 # Generated by the protocol buffer compiler.  DO NOT EDIT!
 # source: apex_datatype.proto
 
+from google.protobuf.internal import enum_type_wrapper
 from google.protobuf import descriptor as _descriptor
 from google.protobuf import message as _message
 from google.protobuf import reflection as _reflection
@@ -19,9 +20,43 @@ DESCRIPTOR = _descriptor.FileDescriptor(
   syntax='proto3',
   serialized_options=None,
   create_key=_descriptor._internal_create_key,
-  serialized_pb=b'\n\x13\x61pex_datatype.proto\x12\rapex_datatype\"\t\n\x07Nothing\"\x17\n\x07NDarray\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\"\x1b\n\x0bListNDarray\x12\x0c\n\x04\x64\x61ta\x18\x01 \x03(\x0c\"+\n\x0c\x45xpsAndPrios\x12\x0c\n\x04\x64\x61ta\x18\x01 \x03(\x0c\x12\r\n\x05prios\x18\x02 \x01(\x0c\"0\n\x0e\x45xpsAndTDerror\x12\x0c\n\x04\x64\x61ta\x18\x01 \x03(\x0c\x12\x10\n\x08td_error\x18\x02 \x01(\x0c\x62\x06proto3'
+  serialized_pb=b'\n\x13\x61pex_datatype.proto\x12\rapex_datatype\"\t\n\x07Nothing\"f\n\x07NDarray\x12\x0c\n\x04\x64\x61ta\x18\x01 \x01(\x0c\x12\r\n\x05\x64type\x18\x02 \x01(\t\x12\r\n\x05shape\x18\x03 \x03(\x03\x12/\n\x0b\x63ompression\x18\x04 \x01(\x0e\x32\x1a.apex_datatype.Compression\"3\n\x0bListNDarray\x12$\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x16.apex_datatype.NDarray\"[\n\x0c\x45xpsAndPrios\x12$\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x16.apex_datatype.NDarray\x12%\n\x05prios\x18\x02 \x01(\x0b\x32\x16.apex_datatype.NDarray\"`\n\x0e\x45xpsAndTDerror\x12$\n\x04\x64\x61ta\x18\x01 \x03(\x0b\x32\x16.apex_datatype.NDarray\x12(\n\x08td_error\x18\x02 \x01(\x0b\x32\x16.apex_datatype.NDarray**\n\x0b\x43ompression\x12\x08\n\x04NONE\x10\x00\x12\x07\n\x03LZ4\x10\x01\x12\x08\n\x04ZSTD\x10\x02\x62\x06proto3'
 )
 
+_COMPRESSION = _descriptor.EnumDescriptor(
+  name='Compression',
+  full_name='apex_datatype.Compression',
+  filename=None,
+  file=DESCRIPTOR,
+  create_key=_descriptor._internal_create_key,
+  values=[
+    _descriptor.EnumValueDescriptor(
+      name='NONE', index=0, number=0,
+      serialized_options=None,
+      type=None,
+      create_key=_descriptor._internal_create_key),
+    _descriptor.EnumValueDescriptor(
+      name='LZ4', index=1, number=1,
+      serialized_options=None,
+      type=None,
+      create_key=_descriptor._internal_create_key),
+    _descriptor.EnumValueDescriptor(
+      name='ZSTD', index=2, number=2,
+      serialized_options=None,
+      type=None,
+      create_key=_descriptor._internal_create_key),
+  ],
+  containing_type=None,
+  serialized_options=None,
+  serialized_start=397,
+  serialized_end=439,
+)
+_sym_db.RegisterEnumDescriptor(_COMPRESSION)
+
+Compression = enum_type_wrapper.EnumTypeWrapper(_COMPRESSION)
+NONE = 0
+LZ4 = 1
+ZSTD = 2
 
 
 
@@ -65,6 +100,27 @@ _NDARRAY = _descriptor.Descriptor(
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='dtype', full_name='apex_datatype.NDarray.dtype', index=1,
+      number=2, type=9, cpp_type=9, label=1,
+      has_default_value=False, default_value=b"".decode('utf-8'),
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='shape', full_name='apex_datatype.NDarray.shape', index=2,
+      number=3, type=3, cpp_type=2, label=3,
+      has_default_value=False, default_value=[],
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
+    _descriptor.FieldDescriptor(
+      name='compression', full_name='apex_datatype.NDarray.compression', index=3,
+      number=4, type=14, cpp_type=8, label=1,
+      has_default_value=False, default_value=0,
+      message_type=None, enum_type=None, containing_type=None,
+      is_extension=False, extension_scope=None,
+      serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
   ],
   extensions=[
   ],
@@ -78,7 +134,7 @@ _NDARRAY = _descriptor.Descriptor(
   oneofs=[
   ],
   serialized_start=49,
-  serialized_end=72,
+  serialized_end=151,
 )
 
 
@@ -92,7 +148,7 @@ _LISTNDARRAY = _descriptor.Descriptor(
   fields=[
     _descriptor.FieldDescriptor(
       name='data', full_name='apex_datatype.ListNDarray.data', index=0,
-      number=1, type=12, cpp_type=9, label=3,
+      number=1, type=11, cpp_type=10, label=3,
       has_default_value=False, default_value=[],
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
@@ -109,8 +165,8 @@ _LISTNDARRAY = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=74,
-  serialized_end=101,
+  serialized_start=153,
+  serialized_end=204,
 )
 
 
@@ -124,15 +180,15 @@ _EXPSANDPRIOS = _descriptor.Descriptor(
   fields=[
     _descriptor.FieldDescriptor(
       name='data', full_name='apex_datatype.ExpsAndPrios.data', index=0,
-      number=1, type=12, cpp_type=9, label=3,
+      number=1, type=11, cpp_type=10, label=3,
       has_default_value=False, default_value=[],
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
     _descriptor.FieldDescriptor(
       name='prios', full_name='apex_datatype.ExpsAndPrios.prios', index=1,
-      number=2, type=12, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"",
+      number=2, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
@@ -148,8 +204,8 @@ _EXPSANDPRIOS = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=103,
-  serialized_end=146,
+  serialized_start=206,
+  serialized_end=297,
 )
 
 
@@ -163,15 +219,15 @@ _EXPSANDTDERROR = _descriptor.Descriptor(
   fields=[
     _descriptor.FieldDescriptor(
       name='data', full_name='apex_datatype.ExpsAndTDerror.data', index=0,
-      number=1, type=12, cpp_type=9, label=3,
+      number=1, type=11, cpp_type=10, label=3,
       has_default_value=False, default_value=[],
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
     _descriptor.FieldDescriptor(
       name='td_error', full_name='apex_datatype.ExpsAndTDerror.td_error', index=1,
-      number=2, type=12, cpp_type=9, label=1,
-      has_default_value=False, default_value=b"",
+      number=2, type=11, cpp_type=10, label=1,
+      has_default_value=False, default_value=None,
       message_type=None, enum_type=None, containing_type=None,
       is_extension=False, extension_scope=None,
       serialized_options=None, file=DESCRIPTOR,  create_key=_descriptor._internal_create_key),
@@ -187,15 +243,22 @@ _EXPSANDTDERROR = _descriptor.Descriptor(
   extension_ranges=[],
   oneofs=[
   ],
-  serialized_start=148,
-  serialized_end=196,
+  serialized_start=299,
+  serialized_end=395,
 )
 
+_NDARRAY.fields_by_name['compression'].enum_type = _COMPRESSION
+_LISTNDARRAY.fields_by_name['data'].message_type = _NDARRAY
+_EXPSANDPRIOS.fields_by_name['data'].message_type = _NDARRAY
+_EXPSANDPRIOS.fields_by_name['prios'].message_type = _NDARRAY
+_EXPSANDTDERROR.fields_by_name['data'].message_type = _NDARRAY
+_EXPSANDTDERROR.fields_by_name['td_error'].message_type = _NDARRAY
 DESCRIPTOR.message_types_by_name['Nothing'] = _NOTHING
 DESCRIPTOR.message_types_by_name['NDarray'] = _NDARRAY
 DESCRIPTOR.message_types_by_name['ListNDarray'] = _LISTNDARRAY
 DESCRIPTOR.message_types_by_name['ExpsAndPrios'] = _EXPSANDPRIOS
 DESCRIPTOR.message_types_by_name['ExpsAndTDerror'] = _EXPSANDTDERROR
+DESCRIPTOR.enum_types_by_name['Compression'] = _COMPRESSION
 _sym_db.RegisterFileDescriptor(DESCRIPTOR)
 
 Nothing = _reflection.GeneratedProtocolMessageType('Nothing', (_message.Message,), {
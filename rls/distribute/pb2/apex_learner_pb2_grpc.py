@@ -34,6 +34,11 @@ class LearnerStub(object):
                 request_serializer=apex__datatype__pb2.ExpsAndPrios.SerializeToString,
                 response_deserializer=apex__datatype__pb2.NDarray.FromString,
                 )
+        self.StreamExperienceGetPriorities = channel.stream_stream(
+                '/Learner/StreamExperienceGetPriorities',
+                request_serializer=apex__datatype__pb2.ExpsAndPrios.SerializeToString,
+                response_deserializer=apex__datatype__pb2.NDarray.FromString,
+                )
 
 
 class LearnerServicer(object):
@@ -63,6 +68,12 @@ class LearnerServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def StreamExperienceGetPriorities(self, request_iterator, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_LearnerServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -86,6 +97,11 @@ def add_LearnerServicer_to_server(servicer, server):
                     request_deserializer=apex__datatype__pb2.ExpsAndPrios.FromString,
                     response_serializer=apex__datatype__pb2.NDarray.SerializeToString,
             ),
+            'StreamExperienceGetPriorities': grpc.stream_stream_rpc_method_handler(
+                    servicer.StreamExperienceGetPriorities,
+                    request_deserializer=apex__datatype__pb2.ExpsAndPrios.FromString,
+                    response_serializer=apex__datatype__pb2.NDarray.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'Learner', rpc_method_handlers)
@@ -159,3 +175,19 @@ class Learner(object):
             apex__datatype__pb2.NDarray.FromString,
             options, channel_credentials,
             call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def StreamExperienceGetPriorities(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_stream(request_iterator, target, '/Learner/StreamExperienceGetPriorities',
+            apex__datatype__pb2.ExpsAndPrios.SerializeToString,
+            apex__datatype__pb2.NDarray.FromString,
+            options, channel_credentials,
+            call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -3,34 +3,49 @@ import numpy as np
 from typing import List
 
 from rls.distribute.pb2 import apex_datatype_pb2
-from rls.distribute.utils.numpy import (bytes2numpy,
-                                        numpy2bytes,
-                                        batch_bytes2numpy,
-                                        batch_numpy2bytes)
+from rls.distribute.utils.numpy import (compress,
+                                        decompress,
+                                        numpy2buffer,
+                                        buffer2numpy)
 
+_COMPRESSION2PROTO = {
+    'none': apex_datatype_pb2.NONE,
+    'lz4': apex_datatype_pb2.LZ4,
+    'zstd': apex_datatype_pb2.ZSTD
+}
+_PROTO2COMPRESSION = {v: k for k, v in _COMPRESSION2PROTO.items()}
 
-def numpy2proto(arr: np.ndarray) -> apex_datatype_pb2.NDarray:
+
+def numpy2proto(arr: np.ndarray, compression: str = 'none') -> apex_datatype_pb2.NDarray:
     '''
-    TODO: Annotation
+    params:
+        compression: 'none', 'lz4' or 'zstd', only uint8 arrays(i.e. images) are compressed,
+            check it by rls.distribute.utils.numpy.check_compression before sending.
     '''
+    data, dtype, shape = numpy2buffer(arr)
+    if dtype != '|u1':
+        compression = 'none'
     return apex_datatype_pb2.NDarray(
-        data=numpy2bytes(arr)
+        data=compress(data, compression),
+        dtype=dtype,
+        shape=shape,
+        compression=_COMPRESSION2PROTO[compression]
     )
 
 
 def proto2numpy(proto: apex_datatype_pb2.NDarray) -> np.ndarray:
     '''
-    TODO: Annotation
+    decode without copying if not compressed, the returned array is read-only.
     '''
-    return bytes2numpy(proto.data)
+    return buffer2numpy(decompress(proto.data, _PROTO2COMPRESSION[proto.compression]), proto.dtype, proto.shape)
 
 
-def batch_numpy2proto(arr_list: List[np.ndarray]) -> apex_datatype_pb2.ListNDarray:
+def batch_numpy2proto(arr_list: List[np.ndarray], compression: str = 'none') -> apex_datatype_pb2.ListNDarray:
     '''
     TODO: Annotation
     '''
     return apex_datatype_pb2.ListNDarray(
-        data=batch_numpy2bytes(arr_list)
+        data=[numpy2proto(arr, compression) for arr in arr_list]
     )
 
 
@@ -38,32 +53,85 @@ def batch_proto2numpy(proto: apex_datatype_pb2.ListNDarray) -> List[np.ndarray]:
     '''
     TODO: Annotation
     '''
-    return batch_bytes2numpy(proto.data)
+    return [proto2numpy(arr) for arr in proto.data]
 
 
-def exps_and_prios2proto(exps: List[np.ndarray], prios: np.ndarray) -> apex_datatype_pb2.ExpsAndPrios:
+def exps_and_prios2proto(exps: List[np.ndarray], prios: np.ndarray, compression: str = 'none') -> apex_datatype_pb2.ExpsAndPrios:
     return apex_datatype_pb2.ExpsAndPrios(
-        data=batch_numpy2bytes(exps),
-        prios=numpy2bytes(prios)
+        data=[numpy2proto(arr, compression) for arr in exps],
+        prios=numpy2proto(prios)
     )
 
 
 def proto2exps_and_prios(proto: apex_datatype_pb2.ExpsAndPrios):
     return (
-        batch_bytes2numpy(proto.data),
-        bytes2numpy(proto.prios)
+        batch_proto2numpy(proto),
+        proto2numpy(proto.prios)
     )
 
 
-def exps_and_tderror2proto(exps: List[np.ndarray], td_error: np.ndarray) -> apex_datatype_pb2.ExpsAndTDerror:
+def exps_and_tderror2proto(exps: List[np.ndarray], td_error: np.ndarray, compression: str = 'none') -> apex_datatype_pb2.ExpsAndTDerror:
     return apex_datatype_pb2.ExpsAndTDerror(
-        data=batch_numpy2bytes(exps),
-        td_error=numpy2bytes(td_error)
+        data=[numpy2proto(arr, compression) for arr in exps],
+        td_error=numpy2proto(td_error)
     )
 
 
 def proto2exps_and_tderror(proto: apex_datatype_pb2.ExpsAndTDerror):
     return (
-        batch_bytes2numpy(proto.data),
-        bytes2numpy(proto.td_error)
+        batch_proto2numpy(proto),
+        proto2numpy(proto.td_error)
     )
+
+
+if __name__ == "__main__":
+    import time
+    from io import BytesIO
+
+    from rls.distribute.utils.numpy import check_compression
+
+    def old_numpy2bytes(data):
+        nda_bytes = BytesIO()
+        np.save(nda_bytes, data, allow_pickle=False)
+        return nda_bytes.getvalue()
+
+    def old_bytes2numpy(data):
+        return np.load(BytesIO(data), allow_pickle=False)
+
+    def mbps(func, arrs, t=20):
+        nbytes = sum(arr.nbytes for arr in arrs)
+        start = time.time()
+        for _ in range(t):
+            func(arrs)
+        return nbytes * t / (time.time() - start) / 2**20
+
+    # a batch of 32 atari experiences: obs, action, reward, obs_, done
+    obs = np.random.randint(0, 256, (32, 21, 21, 4)).astype(np.uint8).repeat(4, axis=1).repeat(4, axis=2)    # blocky, like frames
+    exps = [obs, np.random.randint(0, 6, (32, 1)), np.random.randn(32, 1).astype(np.float32), obs.copy(), np.zeros((32, 1), dtype=np.float32)]
+    # parameters of nature dqn, ~1.7M float32
+    params = [np.random.randn(*s).astype(np.float32) for s in [(8, 8, 4, 32), (32,), (4, 4, 32, 64), (64,), (3, 3, 64, 64), (64,), (3136, 512), (512,), (512, 6), (6,)]]
+
+    def old_codec(arrs):
+        msg = apex_datatype_pb2.ListNDarray(data=[apex_datatype_pb2.NDarray(data=old_numpy2bytes(arr)) for arr in arrs]).SerializeToString()
+        [old_bytes2numpy(arr.data) for arr in apex_datatype_pb2.ListNDarray.FromString(msg).data]
+
+    def new_codec(compression):
+        def func(arrs):
+            msg = batch_numpy2proto(arrs, compression).SerializeToString()
+            batch_proto2numpy(apex_datatype_pb2.ListNDarray.FromString(msg))
+        return func
+
+    print(f'experience upload, np.save: {mbps(old_codec, exps):.1f}MB/s')
+    for compression in ['none', 'lz4', 'zstd']:
+        if check_compression(compression) == compression:
+            size = batch_numpy2proto(exps, compression).ByteSize()
+            print(f'experience upload, raw bytes + {compression}: {mbps(new_codec(compression), exps):.1f}MB/s, {size / 2**20:.2f}MB per message')
+    print(f'parameter pull, np.save: {mbps(old_codec, params):.1f}MB/s')
+    print(f'parameter pull, raw bytes: {mbps(new_codec("none"), params):.1f}MB/s')
+    # encode + serialize + parse + decode, pure python protobuf
+    # experience upload, np.save: 744.8MB/s
+    # experience upload, raw bytes + none: 1570.9MB/s, 1.72MB per message
+    # experience upload, raw bytes + lz4: 626.3MB/s, 0.20MB per message
+    # experience upload, raw bytes + zstd: 196.3MB/s, 0.15MB per message
+    # parameter pull, np.save: 328.3MB/s
+    # parameter pull, raw bytes: 1808.2MB/s
@@ -1,36 +1,66 @@
 import numpy as np
 
-from io import BytesIO
-from typing import List
+from typing import (List,
+                    Tuple)
 
+from rls.utils.display import colorize
+from rls.utils.logging_utils import get_logger
+logger = get_logger(__name__)
 
-def bytes2numpy(data: bytes) -> np.ndarray:
-    '''
-    TODO: Annotation
-    '''
-    nda_bytes = BytesIO(data)
-    nda = np.load(nda_bytes, allow_pickle=False)
-    return nda
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIONS = ['none', 'lz4', 'zstd']
 
 
-def numpy2bytes(data: np.ndarray) -> bytes:
+def check_compression(method: str) -> str:
     '''
-    TODO: Annotation
+    fall back to 'none' if the library of compression method is not installed.
     '''
-    nda_bytes = BytesIO()
-    np.save(nda_bytes, data, allow_pickle=False)
-    return nda_bytes.getvalue()
+    assert method in COMPRESSIONS, f'compression must be one of {COMPRESSIONS}'
+    if method == 'lz4' and lz4_frame is None:
+        logger.warning(colorize("import lz4 failed, using 'pip install lz4' install it. send arrays without compression.", color='yellow'))
+        return 'none'
+    if method == 'zstd' and zstandard is None:
+        logger.warning(colorize("import zstandard failed, using 'pip install zstandard' install it. send arrays without compression.", color='yellow'))
+        return 'none'
+    return method
+
+
+def compress(data: bytes, method: str) -> bytes:
+    if method == 'lz4':
+        return lz4_frame.compress(data)
+    elif method == 'zstd':
+        return zstandard.ZstdCompressor(level=1).compress(data)
+    return data
+
+
+def decompress(data: bytes, method: str) -> bytes:
+    if method == 'lz4':
+        return lz4_frame.decompress(data)
+    elif method == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
 
 
-def batch_bytes2numpy(data: List[bytes]) -> List[np.ndarray]:
+def numpy2buffer(data: np.ndarray) -> Tuple[bytes, str, List[int]]:
     '''
-    TODO: Annotation
+    return raw bytes in C order, dtype string and shape of an array.
     '''
-    return list(map(bytes2numpy, data))
+    data = np.asarray(data)
+    assert not data.dtype.hasobject, 'arrays of python objects cannot be sent as raw bytes.'
+    return data.tobytes(), data.dtype.str, list(data.shape)
 
 
-def batch_numpy2bytes(data: List[np.ndarray]) -> List[bytes]:
+def buffer2numpy(data: bytes, dtype: str, shape: List[int]) -> np.ndarray:
     '''
-    TODO: Annotation
+    zero-copy view of raw bytes, the returned array is read-only.
     '''
-    return list(map(numpy2bytes, data))
+    return np.frombuffer(data, dtype=np.dtype(dtype)).reshape(shape)
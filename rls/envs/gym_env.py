@@ -87,6 +87,10 @@ class gym_envs(object):
         self.envs = get_vectorized_env_class(self.vector_env_type)(build_env, config, self.n, config['env_seed'])
         self._get_render_index(render_mode)
 
+        # if async_batch_size > 0, envs can be stepped asynchronously by send/recv, recv returns the first async_batch_size envs that finish.
+        self.async_batch_size = int(config.get('async_batch_size', 0))
+        assert 0 <= self.async_batch_size <= self.n, 'async_batch_size must be in range [0, env_num].'
+
     def _initialize(self, env):
         assert isinstance(env.observation_space, (Box, Discrete)) and isinstance(env.action_space, (Box, Discrete)), 'action_space and observation_space must be one of available_type'
         # process observation
@@ -146,6 +150,18 @@ class gym_envs(object):
     def is_continuous(self):
         return self._is_continuous
 
+    @property
+    def is_async(self):
+        return self.async_batch_size > 0
+
+    @property
+    def latency(self):
+        '''
+        mean latency(ms) of recent calls of every operation of the vectorized envs, {op: ms},
+        empty if the backend does not measure it.
+        '''
+        return getattr(self.envs, 'latency', {})
+
     def _get_render_index(self, render_mode):
         '''
         get render windows list, i.e. [0, 1] when there are 4 training enviornment.
@@ -189,44 +205,91 @@ class gym_envs(object):
         '''
         return np.asarray(self.envs.sample())
 
-    def reset(self):
-        obs = np.asarray(self.envs.reset())
+    def reset(self, env_ids=None):
+        '''
+        reset all envs, or only envs of env_ids.
+        '''
+        obs = np.asarray(self.envs.reset([] if env_ids is None else list(env_ids)))
         if self.obs_type == 'visual':
             obs = obs[:, np.newaxis, ...]
-
-        return ModelObservations(vector=self.vector_info_type(*(obs,)),
-                                 visual=self.visual_info_type(*(obs,)))
-
-    def step(self, actions):
+        return self._model_observations(obs)
+
+    def _model_observations(self, obs):
+        if obs.shape[0] == self.n:
+            vector_info_type, visual_info_type = self.vector_info_type, self.visual_info_type
+        else:   # batch of part of envs, i.e. in asynchronous mode
+            vector_info_type = NamedTupleStaticClass.generate_obs_namedtuple(n_agents=obs.shape[0],
+                                                                             item_nums=1 if self.obs_type == 'vector' else 0,
+                                                                             name='vector')
+            visual_info_type = NamedTupleStaticClass.generate_obs_namedtuple(n_agents=obs.shape[0],
+                                                                             item_nums=1 if self.obs_type == 'visual' else 0,
+                                                                             name='visual')
+        return ModelObservations(vector=vector_info_type(*(obs,)),
+                                 visual=visual_info_type(*(obs,)))
+
+    def _convert_actions(self, actions):
         actions = np.array(actions)
         if not self.is_continuous:
             actions = self.discrete_action_list[actions]
             if self.action_type == 'discrete':
                 actions = actions.reshape(-1,)
             elif self.action_type == 'Tuple(Discrete)':
-                actions = actions.reshape(self.n, -1).tolist()
+                actions = actions.reshape(actions.shape[0], -1).tolist()
+        return actions
 
-        results = self.envs.step(actions)
+    def step(self, actions):
+        actions = self._convert_actions(actions)
 
-        obs, reward, done, info = [np.asarray(e) for e in zip(*results)]
-        reward = reward.astype('float32')
+        if self.vector_env_type == GymVectorizedType.MULTIPROCESSING:
+            # envs that are done have been reset inside their worker processes
+            obs, reward, done, info, correct_new_obs = self.envs.step_and_reset(actions)
+        else:
+            results = self.envs.step(actions)
+            obs, reward, done, info = [np.asarray(e) for e in zip(*results)]
+            dones_index = np.where(done)[0]
+            if dones_index.shape[0] > 0:
+                correct_new_obs = self.partial_reset(obs, dones_index)
+            else:
+                correct_new_obs = obs
+        return self._pack(obs, reward, done, info, correct_new_obs)
+
+    def send(self, actions, env_ids):
+        '''
+        asynchronous mode, send actions to envs of env_ids and return immediately.
+        params:
+            actions: actions of envs of env_ids, with the same order
+            env_ids: [K, ], indexes of envs
+        '''
+        assert self.is_async, 'send/recv are only available when async_batch_size > 0.'
+        self.envs.send(self._convert_actions(actions), list(env_ids))
+
+    def recv(self):
+        '''
+        asynchronous mode, wait for the first async_batch_size envs that finish, envs that are done have been reset.
+        return:
+            env_ids: [K, ], indexes of the returned envs
+            SingleModelInformation of these envs, every item has batch size K
+        '''
+        assert self.is_async, 'send/recv are only available when async_batch_size > 0.'
+        env_ids, obs, reward, done, info, reset_obs = zip(*self.envs.recv(self.async_batch_size))
+        env_ids, obs, reward, done, info = [np.asarray(e) for e in (env_ids, obs, reward, done, info)]
         dones_index = np.where(done)[0]
         if dones_index.shape[0] > 0:
-            correct_new_obs = self.partial_reset(obs, dones_index)
+            correct_new_obs = obs.copy()
+            correct_new_obs[dones_index] = np.asarray([reset_obs[i] for i in dones_index])
         else:
             correct_new_obs = obs
+        return env_ids, self._pack(obs, reward, done, info, correct_new_obs)
+
+    def _pack(self, obs, reward, done, info, correct_new_obs):
+        reward = reward.astype('float32')
         if self.obs_type == 'visual':
             obs = obs[:, np.newaxis, ...]
             correct_new_obs = correct_new_obs[:, np.newaxis, ...]
 
-        corrected_obs = ModelObservations(vector=self.vector_info_type(*(correct_new_obs,)),
-                                          visual=self.visual_info_type(*(correct_new_obs,)))
-        obs = ModelObservations(vector=self.vector_info_type(*(obs,)),
-                                visual=self.visual_info_type(*(obs,)))
-
         return SingleModelInformation(
-            corrected_obs=corrected_obs,
-            obs=obs,
+            corrected_obs=self._model_observations(correct_new_obs),
+            obs=self._model_observations(obs),
             reward=reward,
             done=done,
             info=info
@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+import traceback
 import multiprocessing
+import numpy as np
 
 from enum import Enum
-from typing import Dict
+from multiprocessing.connection import wait
+from typing import (Dict,
+                    List,
+                    Tuple)
 
 
 class OP(Enum):
@@ -14,77 +19,204 @@ class OP(Enum):
     RENDER = 3
     SAMPLE = 4
     SEED = 5
+    STEP_AND_RESET = 6
+
+
+class _WorkerError(object):
+    '''
+    an exception raised in a worker, sent back along with its traceback instead of the result.
+    '''
+
+    def __init__(self, exception: Exception, tb: str):
+        self.exception = exception
+        self.traceback = tb
+
+
+def _recv(conn):
+    '''
+    receive the result of a worker, exceptions of the worker are raised again here.
+    '''
+    ret = conn.recv()
+    if isinstance(ret, _WorkerError):
+        raise ret.exception from RuntimeError(f'raised in the env worker:\n{ret.traceback}')
+    return ret
+
+
+def _shm_array(shm, n, shape, dtype) -> np.ndarray:
+    '''
+    zero-copy numpy view of a shared memory block, [n, *shape]
+    '''
+    return np.frombuffer(shm, dtype=dtype).reshape((n,) + tuple(shape))
 
 
 class MultiProcessingEnv:
+    '''
+    Every env runs in its own subprocess. Commands are sent to all workers before any result is collected,
+    so N envs step in parallel. Observations are written by workers into shared memory blocks instead of
+    being pickled through pipes, only rewards, dones and infos go back through pipes.
+    send/recv provide an asynchronous mode that returns whichever envs finish first.
+    '''
+
     def __init__(self, make_func, config: Dict, n, seed):
         self.n = n
         self.idxs = list(range(n))
+
+        # build a temporary env to know the size of shared memory, like gym_envs does to get env specs.
+        env = make_func(config)
+        obs = np.asarray(env.reset())
+        env.close()
+        self._obs_shape, self._obs_dtype = obs.shape, obs.dtype
+
+        nbytes = n * obs.nbytes
+        self._obs_shm = multiprocessing.RawArray('b', nbytes)   # observations returned by step/reset
+        self._reset_obs_shm = multiprocessing.RawArray('b', nbytes)   # observations after auto-reset
+        self._obs = _shm_array(self._obs_shm, n, self._obs_shape, self._obs_dtype)
+        self._reset_obs = _shm_array(self._reset_obs_shm, n, self._obs_shape, self._obs_dtype)
+
         self.parent_conns = []
+        self.processes = []
         for i in range(n):
             parent_conn, child_conn = multiprocessing.Pipe()
-            multiprocessing.Process(target=MultiProcessingEnv.run,
-                                    args=(i,
-                                          make_func,
-                                          config,
-                                          child_conn),
-                                    daemon=True).start()
+            process = multiprocessing.Process(target=MultiProcessingEnv.run,
+                                              args=(i,
+                                                    n,
+                                                    make_func,
+                                                    config,
+                                                    child_conn,
+                                                    self._obs_shm,
+                                                    self._reset_obs_shm,
+                                                    self._obs_shape,
+                                                    self._obs_dtype),
+                                              daemon=True)
+            process.start()
+            child_conn.close()
             self.parent_conns.append(parent_conn)
+            self.processes.append(process)
+        self._conn2idx = {conn: i for i, conn in enumerate(self.parent_conns)}
+        self._waiting = set()   # envs that have been sent actions but not received yet, used by send/recv
 
         self.seed(seeds=[seed + i for i in range(n)])  # [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
 
     @staticmethod
-    def run(i, make_func, config, conn):
+    def run(i, n, make_func, config, conn, obs_shm, reset_obs_shm, obs_shape, obs_dtype):
         env = make_func(config, i)
+        obs_buffer = _shm_array(obs_shm, n, obs_shape, obs_dtype)[i]
+        reset_obs_buffer = _shm_array(reset_obs_shm, n, obs_shape, obs_dtype)[i]
         while True:
             op, data = conn.recv()
-            if op == OP.SEED:
-                env.seed(data)
-                env.action_space.np_random.seed(data)
-            elif op == OP.RESET:
-                conn.send(env.reset())
-            elif op == OP.STEP:
-                conn.send(env.step(data))
-            elif op == OP.RENDER:
-                if data:
-                    env.render(filename=r'videos/{0}-{1}.mp4'.format(env.env.spec.id, i))
-                else:
-                    env.render()
-            elif op == OP.SAMPLE:
-                conn.send(env.action_sample())
-            elif op == OP.CLOSE:
-                env.close()
-                break
+            try:
+                if op == OP.SEED:
+                    env.seed(data)
+                    env.action_space.np_random.seed(data)
+                elif op == OP.RESET:
+                    obs_buffer[...] = np.asarray(env.reset())
+                    conn.send(None)
+                elif op == OP.STEP:
+                    obs, reward, done, info = env.step(data)
+                    obs_buffer[...] = np.asarray(obs)
+                    conn.send((reward, done, info))
+                elif op == OP.STEP_AND_RESET:
+                    obs, reward, done, info = env.step(data)
+                    obs_buffer[...] = np.asarray(obs)
+                    if done:
+                        reset_obs_buffer[...] = np.asarray(env.reset())
+                    conn.send((reward, done, info))
+                elif op == OP.RENDER:
+                    if data:
+                        env.render(filename=r'videos/{0}-{1}.mp4'.format(env.env.spec.id, i))
+                    else:
+                        env.render()
+                elif op == OP.SAMPLE:
+                    conn.send(env.action_sample())
+                elif op == OP.CLOSE:
+                    env.close()
+                    conn.close()
+                    break
+            except Exception as e:  # raised again by the parent, instead of killing the worker
+                conn.send(_WorkerError(e, traceback.format_exc()))
 
     def seed(self, seeds, idxs=[]):
         for idx, conn_idx in enumerate(idxs or self.idxs):
             self.parent_conns[conn_idx].send((OP.SEED, seeds[idx]))
 
     def reset(self, idxs=[]):
-        ret = []
-        for i in (idxs or self.idxs):
+        idxs = idxs or self.idxs
+        for i in idxs:
             self.parent_conns[i].send((OP.RESET, None))
-            ret.append(self.parent_conns[i].recv())
-        return ret
+        for i in idxs:
+            _recv(self.parent_conns[i])
+        return list(self._obs[idxs])
 
     def step(self, actions, idxs=[]):
-        ret = []
-        for idx, conn_idx in enumerate(idxs or self.idxs):
+        idxs = idxs or self.idxs
+        for idx, conn_idx in enumerate(idxs):
             self.parent_conns[conn_idx].send((OP.STEP, actions[idx]))
-            ret.append(self.parent_conns[conn_idx].recv())
-        return ret
+        rets = [_recv(self.parent_conns[conn_idx]) for conn_idx in idxs]
+        return [(obs, *ret) for obs, ret in zip(self._obs[idxs], rets)]
+
+    def step_and_reset(self, actions) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        step all envs, the ones that are done reset themselves inside their workers.
+        return:
+            obs: observations returned by step, [N, *obs_shape]
+            reward: [N, ]
+            done: [N, ]
+            info: [N, ]
+            corrected_obs: like obs, but rows of done envs are replaced by observations after reset
+        '''
+        for conn, action in zip(self.parent_conns, actions):
+            conn.send((OP.STEP_AND_RESET, action))
+        reward, done, info = [np.asarray(e) for e in zip(*[_recv(conn) for conn in self.parent_conns])]
+        # one memcpy out of shared memory, workers overwrite it in the next call.
+        obs = self._obs.copy()
+        dones_index = np.where(done)[0]
+        if dones_index.shape[0] > 0:
+            corrected_obs = obs.copy()
+            corrected_obs[dones_index] = self._reset_obs[dones_index]
+        else:
+            corrected_obs = obs
+        return obs, reward, done, info, corrected_obs
+
+    def send(self, actions, idxs) -> None:
+        '''
+        asynchronous mode, step envs of idxs without waiting for their results.
+        '''
+        for idx, conn_idx in enumerate(idxs):
+            self.parent_conns[conn_idx].send((OP.STEP_AND_RESET, actions[idx]))
+            self._waiting.add(conn_idx)
+
+    def recv(self, batch_size) -> List[Tuple]:
+        '''
+        asynchronous mode, block until batch_size envs have finished their steps, slow envs are left running.
+        return:
+            list of (idx, obs, reward, done, info, reset_obs), reset_obs is None if the env is not done.
+        '''
+        assert batch_size <= len(self._waiting), 'cannot receive more envs than those have been sent actions.'
+        rets = []
+        while len(rets) < batch_size:
+            for conn in wait([self.parent_conns[i] for i in self._waiting]):
+                if len(rets) == batch_size:
+                    break
+                i = self._conn2idx[conn]
+                self._waiting.discard(i)
+                reward, done, info = _recv(conn)
+                # rows of shared memory belong to one worker, and it stays idle until next send.
+                rets.append((i, self._obs[i].copy(), reward, done, info, self._reset_obs[i].copy() if done else None))
+        return rets
 
     def render(self, record=False, idxs=[]):
         for i in (idxs or self.idxs):
             self.parent_conns[i].send((OP.RENDER, record))
 
     def close(self, idxs=[]):
-        for i in (idxs or self.idxs):
+        idxs = idxs or self.idxs
+        for i in idxs:
             self.parent_conns[i].send((OP.CLOSE, None))
+        for i in idxs:
+            self.processes[i].join()
 
     def sample(self, idxs=[]):
-        ret = []
-        for i in (idxs or self.idxs):
+        idxs = idxs or self.idxs
+        for i in idxs:
             self.parent_conns[i].send((OP.SAMPLE, None))
-            ret.append(self.parent_conns[i].recv())
-        return ret
+        return [_recv(self.parent_conns[i]) for i in idxs]
@@ -5,6 +5,8 @@ import ray
 
 from typing import Dict
 
+from rls.envs.gym_wrapper.utils import step_and_reset
+
 
 @ray.remote
 class Env:
@@ -21,6 +23,9 @@ class Env:
     def step(self, action):
         return self.env.step(action)
 
+    def step_and_reset(self, action):
+        return step_and_reset(self.env, action)
+
     def render(self, **kwargs):
         self.env.render(**kwargs)
 
@@ -40,6 +45,7 @@ class RayEnv:
         self.envs = [Env.remote(make_func, config) for _ in range(n)]
         for i in range(n):
             self.envs[i].seed.remote(seed + i)  # [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+        self._waiting = {}  # object ref => env index, used by send/recv
 
     def reset(self, idxs=[]):
         return ray.get([self.envs[i].reset.remote() for i in (idxs or self.idxs)])
@@ -47,6 +53,17 @@ class RayEnv:
     def step(self, actions, idxs=[]):
         return ray.get([self.envs[ray_idx].step.remote(actions[idx]) for idx, ray_idx in enumerate(idxs or self.idxs)])
 
+    def send(self, actions, idxs):
+        for idx, ray_idx in enumerate(idxs):
+            self._waiting[self.envs[ray_idx].step_and_reset.remote(actions[idx])] = ray_idx
+
+    def recv(self, batch_size):
+        '''
+        return the first batch_size envs that finish, [(idx, obs, reward, done, info, reset_obs), ...]
+        '''
+        ready, _ = ray.wait(list(self._waiting.keys()), num_returns=batch_size)
+        return [(self._waiting.pop(ref), *ret) for ref, ret in zip(ready, ray.get(ready))]
+
     def render(self, record=False, idxs=[]):
         for i in (idxs or self.idxs):
             if record:
@@ -1,55 +1,113 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
-import threading
+import os
+import time
+import queue
+import numpy as np
 
+from collections import (defaultdict,
+                         deque)
+from concurrent import futures
+from typing import (Callable,
+                    Dict,
+                    List)
 
-class FakeMultiThread(threading.Thread):
-
-    def __init__(self, make_func, args=()):
-        super().__init__()
-        self.make_func = make_func
-        self.args = args
-
-    def run(self):
-        self.result = self.make_func(*self.args)
-
-    def get_result(self):
-        try:
-            return self.result
-        except Exception:
-            return None
+from rls.envs.gym_wrapper.utils import step_and_reset
 
 
 class MultiThreadEnv:
+    '''
+    Envs are partitioned into contiguous slices, one slice per worker of a long-lived thread pool,
+    and every worker steps its slice as a batch. The main thread handles the first slice itself.
+    Threads only run in parallel when envs release the GIL while stepping, i.e. MuJoCo, Box2D or envs that wait for IO.
+    '''
 
-    def __init__(self, make_func, config, n, seed):
+    def __init__(self, make_func, config: Dict, n, seed):
         self.n = n
         self.idxs = list(range(n))
         self.envs = [make_func(config, idx) for idx in range(n)]
         for i in range(n):
             self.envs[i].seed(seed + i)  # [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
-            self.envs.action_space.np_random.seed(seed + i)
+            self.envs[i].action_space.np_random.seed(seed + i)
+
+        # 0 means one worker per cpu core
+        self.n_workers = min(n, int(config.get('thread_workers', 0)) or os.cpu_count() or 1)
+        self._pool = futures.ThreadPoolExecutor(max_workers=self.n_workers) if self.n_workers > 1 else None
+        self._worker_of_env = np.arange(n) * self.n_workers // n   # [0, 0, 1, 1, 2, 2, ...]
+        self._results = queue.Queue()   # results of asynchronous mode, in order of completion
+        self._latency = defaultdict(lambda: deque(maxlen=100))
+
+    def _partition(self, idxs: List[int]) -> List[List[int]]:
+        '''
+        split positions of idxs by the workers their envs belong to.
+        '''
+        slices = [[] for _ in range(self.n_workers)]
+        for pos, i in enumerate(idxs):
+            slices[self._worker_of_env[i]].append(pos)
+        return [s for s in slices if s]
+
+    def _run(self, op: str, func: Callable, idxs: List[int], args: List = None) -> List:
+        '''
+        call func(env_idx, arg) for every env of idxs, slices of different workers run in parallel.
+        '''
+        start = time.perf_counter()
+        args = args if args is not None else [None] * len(idxs)
+        results = [None] * len(idxs)
+
+        def _run_slice(positions):
+            for pos in positions:
+                results[pos] = func(idxs[pos], args[pos])
+
+        slices = self._partition(idxs)
+        fs = [self._pool.submit(_run_slice, s) for s in slices[1:]] if self._pool is not None else []
+        _run_slice(slices[0] if fs else sum(slices, []))
+        for f in fs:
+            f.result()  # re-raise exceptions of workers
+        self._latency[op].append(time.perf_counter() - start)
+        return results
+
+    @property
+    def latency(self) -> Dict[str, float]:
+        '''
+        mean latency(ms) of the last 100 calls of every operation, recv is the time waiting for envs in asynchronous mode.
+        '''
+        return {op: 1000 * float(np.mean(t)) for op, t in self._latency.items()}
 
     def reset(self, idxs=[]):
-        threadpool = []
-        for i in (idxs or self.idxs):
-            threadpool.append(FakeMultiThread(self.envs[i].reset, args=()))
-        for th in threadpool:
-            th.start()
-        for th in threadpool:
-            th.join()
-        return [th.get_result() for th in threadpool]
+        return self._run('reset', lambda i, _: self.envs[i].reset(), idxs or self.idxs)
 
     def step(self, actions, idxs=[]):
-        threadpool = []
-        for idx, th_idx in enumerate(idxs or self.idxs):
-            threadpool.append(FakeMultiThread(self.envs[th_idx].step, args=(actions[idx],)))
-        for th in threadpool:
-            th.start()
-        for th in threadpool:
-            th.join()
-        return [th.get_result() for th in threadpool]
+        return self._run('step', lambda i, a: self.envs[i].step(a), idxs or self.idxs, list(actions))
+
+    def send(self, actions, idxs):
+        '''
+        asynchronous mode, step envs of idxs in the worker pool, results are pushed once every env finishes.
+        '''
+        def _run_slice(positions):
+            try:
+                for pos in positions:
+                    self._results.put((idxs[pos], *step_and_reset(self.envs[idxs[pos]], actions[pos])))
+            except Exception as e:  # raised again by recv, instead of blocking it forever
+                self._results.put(e)
+
+        for s in self._partition(idxs):
+            if self._pool is not None:
+                self._pool.submit(_run_slice, s)
+            else:
+                _run_slice(s)
+
+    def recv(self, batch_size):
+        '''
+        asynchronous mode, return the first batch_size envs that finish, [(idx, obs, reward, done, info, reset_obs), ...]
+        '''
+        start = time.perf_counter()
+        rets = [self._results.get() for _ in range(batch_size)]
+        self._latency['recv'].append(time.perf_counter() - start)
+        for ret in rets:
+            if isinstance(ret, Exception):
+                raise ret
+        return rets
 
     def render(self, record=False, idxs=[]):
         for i in (idxs or self.idxs):
@@ -59,20 +117,47 @@ class MultiThreadEnv:
                 self.envs[i].render()
 
     def close(self, idxs=[]):
-        threadpool = []
-        for i in (idxs or self.idxs):
-            threadpool.append(FakeMultiThread(self.envs[i].close, args=()))
-        for th in threadpool:
-            th.start()
-        for th in threadpool:
-            th.join()
+        self._run('close', lambda i, _: self.envs[i].close(), idxs or self.idxs)
+        if self._pool is not None and not idxs:
+            self._pool.shutdown(wait=True)
 
     def sample(self, idxs=[]):
-        threadpool = []
-        for i in (idxs or self.idxs):
-            threadpool.append(FakeMultiThread(self.envs[i].action_sample, args=()))
-        for th in threadpool:
-            th.start()
-        for th in threadpool:
-            th.join()
-        return [th.get_result() for th in threadpool]
+        return self._run('sample', lambda i, _: self.envs[i].action_sample(), idxs or self.idxs)
+
+
+if __name__ == "__main__":
+    from rls.envs.gym_wrapper.vector_wrapper import VectorEnv
+
+    class SleepEnv:
+        '''cost 1ms per step without holding the GIL, like envs running in C.'''
+
+        class Space:
+            def __init__(self):
+                self.np_random = np.random.RandomState()
+
+        def __init__(self):
+            self.action_space = self.Space()
+
+        def seed(self, s):
+            pass
+
+        def reset(self):
+            return np.zeros(4, dtype=np.float32)
+
+        def step(self, action):
+            time.sleep(0.001)
+            return np.zeros(4, dtype=np.float32), 1., False, {}
+
+        def close(self):
+            pass
+
+    n, t = 16, 100
+    for env_class in [VectorEnv, MultiThreadEnv]:
+        envs = env_class(lambda config, idx=0: SleepEnv(), dict(thread_workers=8), n, 0)
+        envs.reset()
+        start = time.time()
+        for _ in range(t):
+            envs.step(np.zeros(n))
+        print(env_class.__name__, (time.time() - start) / t)
+        envs.close()
+    # VectorEnv 0.0192, MultiThreadEnv(8 workers) 0.0028
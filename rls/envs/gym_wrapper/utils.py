@@ -125,3 +125,14 @@ def build_env(config: Dict, index: int = 0):
     if not (isinstance(env.observation_space, Box) and len(env.observation_space.shape) == 3):
         env = DtypeEnv(env)
     return env
+
+
+def step_and_reset(env, action):
+    '''
+    step one env and reset it immediately if the episode is done, used by the asynchronous mode of vectorized envs.
+    return:
+        obs, reward, done, info, reset_obs(None if not done)
+    '''
+    obs, reward, done, info = env.step(action)
+    reset_obs = env.reset() if done else None
+    return obs, reward, done, info, reset_obs
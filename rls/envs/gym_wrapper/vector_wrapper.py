@@ -1,6 +1,11 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+from collections import deque
+
+from rls.envs.gym_wrapper.utils import step_and_reset
+
+
 class VectorEnv:
 
     def __init__(self, make_func, config, n, seed):
@@ -10,6 +15,7 @@ class VectorEnv:
         for i in range(n):
             self.envs[i].seed(seed + i)  # [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
             self.envs[i].action_space.np_random.seed(seed + i)
+        self._results = deque()
 
     def reset(self, idxs=[]):
         return [self.envs[i].reset() for i in (idxs or self.idxs)]
@@ -17,6 +23,16 @@ class VectorEnv:
     def step(self, actions, idxs=[]):
         return [self.envs[env_idx].step(actions[idx]) for idx, env_idx in enumerate(idxs or self.idxs)]
 
+    def send(self, actions, idxs):
+        '''
+        asynchronous mode, envs run in the main process, so they are stepped right here.
+        '''
+        for idx, env_idx in enumerate(idxs):
+            self._results.append((env_idx, *step_and_reset(self.envs[env_idx], actions[idx])))
+
+    def recv(self, batch_size):
+        return [self._results.popleft() for _ in range(batch_size)]
+
     def render(self, record=False, idxs=[]):
         for i in (idxs or self.idxs):
             if record:
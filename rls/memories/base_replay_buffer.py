@@ -1,4 +1,6 @@
 
+import numpy as np
+
 from abc import ABC, abstractmethod
 from typing import (Any,
                     NoReturn,
@@ -36,3 +38,19 @@ class ReplayBuffer(ABC):
 
     def update(self, *args) -> Any:
         pass
+
+    def save_checkpoint(self) -> NoReturn:
+        '''
+        save the buffer along with the model, only buffers whose data live on disk support it.
+        '''
+        pass
+
+    def restore(self) -> NoReturn:
+        pass
+
+    def truncate(self, env_ids: Optional[np.ndarray] = None) -> NoReturn:
+        '''
+        called when envs(all envs if env_ids is None) are reset without done,
+        buffers that assemble experiences across steps close them here.
+        '''
+        pass
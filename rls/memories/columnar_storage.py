@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+import os
+import numpy as np
+
+from typing import (Any,
+                    NamedTuple,
+                    NoReturn,
+                    Optional,
+                    Tuple,
+                    Union)
+
+
+def open_memmap(path: str, shape: Tuple[int], dtype: np.dtype) -> np.memmap:
+    '''
+    reopen the .npy file of path without copying if its shape and dtype match, otherwise create a new one.
+    '''
+    if os.path.exists(path):
+        arr = np.lib.format.open_memmap(path, mode='r+')
+        if arr.shape == tuple(shape) and arr.dtype == dtype:
+            return arr
+        del arr
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=tuple(shape))
+
+
+class ColumnarStorage(object):
+    '''
+    Ring storage of (nested) namedtuples, one preallocated array per leaf field.
+    Arrays are allocated lazily, shapes and dtypes are inferred from the first batch.
+    i.e. BatchExperiences(obs=ModelObservations(vector=(v0,), ...), action=a, ...)
+         => v0: [capacity, *v0.shape[1:]], a: [capacity, *a.shape[1:]], ...
+    If memmap_dir is given, every array is a .npy file under it, i.e. memmap_dir/obs.vector.vector_0.npy,
+    so capacity can exceed RAM and the os page cache keeps hot data in memory.
+    Files that already exist are reopened instead of being overwritten if their shapes and dtypes match.
+    '''
+
+    def __init__(self, capacity: int, memmap_dir: Optional[str] = None):
+        assert capacity > 0, 'capacity must larger than zero'
+        self.capacity = capacity
+        self.memmap_dir = memmap_dir
+        self._data = None
+
+    @property
+    def is_built(self) -> bool:
+        return self._data is not None
+
+    @property
+    def data(self) -> Optional[NamedTuple]:
+        return self._data
+
+    @property
+    def nbytes(self) -> int:
+        if not self.is_built:
+            return 0
+        nbytes = []
+        self._map(lambda x: nbytes.append(x.nbytes), self._data)
+        return sum(nbytes)
+
+    def build(self, nt: NamedTuple) -> NoReturn:
+        '''
+        allocate storage from a batch of data, the first axis of every item in nt is the batch axis.
+        '''
+        def _alloc(path, x):
+            x = np.asarray(x)
+            if self.memmap_dir is not None:
+                return open_memmap(os.path.join(self.memmap_dir, f'{path}.npy'), (self.capacity,) + x.shape[1:], x.dtype)
+            # np.zeros lets the os commit pages lazily, which matters for huge visual buffers.
+            return np.zeros((self.capacity,) + x.shape[1:], dtype=x.dtype)
+        self._data = self._map_with_path(_alloc, nt)
+
+    def flush(self) -> NoReturn:
+        '''
+        write changes of memmap files to disk.
+        '''
+        if self.is_built:
+            self._map(lambda x: x.flush() if isinstance(x, np.memmap) else None, self._data)
+
+    def put(self, idxs: Union[int, np.ndarray], nt: NamedTuple) -> NoReturn:
+        '''
+        write nt into slots idxs.
+        idxs: an integer to store a single item, or a 1D index array to store a batch.
+        '''
+        if not self.is_built:
+            if isinstance(idxs, (int, np.integer)):
+                self.build(self._map(lambda x: np.asarray(x)[np.newaxis], nt))
+            else:
+                self.build(nt)
+        self._assign(self._data, nt, idxs)
+
+    def get(self, idxs: Union[np.ndarray, slice]) -> NamedTuple:
+        '''
+        gather items of idxs from every column, return a batch namedtuple.
+        '''
+        assert self.is_built, 'no data in storage now.'
+        return self._map(lambda x: x[idxs], self._data)
+
+    def is_valid(self, idxs: np.ndarray) -> np.ndarray:
+        '''
+        whether items of idxs can be sampled, always true here, see FrameStackedStorage.
+        '''
+        return np.ones(np.shape(idxs), dtype=bool)
+
+    @staticmethod
+    def _map(func, nt: Any) -> Any:
+        '''
+        apply func to every leaf, works for namedtuples as well as plain tuples, i.e. the list of arrays sent by Ape-X workers.
+        '''
+        if isinstance(nt, tuple):
+            x = [ColumnarStorage._map(func, data) for data in nt]
+            return nt.__class__._make(x) if hasattr(nt, '_fields') else tuple(x)
+        else:
+            return func(nt)
+
+    @staticmethod
+    def _map_with_path(func, nt: Any, path: str = '') -> Any:
+        '''
+        like _map, func also receives the path of a leaf, i.e. 'obs.vector.vector_0', items of plain tuples are named by indexs.
+        '''
+        if isinstance(nt, tuple):
+            names = nt._fields if hasattr(nt, '_fields') else [str(i) for i in range(len(nt))]
+            x = [ColumnarStorage._map_with_path(func, data, f'{path}.{name}' if path else name) for name, data in zip(names, nt)]
+            return nt.__class__._make(x) if hasattr(nt, '_fields') else tuple(x)
+        else:
+            return func(path, nt)
+
+    @staticmethod
+    def _assign(dst: Any, src: Any, idxs: Union[int, np.ndarray]) -> NoReturn:
+        if isinstance(dst, tuple):
+            for d, s in zip(dst, src):
+                ColumnarStorage._assign(d, s, idxs)
+        else:
+            dst[idxs] = src
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+import os
+import numpy as np
+
+from collections import deque
+from typing import (NamedTuple,
+                    NoReturn,
+                    Optional,
+                    Union)
+
+from rls.memories.columnar_storage import (ColumnarStorage,
+                                           open_memmap)
+
+
+class FrameRing(object):
+    '''
+    Ring of single frames. A frame is addressed by its write counter(generation), and lives in slot gen % capacity
+    until it is overwritten, so a generation is valid as long as self._gens[gen % capacity] == gen.
+    Frames written recently are indexed by their hash, writing an equal frame again returns the old generation.
+    '''
+
+    def __init__(self, capacity: int, window: int, memmap_path: Optional[str] = None):
+        '''
+        window: only frames among the latest window writes can be reused,
+            it should cover the frames of stack + n_step steps of all envs.
+        memmap_path: keep frames in a .npy file instead of memory, generations are kept in another file next to it,
+            they are always written along with frames, so frames overwritten after the last checkpoint invalidate
+            the transitions that refer to them instead of corrupting them.
+        '''
+        self.capacity = capacity
+        self.window = window
+        self.memmap_path = memmap_path
+        self._frames = None
+        if memmap_path is not None:
+            new = not os.path.exists(memmap_path[:-len('.npy')] + '.gens.npy')
+            self._gens = open_memmap(memmap_path[:-len('.npy')] + '.gens.npy', (capacity,), np.dtype(np.int64))
+            if new:
+                self._gens[:] = -1
+        else:
+            self._gens = np.full(capacity, -1, dtype=np.int64)
+        self._count = int(self._gens.max()) + 1
+        self._recent = {}   # hash of frame -> generation
+        self._recent_queue = deque()    # (hash, generation) in order of writes
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._frames is None else self._frames.nbytes
+
+    def put(self, frame: np.ndarray) -> int:
+        key = hash(frame.tobytes())
+        gen = self._recent.get(key)
+        if gen is not None and self._gens[gen % self.capacity] == gen and np.array_equal(self._frames[gen % self.capacity], frame):
+            return gen
+
+        if self._frames is None:
+            if self.memmap_path is not None:
+                self._frames = open_memmap(self.memmap_path, (self.capacity,) + frame.shape, frame.dtype)
+            else:
+                self._frames = np.zeros((self.capacity,) + frame.shape, dtype=frame.dtype)
+        gen = self._count
+        self._frames[gen % self.capacity] = frame
+        self._gens[gen % self.capacity] = gen
+        self._count += 1
+
+        self._recent[key] = gen
+        self._recent_queue.append((key, gen))
+        while self._recent_queue[0][1] <= self._count - self.window:
+            key, gen_ = self._recent_queue.popleft()
+            if self._recent.get(key) == gen_:
+                del self._recent[key]
+        return gen
+
+    def flush(self) -> NoReturn:
+        if isinstance(self._frames, np.memmap):
+            self._frames.flush()
+        if isinstance(self._gens, np.memmap):
+            self._gens.flush()
+
+    def get(self, gens: np.ndarray) -> np.ndarray:
+        '''
+        gens: [B, stack] => frames: [B, stack, H, W, C]
+        '''
+        return self._frames[gens % self.capacity]
+
+    def is_valid(self, gens: np.ndarray) -> np.ndarray:
+        '''
+        gens: [B, stack] => [B, ], whether all frames of a stack have not been overwritten.
+        '''
+        return (self._gens[gens % self.capacity] == gens).all(-1)
+
+
+class FrameStackedStorage(ColumnarStorage):
+    '''
+    ColumnarStorage that stores every frame of stacked visual observations once.
+    Visual observations of obs and obs_, [B, H, W, C * stack], are cut into frames along the last axis like LazyFrames,
+    frames go to a FrameRing shared by obs and obs_, and only generations of the frames, [B, stack], are kept in columns.
+    obs and obs_ of a transition share stack - 1 frames, and obs_ of a step is obs of the next step,
+    so a transition costs about one frame instead of 2 * stack frames.
+    Stacks are rebuilt by a gather and a transpose when sampling.
+    '''
+
+    def __init__(self, capacity: int, stack: int, frame_capacity: int = None, memmap_dir: Optional[str] = None):
+        '''
+        frame_capacity: defaults to capacity, the oldest transitions may lose their frames a little earlier than themselves,
+            check them by is_valid before sampling.
+        '''
+        super().__init__(capacity, memmap_dir)
+        assert stack > 0, 'stack must larger than zero'
+        self.stack = stack
+        self.frame_capacity = frame_capacity or capacity
+        self._rings = {}    # index of visual observation -> FrameRing
+
+    def _new_ring(self, i: int) -> FrameRing:
+        return FrameRing(self.frame_capacity,
+                         window=min(4096, self.frame_capacity // 2),
+                         memmap_path=os.path.join(self.memmap_dir, f'frames_{i}.npy') if self.memmap_dir is not None else None)
+
+    @property
+    def nbytes(self) -> int:
+        return super().nbytes + sum(ring.nbytes for ring in self._rings.values())
+
+    def flush(self) -> NoReturn:
+        super().flush()
+        for ring in self._rings.values():
+            ring.flush()
+
+    def put(self, idxs: Union[int, np.ndarray], nt: NamedTuple) -> NoReturn:
+        if isinstance(idxs, (int, np.integer)):
+            nt = self._map(lambda x: np.asarray(x)[np.newaxis], nt)
+            idxs = np.asarray([idxs])
+        super().put(idxs, self._replace_visual(nt, self._encode))
+
+    def get(self, idxs: Union[np.ndarray, slice]) -> NamedTuple:
+        return self._replace_visual(super().get(idxs), self._decode)
+
+    def is_valid(self, idxs: np.ndarray) -> np.ndarray:
+        valid = np.ones(np.shape(idxs), dtype=bool)
+        for name in ['obs', 'obs_']:
+            for i, gens in enumerate(getattr(self._data, name).visual):
+                if i in self._rings:
+                    valid &= self._rings[i].is_valid(gens[idxs])
+        return valid
+
+    def _encode(self, i: int, x: np.ndarray) -> np.ndarray:
+        '''
+        [B, H, W, C * stack] => [B, stack]
+        '''
+        if x.ndim != 4:   # i.e. the placeholder [B, 0] of envs without visual observations
+            return x
+        assert x.shape[-1] % self.stack == 0, f'channels of visual observation {x.shape[-1]} cannot be divided by stack {self.stack}.'
+        if i not in self._rings:
+            self._rings[i] = self._new_ring(i)
+        ring = self._rings[i]
+        c = x.shape[-1] // self.stack
+        gens = np.empty(x.shape[:1] + (self.stack,), dtype=np.int64)
+        for b in range(x.shape[0]):
+            for j in range(self.stack):    # oldest to newest
+                gens[b, j] = ring.put(np.ascontiguousarray(x[b, ..., j * c:(j + 1) * c]))
+        return gens
+
+    def _decode(self, i: int, x: np.ndarray) -> np.ndarray:
+        '''
+        [B, stack] => [B, H, W, C * stack]
+        '''
+        if i not in self._rings:
+            return x
+        frames = self._rings[i].get(x)  # [B, stack, H, W, C]
+        B, _, H, W, C = frames.shape
+        return frames.transpose(0, 2, 3, 1, 4).reshape(B, H, W, self.stack * C)
+
+    @staticmethod
+    def _replace_visual(nt: NamedTuple, func) -> NamedTuple:
+        x = {}
+        for name in ['obs', 'obs_']:
+            obs = getattr(nt, name)
+            visual = [func(i, v) for i, v in enumerate(obs.visual)]
+            x[name] = obs._replace(visual=obs.visual.__class__._make(visual))
+        return nt._replace(**x)
@@ -1,80 +1,99 @@
-
 import numpy as np
 
 from typing import (List,
-                    NoReturn)
+                    NoReturn,
+                    Tuple,
+                    Union)
+
+from rls.memories.single_replay_buffers import (ExperienceReplay,
+                                                PrioritizedExperienceReplay)
+from rls.utils.specs import BatchExperiences
 
-from rls.memories.base_replay_buffer import ReplayBuffer
-from rls.utils.specs import (BatchExperiences,
-                             NamedTupleStaticClass)
 
+class MultiAgentExperienceReplay(ExperienceReplay):
+    '''
+    Experiences of all agents of a step are stored as one item, a tuple of BatchExperiences, in the columnar storage,
+    i.e. agent 0's obs.vector.vector_0 => [capacity, ...], agent 1's action => [capacity, ...],
+    so agents share one write pointer and one index vector gathers a batch for every agent at once.
+    '''
 
-class MultiAgentExperienceReplay(ReplayBuffer):
     def __init__(self,
                  n_agents: int,
                  batch_size: int,
                  capacity: int):
         super().__init__(batch_size, capacity)
         self._n_agents = n_agents
-        self._data_pointer = 0
-        self._buffers = np.empty((self._n_agents, capacity), dtype=object)
 
     def add(self, expss: List[BatchExperiences]) -> NoReturn:
         '''
-        change [s, s],[a, a],[r, r] to [s, a, r],[s, a, r] and store every item in it.
+        expss: [agent0's BatchExperiences, agent1's BatchExperiences, ...], every one is a batch of copys, [B, ...]
         '''
-        for exps in zip(*map(lambda x: list(NamedTupleStaticClass.unpack(x)), expss)):
-            for i, exp in enumerate(exps):
-                self._store_op(i, exp)
-            self.update_rb_after_add()
+        assert len(expss) == self._n_agents, 'experiences of every agent are needed'
+        super().add(tuple(expss))
 
-        # for i, exps in enumerate(expss):
-        #     for exp in NamedTupleStaticClass.unpack(exps):
-        #         self._store_op(i, exp)
+    def sample(self) -> List[BatchExperiences]:
+        return list(super().sample())
 
-    def _store_op(self, i, exp: BatchExperiences) -> NoReturn:
-        self._buffers[i, self._data_pointer] = exp
-        # self.update_rb_after_add()
+    def get_all(self) -> List[BatchExperiences]:
+        return list(super().get_all())
 
-    def sample(self) -> BatchExperiences:
+    def save2hdf5(self, *args) -> NoReturn:
+        pass
+
+    def loadhdf5(self, *args) -> NoReturn:
+        pass
+
+
+class MultiAgentPrioritizedExperienceReplay(PrioritizedExperienceReplay):
+    '''
+    PER of MultiAgentExperienceReplay, agents of a step share one priority,
+    eta * max(|td|) + (1 - eta) * mean(|td|) over agents.
+    '''
+
+    def __init__(self,
+                 n_agents: int,
+                 batch_size: int,
+                 capacity: int,
+                 max_train_step: int,
+                 alpha: float,
+                 beta: float,
+                 epsilon: float,
+                 global_v: bool,
+                 eta: float = 0.9):
+        '''
+        eta: 1 means the max td error of agents, 0 means the mean.
+        '''
+        super().__init__(batch_size, capacity, max_train_step, alpha, beta, epsilon, global_v)
+        self._n_agents = n_agents
+        self.eta = eta
+
+    def add(self, expss: List[BatchExperiences]) -> NoReturn:
+        assert len(expss) == self._n_agents, 'experiences of every agent are needed'
+        super().add(tuple(expss))
+
+    def sample(self, return_index: bool = False) -> Union[List[BatchExperiences], Tuple]:
+        if return_index:
+            data, idxs = super().sample(return_index=True)
+            return list(data), idxs
+        return list(super().sample())
+
+    def get_all(self, return_index: bool = False) -> Union[List[BatchExperiences], Tuple]:
+        if return_index:
+            data, idxs = super().get_all(return_index=True)
+            return list(data), idxs
+        return list(super().get_all())
+
+    def update(self,
+               td_errors: List[np.ndarray],
+               index: Union[List, np.ndarray] = None) -> NoReturn:
         '''
-        change [[s, a, r],[s, a, r]] to [[s, s],[a, a],[r, r]]
+        td_errors: td errors of every agent, [B, 1] or [B, ]
         '''
-        n_sample = self.batch_size if self.is_lg_batch_size else self._size
-        idx = np.random.randint(0, self._size, n_sample)
-        t = self._buffers[:, idx]
-        return [NamedTupleStaticClass.pack(_t.tolist()) for _t in t]
-
-    def get_all(self) -> BatchExperiences:
-        return [NamedTupleStaticClass.pack(data.tolist()) for data in self._buffers[:, :self._size]]
-
-    def update_rb_after_add(self) -> NoReturn:
-        self._data_pointer += 1
-        if self._data_pointer >= self.capacity:  # replace when exceed the capacity
-            self._data_pointer = 0
-        if self._size < self.capacity:
-            self._size += 1
-
-    @property
-    def is_full(self) -> bool:
-        return self._size == self.capacity
-
-    @property
-    def size(self) -> int:
-        return self._size
-
-    @property
-    def is_lg_batch_size(self) -> bool:
-        return self._size > self.batch_size
-
-    @property
-    def show_rb(self) -> NoReturn:
-        print('RB size: ', self._size)
-        print('RB capacity: ', self.capacity)
-        print(self._buffers[:, :])
-
-    def save2hdf5(self):
+        td_errors = np.abs(np.stack([np.reshape(td_error, -1) for td_error in td_errors]))     # [N, B]
+        super().update(self.eta * td_errors.max(0) + (1 - self.eta) * td_errors.mean(0), index)
+
+    def save2hdf5(self, *args) -> NoReturn:
         pass
 
-    def loadhdf5(self):
+    def loadhdf5(self, *args) -> NoReturn:
         pass
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+import queue
+import threading
+
+from typing import (Any,
+                    Callable,
+                    NoReturn)
+
+
+class LockedBuffer(object):
+    '''
+    Replay buffer shared by the env loop, the learner and a PrefetchSampler.
+    Methods that change the buffer hold the lock, hold self.lock to read several things at once, i.e. sample then get_IS_w.
+    '''
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.lock = threading.RLock()
+
+    def add(self, *args, **kwargs) -> NoReturn:
+        with self.lock:
+            self.buffer.add(*args, **kwargs)
+
+    def update(self, *args, **kwargs) -> NoReturn:
+        with self.lock:
+            self.buffer.update(*args, **kwargs)
+
+    def truncate(self, *args, **kwargs) -> NoReturn:
+        with self.lock:
+            self.buffer.truncate(*args, **kwargs)
+
+    def save_checkpoint(self) -> NoReturn:
+        with self.lock:
+            self.buffer.save_checkpoint()
+
+    def restore(self) -> NoReturn:
+        with self.lock:
+            self.buffer.restore()
+
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
+
+
+class PrefetchSampler(threading.Thread):
+    '''
+    Keep prefetch_size batches ready in a background thread, so sampling and converting overlap with training steps.
+    sample_func runs in this thread, it should hold the lock of LockedBuffer while reading the buffer.
+    close() stops sampling and joins the thread, i.e. before saving the buffer and at teardown.
+    '''
+
+    def __init__(self, sample_func: Callable[[], Any], prefetch_size: int, poll_secs: float = 0.1):
+        super().__init__(daemon=True)
+        self.sample_func = sample_func
+        self.queue = queue.Queue(maxsize=prefetch_size)
+        self.poll_secs = poll_secs
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                batch = self.sample_func()
+                while not self._stop_event.is_set():    # wait for a free slot, but not after close
+                    try:
+                        self.queue.put(batch, timeout=self.poll_secs)
+                        break
+                    except queue.Full:
+                        pass
+        except Exception as e:  # raised again by get, instead of blocking the learner forever
+            if not self._stop_event.is_set():
+                self.queue.put(e)
+
+    def close(self) -> NoReturn:
+        '''
+        stop sampling and wait for the sample in progress, prefetched batches are dropped.
+        '''
+        self._stop_event.set()
+        if self.is_alive():
+            self.join()
+
+    def get(self) -> Any:
+        batch = self.queue.get()
+        if isinstance(batch, Exception):
+            raise batch
+        return batch
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+import os
 import sys
 import numpy as np
 import tensorflow as tf
 
 from typing import (Any,
+                    Dict,
                     NoReturn,
                     Union,
                     List,
@@ -13,42 +15,91 @@ from typing import (Any,
                     Optional)
 
 from rls.memories.sum_tree import Sum_Tree
+from rls.memories.columnar_storage import ColumnarStorage
+from rls.memories.frame_storage import FrameStackedStorage
 from rls.memories.base_replay_buffer import ReplayBuffer
 from rls.utils.specs import (BatchExperiences,
                              NamedTupleStaticClass)
 from rls.utils.hdf5_utils import *
 
 
+def _build_storage(capacity: int, frame_stack: int, memmap_dir: Optional[str]) -> ColumnarStorage:
+    '''
+    frame_stack: number of frames stacked in visual observations, store every frame once if larger than zero.
+    memmap_dir: keep columns in .npy files under it instead of memory.
+    '''
+    if frame_stack > 0:
+        return FrameStackedStorage(capacity, frame_stack, memmap_dir=memmap_dir)
+    return ColumnarStorage(capacity, memmap_dir)
+
+
+def _save_state(storage: ColumnarStorage, state: Dict[str, np.ndarray]) -> NoReturn:
+    '''
+    flush columns first, then replace the state file atomically, so that the state never points to data not on disk.
+    '''
+    if storage.memmap_dir is None:
+        return
+    storage.flush()
+    os.makedirs(storage.memmap_dir, exist_ok=True)
+    path = os.path.join(storage.memmap_dir, 'state.npz')
+    with open(path + '.tmp', 'wb') as f:
+        np.savez(f, **state)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + '.tmp', path)
+
+
+def _load_state(storage: ColumnarStorage) -> Optional[Dict[str, np.ndarray]]:
+    '''
+    columns are reopened without copying when the first batch is added.
+    '''
+    if storage.memmap_dir is None:
+        return None
+    path = os.path.join(storage.memmap_dir, 'state.npz')
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as f:
+        return dict(f)
+
+
 class ExperienceReplay(ReplayBuffer):
     def __init__(self,
                  batch_size: int,
-                 capacity: int):
+                 capacity: int,
+                 frame_stack: int = 0,
+                 memmap_dir: Optional[str] = None):
         super().__init__(batch_size, capacity)
         self._data_pointer = 0
-        self._buffer = np.empty(capacity, dtype=object)
+        self._storage = _build_storage(capacity, frame_stack, memmap_dir)
 
     def add(self, exps: BatchExperiences) -> NoReturn:
         '''
-        change [s, s],[a, a],[r, r] to [s, a, r],[s, a, r] and store every item in it.
+        write a batch of experiences [s, s],[a, a],[r, r] into the ring storage at once.
         '''
-        for exp in NamedTupleStaticClass.unpack(exps):
-            self._store_op(exp)
+        num = NamedTupleStaticClass.len(exps)
+        idxs = (self._data_pointer + np.arange(num)) % self.capacity
+        self._storage.put(idxs, exps)
+        self._data_pointer = (self._data_pointer + num) % self.capacity
+        self._size = min(self._size + num, self.capacity)
 
     def _store_op(self, exp: BatchExperiences) -> NoReturn:
-        self._buffer[self._data_pointer] = exp
+        self._storage.put(self._data_pointer, exp)
         self.update_rb_after_add()
 
     def sample(self) -> BatchExperiences:
         '''
-        change [[s, a, r],[s, a, r]] to [[s, s],[a, a],[r, r]]
+        gather [[s, s],[a, a],[r, r]] from every column by one index vector.
         '''
         n_sample = self.batch_size if self.is_lg_batch_size else self._size
-        t = np.random.choice(self._buffer[:self._size], size=n_sample, replace=False)
-        # return [np.asarray(e) for e in zip(*t)]
-        return NamedTupleStaticClass.pack(t.tolist())
+        idxs = np.random.randint(0, self._size, n_sample)
+        invalid = ~self._storage.is_valid(idxs)
+        while invalid.any():
+            idxs[invalid] = np.random.randint(0, self._size, invalid.sum())
+            invalid = ~self._storage.is_valid(idxs)
+        return self._storage.get(idxs)
 
     def get_all(self) -> BatchExperiences:
-        return NamedTupleStaticClass.pack(self._buffer[:self._size].tolist())
+        return self._storage.get(np.arange(self._size))
 
     def update_rb_after_add(self) -> NoReturn:
         self._data_pointer += 1
@@ -73,13 +124,27 @@ class ExperienceReplay(ReplayBuffer):
     def show_rb(self) -> NoReturn:
         print('RB size: ', self._size)
         print('RB capacity: ', self.capacity)
-        print(self._buffer[:])
+        print('RB nbytes: ', self._storage.nbytes)
+        if self._storage.is_built:
+            NamedTupleStaticClass.show_shape(self._storage.data)
 
-    def save2hdf5(self):
-        pass
+    def save_checkpoint(self) -> NoReturn:
+        _save_state(self._storage, dict(pointer=self._data_pointer, size=self._size))
+
+    def restore(self) -> NoReturn:
+        state = _load_state(self._storage)
+        if state is not None:
+            self._data_pointer, self._size = int(state['pointer']), int(state['size'])
+
+    def save2hdf5(self, path: str) -> NoReturn:
+        '''
+        export experiences in order of time to a portable hdf5 file.
+        '''
+        idxs = (self._data_pointer - self._size + np.arange(self._size)) % self.capacity
+        namedtuple2hdf5(path, self._storage.get(idxs))
 
-    def loadhdf5(self):
-        pass
+    def loadhdf5(self, path: str) -> NoReturn:
+        self.add(hdf52namedtuple(path, BatchExperiences))
 
 
 class PrioritizedExperienceReplay(ReplayBuffer):
@@ -94,7 +159,9 @@ class PrioritizedExperienceReplay(ReplayBuffer):
                  alpha: float,
                  beta: float,
                  epsilon: float,
-                 global_v: bool):
+                 global_v: bool,
+                 frame_stack: int = 0,
+                 memmap_dir: Optional[str] = None):
         '''
         inputs:
             max_train_step: use for calculating the decay interval of beta
@@ -102,10 +169,12 @@ class PrioritizedExperienceReplay(ReplayBuffer):
             beta: control importance sampling ratio, beta -> 0 means no IS, beta -> 1 means complete IS.
             epsilon: a small positive number that prevents td-error of 0 from never being replayed.
             global_v: whether using the global
+            frame_stack: number of frames stacked in visual observations, store every frame once if larger than zero.
+            memmap_dir: keep experiences in .npy files under it instead of memory.
         '''
         assert epsilon > 0, 'epsilon must larger than zero'
         super().__init__(batch_size, capacity)
-        self.tree = Sum_Tree(capacity)
+        self.tree = Sum_Tree(capacity, _build_storage(capacity, frame_stack, memmap_dir))
         self.alpha = alpha
         self.beta = self.init_beta = beta
         self.beta_interval = (1. - beta) / max_train_step
@@ -125,25 +194,22 @@ class PrioritizedExperienceReplay(ReplayBuffer):
         '''
         input: [ss, visual_ss, as, rs, s_s, visual_s_s, dones]
         '''
-        self.add_batch(list(NamedTupleStaticClass.unpack(exps)))
-        # for data in NamedTupleStaticClass.unpack(exps):
-        #     self._store_op(data)
+        self.add_batch(exps)
 
     def _store_op(self, data: BatchExperiences) -> NoReturn:
         self.tree.add(self.max_p, data)
         if self._size < self.capacity:
             self._size += 1
 
-    def add_batch(self, data: List[BatchExperiences]) -> NoReturn:
-        num = len(data)
+    def add_batch(self, data: BatchExperiences) -> NoReturn:
+        num = NamedTupleStaticClass.len(data)
         self.tree.add_batch(np.full(num, self.max_p), data)
         self._size = min(self._size + num, self.capacity)
 
     def apex_add_batch(self, td_error, *args):
-        data = list(zip(*args))
-        num = len(data)
+        num = len(td_error)
         prios = np.power(np.abs(td_error) + self.epsilon, self.alpha)
-        self.tree.add_batch(prios, data)
+        self.tree.add_batch(prios, args)
         self._size = min(self._size + num, self.capacity)
 
     def sample(self, return_index: bool = False) -> Union[List, Tuple]:
@@ -157,7 +223,6 @@ class PrioritizedExperienceReplay(ReplayBuffer):
         self.last_indexs = idxs
         _min_p = self.min_p if self.global_v and self.min_p < sys.maxsize else p.min()
         self.IS_w = np.power(_min_p / p, self.beta)
-        data = NamedTupleStaticClass.pack(data.tolist())
         if return_index:
             return data, idxs
         else:
@@ -168,7 +233,6 @@ class PrioritizedExperienceReplay(ReplayBuffer):
         self.last_indexs = idxs
         _min_p = self.min_p if self.global_v and self.min_p < sys.maxsize else p.min()
         self.IS_w = np.power(_min_p / p, self.beta)
-        data = NamedTupleStaticClass.pack(data.tolist())
         if return_index:
             return data, idxs
         else:
@@ -200,19 +264,47 @@ class PrioritizedExperienceReplay(ReplayBuffer):
     def get_IS_w(self) -> np.ndarray:
         return self.IS_w
 
+    def save_checkpoint(self) -> NoReturn:
+        _save_state(self.tree.data, dict(tree=self.tree.tree, now=self.tree.now, size=self._size,
+                                         beta=self.beta, min_p=self.min_p, max_p=self.max_p))
+
+    def restore(self) -> NoReturn:
+        state = _load_state(self.tree.data)
+        if state is not None:
+            self.tree.tree[:] = state['tree']
+            self.tree.now, self._size = int(state['now']), int(state['size'])
+            self.tree._size = self._size
+            self.beta, self.min_p, self.max_p = float(state['beta']), float(state['min_p']), float(state['max_p'])
+
+    def save2hdf5(self, path: str) -> NoReturn:
+        '''
+        export experiences in order of time to a portable hdf5 file, priorities are not exported.
+        '''
+        didx = (self.tree.now - self._size + np.arange(self._size)) % self.capacity
+        namedtuple2hdf5(path, self.tree.data.get(didx))
+
+    def loadhdf5(self, path: str) -> NoReturn:
+        self.add(hdf52namedtuple(path, BatchExperiences))
+
     @property
     def size(self) -> int:
         return self._size
 
 
 class NStepWrapper:
+    '''
+    N-step returns of all agents are assembled at once from a circular window of raw experiences, [n_step, agents_num, ...].
+    Every agent has a timeline of its own, so agents can be added in any subsets, i.e. envs that step asynchronously.
+    Windows never cross episode boundaries: they are closed by done flags, and by truncate() when envs are reset without done.
+    '''
+
     def __init__(self,
                  buffer: ReplayBuffer,
                  gamma: float,
                  n_step: int,
                  agents_num: int):
         '''
-        gamma: discount factor
+        gamma: discount factor of one step
         n_step: N time steps
         agents_num: batch experience
         '''
@@ -220,34 +312,60 @@ class NStepWrapper:
         self.n_step = n_step
         self.gamma = gamma
         self.agents_num = agents_num
-        self.queue = [[] for _ in range(agents_num)]
-
-    def add(self, exps: BatchExperiences) -> NoReturn:
-        for i, data in enumerate(NamedTupleStaticClass.unpack(exps)):
-            self._per_store(i, data)
-
-    def _per_store(self, i: int, data: BatchExperiences) -> NoReturn:
-        # TODO: 优化
-        q = self.queue[i]
-        if len(q) == 0:  # 如果Nstep临时经验池为空，就直接添加
-            q.append(data)
-            return
+        self._window = ColumnarStorage(n_step)
+        self._discounts = gamma ** np.arange(n_step)
+        self._ts = np.zeros(agents_num, dtype=np.int64)    # number of steps written into the window of every agent
+        self._lens = np.zeros(agents_num, dtype=np.int64)    # length of the open window of every agent
 
-        if len(q) == self.n_step:
-            self._store_op(q.pop(0))
-        if not NamedTupleStaticClass.check_equal(q[-1].obs_, data.obs):    # 如果截断了，非常规done，把Nstep临时经验池中已存在的经验都存进去，临时经验池清空
-            q.clear()   # 保证经验池中不存在不足N长度的序列，有done的除外，因为（1-done）为0，导致gamma的次方计算不准确也没有关系。
-            q.append(data)
-        else:
-            _len = len(q)
-            for j in range(_len):   # 然后再存入一条最新的经验到Nstep临时经验池
-                q[j] = q[j]._replace(reward=q[j].reward + data.reward * (self.gamma ** (_len - j)))
-                q[j] = q[j]._replace(obs_=data.obs_)
-                q[j] = q[j]._replace(done=data.done)
-            q.append(data)
-            if data.done:  # done or not # 如果新数据是done，就清空临时经验池
-                while q:    # (1-done)会清零不正确的n-step
-                    self._store_op(q.pop())
+    def add(self, exps: BatchExperiences, env_ids: Optional[np.ndarray] = None) -> NoReturn:
+        '''
+        store the oldest step of every full window, and every step of the windows closed by done.
+        env_ids: agents of exps, all agents if None.
+        '''
+        agents = np.arange(self.agents_num) if env_ids is None else np.asarray(env_ids)
+        if not self._window.is_built:
+            self._window.build(ColumnarStorage._map(
+                lambda x: np.empty((1, self.agents_num) + np.shape(x)[1:], np.asarray(x).dtype), exps))
+        self._window.put((self._ts[agents] % self.n_step, agents), exps)
+        self._lens[agents] += 1
+        done = np.asarray(exps.done).reshape(len(agents)) > 0
+
+        full = agents[(self._lens[agents] == self.n_step) & ~done]
+        closed = agents[done]
+        lens = self._lens[closed]
+        items = np.concatenate([full, np.repeat(closed, lens)])
+        # oldest first, the done step comes last
+        offsets = np.arange(lens.sum()) - np.repeat(np.cumsum(lens) - lens, lens)
+        ends = self._ts[items]
+        starts = ends - np.concatenate([np.full(len(full), self.n_step - 1), np.repeat(lens - 1, lens) - offsets])
+        if len(items) > 0:
+            self.buffer.add(self._assemble(items, starts.astype(np.int64), ends))
+
+        self._lens[full] -= 1
+        self._lens[closed] = 0
+        self._ts[agents] += 1
+
+    def _assemble(self, agents: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> BatchExperiences:
+        '''
+        agents, starts, ends: [B, ], agent, first and last step of every transition.
+        '''
+        steps = starts[:, np.newaxis] + np.arange(self.n_step)   # [B, n_step]
+        alive = steps <= ends[:, np.newaxis]
+        data = self._window.get((starts % self.n_step, agents))
+        last = self._window.get((ends % self.n_step, agents))
+        rewards = self._window.data.reward[steps % self.n_step, agents[:, np.newaxis]]    # [B, n_step, ...]
+        weights = (alive * self._discounts).reshape(alive.shape + (1,) * (rewards.ndim - 2))
+        return data._replace(reward=(rewards * weights).sum(1).astype(rewards.dtype),
+                             obs_=last.obs_,
+                             done=last.done)
+
+    def truncate(self, env_ids: Optional[np.ndarray] = None) -> NoReturn:
+        '''
+        called when envs(all envs if env_ids is None) are reset without done, i.e. the episode reaches the max step or a new episode starts.
+        open windows are dropped instead of being stored with less than N steps,
+        because the learner bootstraps them by gamma**N, only windows closed by done are shorter than N, (1-done) makes it harmless.
+        '''
+        self._lens[slice(None) if env_ids is None else env_ids] = 0
 
     def __getattr__(self, name):
         return getattr(self.buffer, name)
@@ -263,9 +381,11 @@ class NStepExperienceReplay(NStepWrapper):
                  capacity: int,
                  gamma: float,
                  n_step: int,
-                 agents_num: int):
+                 agents_num: int,
+                 frame_stack: int = 0,
+                 memmap_dir: Optional[str] = None):
         super().__init__(
-            buffer=ExperienceReplay(batch_size, capacity),
+            buffer=ExperienceReplay(batch_size, capacity, frame_stack, memmap_dir),
             gamma=gamma, n_step=n_step, agents_num=agents_num
         )
 
@@ -285,114 +405,161 @@ class NStepPrioritizedExperienceReplay(NStepWrapper):
                  global_v: bool,
                  gamma: float,
                  n_step: int,
-                 agents_num: int):
+                 agents_num: int,
+                 frame_stack: int = 0,
+                 memmap_dir: Optional[str] = None):
         super().__init__(
-            buffer=PrioritizedExperienceReplay(batch_size, capacity, max_train_step, alpha, beta, epsilon, global_v),
+            buffer=PrioritizedExperienceReplay(batch_size, capacity, max_train_step, alpha, beta, epsilon, global_v, frame_stack, memmap_dir),
             gamma=gamma, n_step=n_step, agents_num=agents_num
         )
 
 
-class EpisodeExperienceReplay(ReplayBuffer):
+class SequenceWrapper:
+    '''
+    Fixed-length overlapping sequences of burn_in_time_step + train_time_step steps for recurrent policies, like R2D2.
+    Steps of every agent go into a circular timeline, [L, agents_num, ...], along with the cell state before the step.
+    A sequence of the latest L steps is cut every train_time_step steps and when an episode ends,
+    then it is stored as one item, [L, ...], with the cell state of its first step, so training starts from the recorded state.
+    Sequences of episodes shorter than L are padded in front, padded steps are zeros and done.
+    '''
 
     def __init__(self,
-                 batch_size: int,
-                 capacity: int,
+                 buffer: ReplayBuffer,
                  agents_num: int,
                  burn_in_time_step: int,
                  train_time_step: int):
-        super().__init__(batch_size, capacity)
+        assert train_time_step > 0, 'train_time_step must larger than zero'
+        self.buffer = buffer
         self.agents_num = agents_num
         self.burn_in_time_step = burn_in_time_step
         self.train_time_step = train_time_step
         self.timestep = burn_in_time_step + train_time_step
-        self.queue = [[] for _ in range(agents_num)]
-        self._data_pointer = 0
-        self._buffer = np.empty(capacity, dtype=object)
+        self._timeline = ColumnarStorage(self.timestep)
+        self._counts = np.zeros(agents_num, dtype=np.int64)    # steps of the current episode of every agent
 
-    def add(self, exps: BatchExperiences) -> NoReturn:
+    def add(self, exps: BatchExperiences, cell_state: Tuple = ()) -> NoReturn:
+        '''
+        cell_state: tuple of [agents_num, ...], the cell state before obs of this step was fed, empty without rnn.
         '''
-        change [s, s],[a, a],[r, r] to [s, a, r],[s, a, r] and store every item in it.
+        item = (exps, tuple(np.asarray(cs) for cs in cell_state))
+        if not self._timeline.is_built:
+            self._timeline.build(ColumnarStorage._map(lambda x: np.asarray(x)[np.newaxis], item))
+        self._timeline.put((self._counts % self.timestep, np.arange(self.agents_num)), item)
+        self._counts += 1
+        done = np.asarray(exps.done).reshape(self.agents_num) > 0
+        self._store(np.where(self._on_stride() | done)[0])
+        self._counts[done] = 0
+
+    def truncate(self, env_ids: Optional[np.ndarray] = None) -> NoReturn:
         '''
-        for i, data in enumerate(NamedTupleStaticClass.unpack(exps)):
-            self._per_store(i, data)
+        envs(all envs if env_ids is None) are reset without done, store the steps not covered by the last sequence of every agent.
+        '''
+        agents = np.arange(self.agents_num) if env_ids is None else np.asarray(env_ids)
+        self._store(agents[(self._counts[agents] > 0) & ~self._on_stride()[agents]])
+        self._counts[agents] = 0
 
-    def _per_store(self, i: int, data: BatchExperiences) -> NoReturn:
-        q = self.queue[i]
-        if len(q) == 0:
-            q.append(data)
-            return
-        if not NamedTupleStaticClass.check_equal(q[-1].obs_, data.obs):
-            self._store_op(q.copy())
-            q.clear()
-            q.append(data)
-            return
-        if data.done:
-            q.append(data)
-            self._store_op(q.copy())
-            q.clear()
+    def _on_stride(self) -> np.ndarray:
+        '''
+        whether a sequence has just been cut for every agent.
+        '''
+        return (self._counts >= self.timestep) & ((self._counts - self.timestep) % self.train_time_step == 0)
+
+    def _store(self, agents: np.ndarray) -> NoReturn:
+        if len(agents) == 0:
             return
-        q.append(data)
+        steps = self._counts[agents, np.newaxis] - self.timestep + np.arange(self.timestep)   # [B, L], negative for padding
+        pad = steps < 0
+        # padded steps point to the first step, so the cell state of the first item is that of the episode start.
+        exps, cell_state = self._timeline.get((np.maximum(steps, 0) % self.timestep, agents[:, np.newaxis]))
 
-    def _store_op(self, data: List[BatchExperiences]) -> NoReturn:
-        self._buffer[self._data_pointer] = data
-        self.update_rb_after_add()
-
-    def update_rb_after_add(self) -> NoReturn:
-        self._data_pointer += 1
-        if self._data_pointer >= self.capacity:  # replace when exceed the capacity
-            self._data_pointer = 0
-        if self._size < self.capacity:
-            self._size += 1
+        def _pad(value):
+            return lambda x: np.where(pad.reshape(pad.shape + (1,) * (x.ndim - 2)), np.asarray(value, dtype=x.dtype), x)
+        exps = ColumnarStorage._map(_pad(0), exps)._replace(done=_pad(1)(exps.done))
+        self.buffer.add((exps, tuple(cs[:, 0] for cs in cell_state)))
 
     def sample(self) -> BatchExperiences:
-        n_sample = self.batch_size if self.is_lg_batch_size else self._size
-        trajs = np.random.choice(self._buffer[:self._size], size=n_sample, replace=False)   # 选n_sample条轨迹
-
-        def f(v, l):    # [B, T, N]
-            return lambda x: tf.keras.preprocessing.sequence.pad_sequences(x, padding='pre', dtype='float32', value=v, maxlen=l, truncating='pre')
-
-        def truncate(traj):
-            idx = np.random.randint(max(1, len(traj) - self.timestep + 1))  # [min, max)
-            return traj[idx:idx + self.timestep]
+        '''
+        return:
+            experiences of the train part, [B * train_time_step, ...],
+            the burn in part and cell states of the first steps are kept for get_burn_in_data and get_burn_in_cell_state,
+            without burn in, the cell states are those of the first train steps, and there is no burn in data.
+        '''
+        exps, self._cell_state = self.buffer.sample()
+        self.burn_in_data = ColumnarStorage._map(lambda x: self._flatten(x[:, :self.burn_in_time_step]), exps) \
+            if self.burn_in_time_step > 0 else None
+        return ColumnarStorage._map(lambda x: self._flatten(x[:, self.burn_in_time_step:]), exps)
 
-        datas = []  # [B, 不定长时间步, N]
-        for traj in trajs:
-            data = NamedTupleStaticClass.pack(truncate(traj))
-            datas.append(data)
+    @staticmethod
+    def _flatten(x: np.ndarray) -> np.ndarray:
+        '''
+        [B, T, ...] => [B * T, ...]
+        '''
+        return x.reshape((x.shape[0] * x.shape[1],) + x.shape[2:])
 
-        sample_data = NamedTupleStaticClass.pack(datas)
-        sample_data = NamedTupleStaticClass.data_convert(f(v=1., l=self.timestep), sample_data, ['done'])   # [B, T, N]
-        sample_data = NamedTupleStaticClass.data_convert(f(v=0., l=self.timestep), sample_data)  # [B, T, N]
+    def get_burn_in_data(self) -> BatchExperiences:
+        return self.burn_in_data
 
-        burn_in_data = NamedTupleStaticClass.data_convert(lambda x: x[:, :self.burn_in_time_step], sample_data)
-        train_data = NamedTupleStaticClass.data_convert(lambda x: x[:, self.burn_in_time_step:], sample_data)
+    def get_burn_in_cell_state(self) -> Tuple[np.ndarray]:
+        return self._cell_state
 
-        self.burn_in_data = NamedTupleStaticClass.data_convert(lambda x: tf.reshape(x, [-1, *x.shape[2:]]), burn_in_data)
-        train_data = NamedTupleStaticClass.data_convert(lambda x: tf.reshape(x, [-1, *x.shape[2:]]), train_data)
+    def __getattr__(self, name):
+        return getattr(self.buffer, name)
 
-        return train_data
 
-    def get_burn_in_data(self) -> BatchExperiences:
-        return self.burn_in_data
+class SequenceExperienceReplay(SequenceWrapper):
+    '''
+    Replay Buffer + Sequence
+    '''
 
-    @property
-    def is_full(self) -> bool:
-        return self._size == self.capacity
+    def __init__(self,
+                 batch_size: int,
+                 capacity: int,
+                 agents_num: int,
+                 burn_in_time_step: int,
+                 train_time_step: int):
+        super().__init__(
+            buffer=ExperienceReplay(batch_size, capacity),
+            agents_num=agents_num, burn_in_time_step=burn_in_time_step, train_time_step=train_time_step
+        )
 
-    @property
-    def size(self) -> int:
-        return self._size
 
-    @property
-    def is_lg_batch_size(self) -> bool:
-        return self._size > self.batch_size
+class PrioritizedSequenceExperienceReplay(SequenceWrapper):
+    '''
+    PER + Sequence, the priority of a sequence is eta * max(|td|) + (1 - eta) * mean(|td|) over its train part.
+    '''
 
-    @property
-    def show_rb(self) -> NoReturn:
-        print('RB size: ', self._size)
-        print('RB capacity: ', self.capacity)
-        print(self._buffer)
+    def __init__(self,
+                 batch_size: int,
+                 capacity: int,
+                 max_train_step: int,
+                 alpha: float,
+                 beta: float,
+                 epsilon: float,
+                 global_v: bool,
+                 agents_num: int,
+                 burn_in_time_step: int,
+                 train_time_step: int,
+                 eta: float = 0.9):
+        '''
+        eta: 1 means the max td error of a sequence, 0 means the mean.
+        '''
+        super().__init__(
+            buffer=PrioritizedExperienceReplay(batch_size, capacity, max_train_step, alpha, beta, epsilon, global_v),
+            agents_num=agents_num, burn_in_time_step=burn_in_time_step, train_time_step=train_time_step
+        )
+        self.eta = eta
 
+    def update(self,
+               td_error: np.ndarray,
+               index: Optional[Union[List, np.ndarray]] = None) -> NoReturn:
+        '''
+        td_error: [B * train_time_step, ]
+        '''
+        td_error = np.abs(td_error).reshape(-1, self.train_time_step)
+        self.buffer.update(self.eta * td_error.max(-1) + (1 - self.eta) * td_error.mean(-1), index)
 
-if __name__ == "__main__":
-    buff = EpisodeExperienceReplay(4, 10, 2)
+    def get_IS_w(self) -> np.ndarray:
+        '''
+        weights of sequences are shared by their steps, [B, ] => [B * train_time_step, ]
+        '''
+        return np.repeat(self.buffer.get_IS_w(), self.train_time_step)
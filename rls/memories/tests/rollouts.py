@@ -0,0 +1,33 @@
+import numpy as np
+
+from collections import deque
+
+from rls.utils.specs import (BatchExperiences,
+                             ModelObservations,
+                             NamedTupleStaticClass)
+
+n, stack = 3, 4
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n, 0, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(n, 1, 'visual')
+
+
+def _obs(frames):
+    return ModelObservations(vector=Vector(), visual=Visual(np.concatenate(frames, axis=-1)))
+
+
+def stacked_rollout(steps):
+    '''
+    stacked observations of n envs like StackEnv, episodes end randomly.
+    '''
+    def new_frame():
+        return np.random.randint(0, 256, (n, 6, 5, 1)).astype(np.uint8)
+    frame = new_frame()
+    queue = deque([frame] * stack, maxlen=stack)
+    for _ in range(steps):
+        obs = _obs(list(queue))
+        queue.append(new_frame())
+        obs_ = _obs(list(queue))
+        done = (np.random.rand(n) < 0.1).astype(np.float32)
+        yield BatchExperiences(obs=obs, action=np.random.randint(0, 2, (n, 1)), reward=np.random.rand(n), obs_=obs_, done=done)
+        if done.any():  # every env resets, to keep the generator simple
+            queue.extend([queue[-1]] * stack)
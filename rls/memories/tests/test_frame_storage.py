@@ -0,0 +1,41 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from rls.memories.columnar_storage import ColumnarStorage
+from rls.memories.frame_storage import FrameStackedStorage
+from rls.memories.single_replay_buffers import NStepExperienceReplay
+from rls.memories.tests.rollouts import (n,
+                                         stack,
+                                         stacked_rollout)
+
+
+def test_frame_stacked_storage():
+    np.random.seed(0)
+    capacity = 60
+    plain, stacked = ColumnarStorage(capacity), FrameStackedStorage(capacity, stack)
+    pointer = 0
+    for exps in stacked_rollout(50):
+        idxs = (pointer + np.arange(n)) % capacity
+        plain.put(idxs, exps)
+        stacked.put(idxs, exps)
+        pointer = (pointer + n) % capacity
+
+    # about one frame per transition, the oldest transitions lost some of their frames.
+    assert stacked._rings[0]._count < 2 * 50 * n
+    valid = stacked.is_valid(np.arange(capacity))
+    assert valid.mean() > 0.5 and valid[(pointer + np.arange(capacity // 2)) % capacity].mean() < 1
+    idxs = np.where(valid)[0]
+    x, y = plain.get(idxs), stacked.get(idxs)
+    assert (x.obs.visual[0] == y.obs.visual[0]).all() and (x.obs_.visual[0] == y.obs_.visual[0]).all()
+    assert (x.action == y.action).all()
+
+
+def test_nstep_frame_stack():
+    np.random.seed(0)
+    buffer = NStepExperienceReplay(batch_size=8, capacity=1000, gamma=0.9, n_step=3, agents_num=n, frame_stack=stack)
+    for exps in stacked_rollout(40):
+        buffer.add(exps)
+    assert buffer.size > 0 and buffer._storage._rings[0]._count < 2 * 40 * n
+    data = buffer.sample()
+    assert data.obs.visual[0].shape == (8, 6, 5, stack) and data.obs_.visual[0].dtype == np.uint8
@@ -0,0 +1,55 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from rls.memories.single_replay_buffers import (ExperienceReplay,
+                                                PrioritizedExperienceReplay)
+from rls.memories.tests.rollouts import (stack,
+                                         stacked_rollout)
+
+
+def _ordered(buffer, get):
+    return get((buffer._data_pointer - buffer.size + np.arange(buffer.size)) % buffer.capacity)
+
+
+def test_memmap_restore(tmp_path):
+    np.random.seed(0)
+    exps = list(stacked_rollout(30))
+    for frame_stack in [0, stack]:
+        memmap_dir = str(tmp_path / f'er{frame_stack}')
+        buffer = ExperienceReplay(8, 50, frame_stack, memmap_dir)
+        for e in exps[:20]:
+            buffer.add(e)
+        buffer.save_checkpoint()
+        saved = _ordered(buffer, buffer._storage.get)
+
+        restored = ExperienceReplay(8, 50, frame_stack, memmap_dir)
+        restored.restore()
+        assert restored.size == buffer.size and restored._data_pointer == buffer._data_pointer
+        restored.add(exps[20])  # files are reopened by the first batch, it overwrites the oldest 3 experiences
+        data = _ordered(restored, restored._storage.get)
+        valid = _ordered(restored, restored._storage.is_valid)[:-3]   # new frames may overwrite frames of the oldest ones
+        assert isinstance(restored._storage.data.action, np.memmap) and valid.any()
+        assert (data.action[:-3] == saved.action[3:]).all()
+        assert (data.obs.visual[0][:-3][valid] == saved.obs.visual[0][3:][valid]).all()
+        assert (data.obs_.visual[0][-3:] == exps[20].obs_.visual[0]).all()
+
+
+def test_memmap_restore_priorities(tmp_path):
+    np.random.seed(0)
+    buffer = PrioritizedExperienceReplay(8, 50, 100, 0.6, 0.4, 0.01, False, memmap_dir=str(tmp_path))
+    for e in stacked_rollout(10):
+        buffer.add(e)
+    _, idxs = buffer.sample(return_index=True)
+    buffer.update(np.random.rand(8), idxs)
+    buffer.save_checkpoint()
+
+    restored = PrioritizedExperienceReplay(8, 50, 100, 0.6, 0.4, 0.01, False, memmap_dir=str(tmp_path))
+    restored.restore()
+    assert (restored.tree.tree == buffer.tree.tree).all() and restored.tree.now == buffer.tree.now
+    assert restored.size == buffer.size and restored.max_p == buffer.max_p and restored.beta == buffer.beta
+
+    buffer.save2hdf5(str(tmp_path / 'exps.h5'))
+    exported = ExperienceReplay(8, 50)
+    exported.loadhdf5(str(tmp_path / 'exps.h5'))
+    assert (exported.get_all().obs.visual[0] == buffer.tree.data.get(np.arange(buffer.size)).obs.visual[0]).all()
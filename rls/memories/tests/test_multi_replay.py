@@ -0,0 +1,54 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from rls.memories.multi_replay_buffers import (MultiAgentExperienceReplay,
+                                               MultiAgentPrioritizedExperienceReplay)
+from rls.utils.specs import (BatchExperiences,
+                             ModelObservations,
+                             NamedTupleStaticClass)
+
+n_agents, n_copys = 3, 4
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n_copys, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(n_copys, 0, 'visual')
+
+
+def _expss(t):
+    '''
+    obs of agent i at step t of copy j is (t * n_copys + j) * 10 + i, agents have observations of different sizes.
+    '''
+    expss = []
+    for i in range(n_agents):
+        ids = ((t * n_copys + np.arange(n_copys)) * 10 + i).astype(np.float32)
+        obs = ModelObservations(vector=Vector(np.repeat(ids[:, np.newaxis], i + 1, -1)), visual=Visual())
+        expss.append(BatchExperiences(obs=obs, action=np.full((n_copys, i + 1), i), reward=ids[:, np.newaxis], obs_=obs, done=np.zeros((n_copys, 1))))
+    return expss
+
+
+def test_aligned_sample():
+    np.random.seed(0)
+    buffer = MultiAgentExperienceReplay(n_agents, 16, 30)
+    for t in range(20):
+        buffer.add(_expss(t))
+    assert buffer.size == 30
+    expss = buffer.sample()
+    assert len(expss) == n_agents
+    for i, exps in enumerate(expss):
+        assert exps.obs.vector[0].shape == (16, i + 1) and (exps.action == i).all()
+        assert (exps.reward[:, 0] // 10 == expss[0].reward[:, 0] // 10).all()    # same steps for every agent
+    assert (expss[0].reward >= (20 * n_copys - 30) * 10).all()  # the oldest ones are overwritten
+
+
+def test_prioritized_sample():
+    np.random.seed(0)
+    buffer = MultiAgentPrioritizedExperienceReplay(n_agents, 16, 30, 100, 0.6, 0.4, 0.01, False, eta=0.9)
+    for t in range(5):
+        buffer.add(_expss(t))
+    expss = buffer.sample()
+    assert all((exps.reward[:, 0] // 10 == expss[0].reward[:, 0] // 10).all() for exps in expss)
+    td_errors = [np.random.randn(16, 1) for _ in range(n_agents)]
+    buffer.update(td_errors)
+    td = np.abs(np.concatenate(td_errors, -1))
+    p = np.power(0.9 * td.max(-1) + 0.1 * td.mean(-1) + 0.01, 0.6)
+    expected = dict(zip(buffer.last_indexs, p))    # an item may be sampled twice, the last priority is kept
+    assert np.allclose(buffer.tree.tree[list(expected.keys())], list(expected.values()))
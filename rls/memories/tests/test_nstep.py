@@ -0,0 +1,84 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from rls.memories.single_replay_buffers import (NStepExperienceReplay,
+                                                NStepPrioritizedExperienceReplay)
+from rls.utils.specs import (BatchExperiences,
+                             ModelObservations,
+                             NamedTupleStaticClass)
+
+n, n_step, gamma, T = 5, 3, 0.9, 60
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n, 1, 'vector')
+
+
+def _obs(x):
+    Visual = NamedTupleStaticClass.generate_obs_namedtuple(len(x), 0, 'visual')
+    return ModelObservations(vector=Vector(x[:, np.newaxis].astype(np.float32)), visual=Visual())
+
+
+def _reference(rewards, dones, truncate_at):
+    '''
+    transitions of every agent, starting at step s and ending at the first done in [s, s + n_step), or s + n_step - 1,
+    windows not closed before an episode is truncated are dropped.
+    '''
+    out = {}
+    for i in range(n):
+        for s in range(T):
+            for e in range(s, s + n_step):
+                if e >= T or any(s < t <= e for t in truncate_at):
+                    break
+                if dones[e, i] or e == s + n_step - 1:
+                    out[s * n + i] = ((gamma ** np.arange(e - s + 1) * rewards[s:e + 1, i]).sum(), (e + 1) * n + i, dones[e, i])
+                    break
+    return out
+
+
+def test_nstep_matches_reference():
+    np.random.seed(0)
+    rewards = np.random.rand(T, n).astype(np.float32)
+    dones = (np.random.rand(T, n) < 0.1).astype(np.float32)
+    truncate_at = [25, 40]  # envs are reset before these steps
+    for cls, args in [(NStepExperienceReplay, (8, 1000)), (NStepPrioritizedExperienceReplay, (8, 1000, 100, 0.6, 0.4, 0.01, False))]:
+        buffer = cls(*args, gamma=gamma, n_step=n_step, agents_num=n)
+        for t in range(T):
+            if t in truncate_at:
+                buffer.truncate()
+            ids = t * n + np.arange(n)
+            buffer.add(BatchExperiences(obs=_obs(ids), action=np.zeros((n, 1)), reward=rewards[t], obs_=_obs(ids + n), done=dones[t]))
+        data = buffer.get_all()
+        got = {int(o): (r, int(o_), d) for o, r, o_, d in zip(data.obs.vector[0][:, 0], data.reward, data.obs_.vector[0][:, 0], data.done)}
+        expected = _reference(rewards, dones, truncate_at)
+        assert got.keys() == expected.keys()
+        for k, (r, o_, d) in expected.items():
+            assert np.isclose(got[k][0], r) and got[k][1:] == (o_, d)
+
+
+def test_nstep_of_envs_stepping_asynchronously():
+    '''
+    envs are added in random subsets, every env keeps its own window, so the result is the same as lock-step adding.
+    '''
+    np.random.seed(1)
+    rewards = np.random.rand(T, n).astype(np.float32)
+    dones = (np.random.rand(T, n) < 0.1).astype(np.float32)
+    truncate_at = [25, 40]
+    buffer = NStepExperienceReplay(8, 1000, gamma=gamma, n_step=n_step, agents_num=n)
+    ts = np.zeros(n, dtype=int)
+    while (ts < T).any():
+        env_ids = np.where((ts < T) & (np.random.rand(n) < 0.5))[0]
+        if len(env_ids) == 0:
+            continue
+        t = ts[env_ids]
+        truncated = env_ids[np.isin(t, truncate_at)]
+        if len(truncated) > 0:
+            buffer.truncate(truncated)
+        ids = (t * n + env_ids).astype(np.float32)
+        buffer.add(BatchExperiences(obs=_obs(ids), action=np.zeros((len(env_ids), 1)), reward=rewards[t, env_ids],
+                                    obs_=_obs(ids + n), done=dones[t, env_ids]), env_ids=env_ids)
+        ts[env_ids] += 1
+    data = buffer.get_all()
+    got = {int(o): (r, int(o_), d) for o, r, o_, d in zip(data.obs.vector[0][:, 0], data.reward, data.obs_.vector[0][:, 0], data.done)}
+    expected = _reference(rewards, dones, truncate_at)
+    assert got.keys() == expected.keys()
+    for k, (r, o_, d) in expected.items():
+        assert np.isclose(got[k][0], r) and got[k][1:] == (o_, d)
@@ -0,0 +1,89 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+import pytest
+
+from rls.memories.on_policy_buffer import DataBuffer
+from rls.utils.specs import (BatchExperiences,
+                             ModelObservations,
+                             NamedTupleStaticClass)
+
+B, T, rnn_time_step = 3, 10, 3
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(B, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(B, 0, 'visual')
+# episodes of env 0: [0, 9], env 1: [0, 2], [3, 5], [6, 9], env 2: [0, 0], [1, 7], [8, 9]
+DONES = {1: [2, 5], 2: [0, 7]}
+
+
+def _rollout(buffer, rnn=False):
+    '''
+    obs of every step is its id, the cell state before a step is its id too.
+    return:
+        ids and dones of the rollout, [T, B]
+    '''
+    ids = (np.arange(T * B).reshape(T, B) + 1).astype(np.float32)
+    done = np.zeros((T, B), dtype=np.float32)
+    for i, ts in DONES.items():
+        done[ts, i] = 1
+    for t in range(T):
+        obs = ModelObservations(vector=Vector(ids[t][:, np.newaxis]), visual=Visual())
+        buffer.add(BatchExperiences(obs=obs, action=np.zeros((B, 1)), reward=ids[t][:, np.newaxis], obs_=obs, done=done[t][:, np.newaxis]))
+        if rnn:
+            buffer.add_cell_state((ids[t][:, np.newaxis], -ids[t][:, np.newaxis]))
+    return ids, done
+
+
+def test_columns_grow_and_getattr():
+    buffer = DataBuffer(n_agents=B, capacity=4)
+    ids, done = _rollout(buffer)
+    assert buffer.eps_len == T and buffer._storage.capacity == 16    # 4 => 8 => 16
+    assert buffer['reward'].shape == (T, B, 1) and (buffer.reward[..., 0] == ids).all()
+    assert (buffer.obs.vector[0][..., 0] == ids).all() and (buffer.done[..., 0] == done).all()
+    with pytest.raises(AttributeError):
+        buffer._not_a_column
+    with pytest.raises(AttributeError):
+        buffer.not_a_column
+
+    buffer.clear()
+    _rollout(buffer)    # arrays are reused after clear
+    assert buffer.eps_len == T and buffer._storage.capacity == 16 and (buffer.reward[..., 0] == ids).all()
+
+
+def test_sample_all_and_generater():
+    np.random.seed(0)
+    buffer = DataBuffer(n_agents=B, batch_size=4)
+    ids, _ = _rollout(buffer)
+    data = buffer.sample_all()
+    assert (data.obs.vector[0][:, 0] == ids.ravel()).all() and (data.reward[:, 0] == ids.ravel()).all()
+
+    sampled = []
+    for data, cs in buffer.sample_generater():
+        assert data.reward.shape[0] <= 4 * B and cs == (None, )
+        assert (data.obs.vector[0] == data.reward).all()    # fields of a sample stay aligned
+        sampled.extend(data.reward[:, 0].tolist())
+    assert sorted(sampled) == ids.ravel().tolist()  # every step once
+
+
+def test_sample_generater_rnn():
+    np.random.seed(0)
+    buffer = DataBuffer(n_agents=B, batch_size=4, rnn_time_step=rnn_time_step, capacity=4)
+    ids, done = _rollout(buffer, rnn=True)
+
+    # episodes not shorter than rnn_time_step hold at most length // 2 windows
+    count = 0
+    for i in range(B):
+        ends = [-1] + np.where(done[:, i])[0].tolist() + [T - 1]
+        count += sum((y - x) // 2 for x, y in zip(ends[:-1], ends[1:]) if y - x >= rnn_time_step)
+    assert count == 5 + (1 + 1 + 2) + 3
+
+    batches = list(buffer.sample_generater_rnn())
+    assert len(batches) == count // 4
+    episode = np.concatenate([np.zeros((1, B)), np.cumsum(done, axis=0)[:-1]])     # episode index of every step
+    where = {ids[t, i]: (t, i) for t in range(T) for i in range(B)}
+    for data, (h, c) in batches:
+        windows = data.obs.vector[0].reshape(4, rnn_time_step)
+        for window, h0, c0 in zip(windows, h[:, 0], c[:, 0]):
+            t, i = where[window[0]]
+            assert (window == ids[t:t + rnn_time_step, i]).all()    # consecutive steps of one env
+            assert len(set(episode[t:t + rnn_time_step, i])) == 1     # that do not cross episodes
+            assert h0 == window[0] and c0 == -window[0]    # cell state before the first step
@@ -0,0 +1,41 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+import pytest
+
+from rls.memories.prefetch_sampler import (LockedBuffer,
+                                           PrefetchSampler)
+from rls.memories.single_replay_buffers import PrioritizedExperienceReplay
+from rls.memories.tests.rollouts import stacked_rollout
+
+
+def test_prefetch_while_adding():
+    np.random.seed(0)
+    buffer = LockedBuffer(PrioritizedExperienceReplay(8, 100, 100, 0.6, 0.4, 0.01, False))
+    exps = list(stacked_rollout(40))
+    for e in exps[:5]:
+        buffer.add(e)
+
+    def sample():
+        with buffer.lock:
+            data, idxs = buffer.sample(return_index=True)
+            return data, idxs, buffer.get_IS_w()
+    sampler = PrefetchSampler(sample, 3)
+    sampler.start()
+    for e in exps[5:]:
+        buffer.add(e)
+        data, idxs, isw = sampler.get()
+        assert data.action.shape == (8, 1) and isw.shape == (8, )
+        buffer.update(np.random.rand(8), idxs)
+    assert buffer.size == 100
+    sampler.close()
+    assert not sampler.is_alive()
+
+
+def test_prefetch_error():
+    def sample():
+        raise ValueError('no data')
+    sampler = PrefetchSampler(sample, 2)
+    sampler.start()
+    with pytest.raises(ValueError):
+        sampler.get()
@@ -0,0 +1,70 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from rls.memories.single_replay_buffers import (SequenceExperienceReplay,
+                                                PrioritizedSequenceExperienceReplay)
+from rls.utils.specs import (BatchExperiences,
+                             ModelObservations,
+                             NamedTupleStaticClass)
+
+n, burn_in, train, T = 4, 3, 5, 100
+Vector = NamedTupleStaticClass.generate_obs_namedtuple(n, 1, 'vector')
+Visual = NamedTupleStaticClass.generate_obs_namedtuple(n, 0, 'visual')
+
+
+def _rollout(buffer):
+    '''
+    obs of every step is its id, the cell state before a step is its id too, so sequences can be checked by ids.
+    return:
+        (agent, index of step in its episode) of every step id.
+    '''
+    steps, idx = {}, np.zeros(n, dtype=np.int64)
+    for t in range(T):
+        if t == 60:
+            buffer.truncate()
+            idx[:] = 0
+        ids = (t * n + np.arange(n) + 1).astype(np.float32)  # 0 is left for padding
+        done = (np.random.rand(n) < 0.05).astype(np.float32)
+        obs = ModelObservations(vector=Vector(ids[:, np.newaxis]), visual=Visual())
+        buffer.add(BatchExperiences(obs=obs, action=np.zeros((n, 1)), reward=ids[:, np.newaxis], obs_=obs, done=done[:, np.newaxis]),
+                   cell_state=(ids[:, np.newaxis], -ids[:, np.newaxis]))
+        for i in range(n):
+            steps[ids[i]] = (i, idx[i])
+        idx = np.where(done > 0, 0, idx + 1)
+    return steps
+
+
+def test_sequence_replay():
+    np.random.seed(0)
+    buffer = SequenceExperienceReplay(8, 1000, n, burn_in, train)
+    steps = _rollout(buffer)
+    exps, cell_state = buffer.buffer.get_all()
+    ids, done = exps.obs.vector[0][..., 0], exps.done[..., 0]     # [B, L]
+    assert ids.shape[1] == burn_in + train
+    trained = set()
+    for seq, d, h, c in zip(ids, done, *cell_state):
+        real = seq[seq > 0]
+        assert (seq[:len(seq) - len(real)] == 0).all() and (d[:len(seq) - len(real)] == 1).all()     # padded in front
+        assert len({steps[i][0] for i in real}) == 1 and (np.diff(real) == n).all()    # consecutive steps of one agent
+        assert h[0] == real[0] and c[0] == -real[0]    # cell state of the first real step
+        trained.update(seq[burn_in:][seq[burn_in:] > 0].tolist())
+    assert all(i in trained for i, (_, idx) in steps.items() if idx >= burn_in and i <= (T - burn_in - train) * n)
+
+    data = buffer.sample()
+    assert data.obs.vector[0].shape == (8 * train, 1) and buffer.get_burn_in_data().obs.vector[0].shape == (8 * burn_in, 1)
+    assert buffer.get_burn_in_cell_state()[0].shape == (8, 1)
+
+
+def test_prioritized_sequence_replay():
+    np.random.seed(0)
+    buffer = PrioritizedSequenceExperienceReplay(8, 1000, 100, 0.6, 0.4, 0.01, False, n, burn_in, train, eta=0.9)
+    _rollout(buffer)
+    buffer.sample()
+    assert buffer.get_IS_w().shape == (8 * train, )
+    td_error = np.random.rand(8 * train)
+    buffer.update(td_error)
+    td_error = td_error.reshape(8, train)
+    p = np.power(0.9 * td_error.max(-1) + 0.1 * td_error.mean(-1) + 0.01, 0.6)
+    expected = dict(zip(buffer.last_indexs, p))    # a sequence may be sampled twice, the last priority is kept
+    assert np.allclose(buffer.tree.tree[list(expected.keys())], list(expected.values()))
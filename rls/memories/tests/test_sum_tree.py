@@ -0,0 +1,56 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+
+from collections import namedtuple
+
+from rls.memories import sum_tree
+from rls.memories.sum_tree import Sum_Tree
+
+Exps = namedtuple('Exps', 'obs, action')
+
+
+def _check_sums(tree):
+    level_start = tree.tree_data_offset
+    while level_start > 1:
+        level_start >>= 1
+        parents = np.arange(level_start, 2 * level_start)
+        assert (tree.tree[parents] == tree.tree[2 * parents] + tree.tree[2 * parents + 1]).all()
+
+
+def _run_sum_tree():
+    capacity = 1000
+    tree = Sum_Tree(capacity)
+    tree.add_batch(np.random.rand(600), Exps(obs=np.arange(600)[:, None] * np.ones((1, 3)), action=np.arange(600)))
+    tree.add_batch(np.random.rand(600), Exps(obs=np.arange(600, 1200)[:, None] * np.ones((1, 3)), action=np.arange(600, 1200)))
+    assert tree._size == capacity and tree.now == 200
+    _check_sums(tree)
+
+    # repeated leaves share parents, the last write wins
+    idxs = np.random.randint(0, capacity, 512)
+    idxs[-1] = idxs[0]
+    prios = np.random.rand(512)
+    tree._updatetree_batch(idxs + tree.tree_data_offset, prios)
+    assert tree.tree[idxs[0] + tree.tree_data_offset] == prios[-1]
+    _check_sums(tree)
+
+    leaves = tree.tree[tree.tree_data_offset:tree.tree_data_offset + capacity]
+    ps = np.random.uniform(0, tree.total, 256)
+    tidx, didx, p, d = tree.get_batch_parallel(ps)
+    assert (didx == np.searchsorted(np.cumsum(leaves), ps, side='right')).all()
+    assert (p == leaves[didx]).all()
+    assert (d.action == np.where(didx < 200, didx + 1000, didx)).all()
+    assert (d.obs[:, 0] == d.action).all()
+
+
+def test_sum_tree():
+    _run_sum_tree()
+
+
+def test_sum_tree_without_numba():
+    kernels = sum_tree._retrieve_kernel, sum_tree._update_kernel
+    sum_tree._retrieve_kernel = sum_tree._update_kernel = None
+    try:
+        _run_sum_tree()
+    finally:
+        sum_tree._retrieve_kernel, sum_tree._update_kernel = kernels
@@ -5,7 +5,8 @@ import tensorflow as tf
 from tensorflow.keras import Sequential
 from tensorflow.python.framework import tensor_shape
 from tensorflow.python.keras import activations
-from tensorflow.keras.layers import (Dense,
+from tensorflow.keras.layers import (Layer,
+                                     Dense,
                                      GaussianNoise,
                                      Conv2D,
                                      Flatten)
@@ -49,6 +50,68 @@ class mlp_with_noisy(Sequential):
             self.add(Dense(output_shape, out_activation, **initKernelAndBias))
 
 
+class StackedDense(Layer):
+    '''
+    `stack` independent Dense layers evaluated by one batched matmul, i.e. networks of a group of agents or an ensemble.
+    input: [stack, B, in] => [stack, B, units], or [B, in] fed to every member, like the first layer of an ensemble.
+    every member is initialized like a Dense layer of its own.
+    '''
+
+    def __init__(self, stack, units, activation=None, kernel_initializer='glorot_uniform', bias_initializer='zeros', **kwargs):
+        super().__init__(**kwargs)
+        self.stack = stack
+        self.units = units
+        self.activation = activations.get(activation)
+        self.kernel_initializer = tf.keras.initializers.get(kernel_initializer)
+        self.bias_initializer = tf.keras.initializers.get(bias_initializer)
+
+    def _stacked_initializer(self, initializer):
+        def init(shape, dtype=None):
+            return tf.stack([initializer(shape[1:], dtype=dtype) for _ in range(shape[0])])
+        return init
+
+    def build(self, input_shape):
+        last_dim = tensor_shape.dimension_value(input_shape[-1])
+        self.kernel = self.add_weight(
+            'kernel',
+            shape=[self.stack, last_dim, self.units],
+            initializer=self._stacked_initializer(self.kernel_initializer),
+            dtype=self.dtype,
+            trainable=True)
+        self.bias = self.add_weight(
+            'bias',
+            shape=[self.stack, self.units],
+            initializer=self._stacked_initializer(self.bias_initializer),
+            dtype=self.dtype,
+            trainable=True)
+        self.built = True
+
+    def call(self, inputs):
+        if inputs.shape.rank == 2:
+            outputs = tf.einsum('bi,sio->sbo', inputs, self.kernel)
+        else:
+            outputs = tf.einsum('sbi,sio->sbo', inputs, self.kernel)
+        return self.activation(outputs + self.bias[:, tf.newaxis])
+
+
+class stacked_mlp(Sequential):
+    def __init__(self, stack, hidden_units, *, act_fn=default_activation, output_shape=1, out_activation=None, out_layer=True):
+        """
+        mlp of `stack` members with the same architecture, made of StackedDense layers.
+        Args:
+            stack: number of members, the leading axis of inputs and outputs
+            hidden_units: like [32, 32]
+            output_shape: units of last layer
+            out_activation: activation function of last layer
+            out_layer: whether need specifing last layer or not
+        """
+        super().__init__()
+        for u in hidden_units:
+            self.add(StackedDense(stack, u, act_fn, **initKernelAndBias))
+        if out_layer:
+            self.add(StackedDense(stack, output_shape, out_activation, **initKernelAndBias))
+
+
 class Noisy(Dense):
     '''
     Noisy Net: https://arxiv.org/abs/1706.10295
@@ -8,7 +8,8 @@ from tensorflow.keras import Input as I
 from tensorflow.keras.layers import Dense
 
 from rls.nn.layers import (Noisy,
-                           mlp)
+                           mlp,
+                           stacked_mlp)
 from rls.utils.specs import OutputNetworkType
 from rls.utils.tf2_utils import clip_nn_log_std
 
@@ -35,11 +36,27 @@ def get_output_network_from_type(network_type: OutputNetworkType):
         OutputNetworkType.C51_DISTRIBUTIONAL: C51Distributional,
         OutputNetworkType.QRDQN_DISTRIBUTIONAL: QrdqnDistributional,
         OutputNetworkType.RAINBOW_DUELING: RainbowDueling,
-        OutputNetworkType.IQN_NET: IqnNet
+        OutputNetworkType.IQN_NET: IqnNet,
+        OutputNetworkType.CRITIC_VALUE_ENSEMBLE: CriticValueEnsemble,
+        OutputNetworkType.CRITIC_QVALUE_ONE_ENSEMBLE: CriticQvalueOneEnsemble,
+        OutputNetworkType.CRITIC_QVALUE_ALL_ENSEMBLE: CriticQvalueAllEnsemble
     }
     return OUTPUT_NETWORKS.get(network_type, OUTPUT_NETWORKS[OutputNetworkType.ACTOR_CTS])
 
 
+def get_ensemble_network_type(network_type: OutputNetworkType) -> OutputNetworkType:
+    '''
+    the type of output network that evaluates an ensemble of `network_type` networks together, it takes an extra `ensemble` argument.
+    '''
+    ENSEMBLE_NETWORK_TYPES = {
+        OutputNetworkType.CRITIC_VALUE: OutputNetworkType.CRITIC_VALUE_ENSEMBLE,
+        OutputNetworkType.CRITIC_QVALUE_ONE: OutputNetworkType.CRITIC_QVALUE_ONE_ENSEMBLE,
+        OutputNetworkType.CRITIC_QVALUE_ALL: OutputNetworkType.CRITIC_QVALUE_ALL_ENSEMBLE
+    }
+    assert network_type in ENSEMBLE_NETWORK_TYPES, f'{network_type} has no ensemble version'
+    return ENSEMBLE_NETWORK_TYPES[network_type]
+
+
 class ActorDPG(M):
     '''
     use for DDPG and/or TD3 algorithms' actor network.
@@ -99,11 +116,8 @@ class ActorMuLogstd(M):
         if self.condition_sigma:
             log_std = self.log_std(x)
         else:
-            log_std = self.log_std
+            log_std = tf.tile(self.log_std, [tf.shape(mu)[0], 1])  # [1, N] => [B, N], B may be unknown in graph
         log_std = tf.clip_by_value(log_std, self.log_std_min, self.log_std_max)
-        batch_size = mu.shape[0]
-        if batch_size:
-            log_std = tf.tile(log_std, [batch_size, 1])  # [1, N] => [B, N]
         return (mu, log_std)
 
 
@@ -244,15 +258,67 @@ class CriticQvalueAll(M):
 class CriticQvalueBootstrap(M):
     '''
     use for bootstrapped dqn.
+    heads are stacked, all of them are evaluated by one batched matmul per layer.
     '''
 
     def __init__(self, vector_dim, output_shape, head_num, network_settings):
         super().__init__()
-        self.nets = [mlp(network_settings, output_shape=output_shape, out_activation=None) for _ in range(head_num)]
+        self.net = stacked_mlp(head_num, network_settings, output_shape=output_shape, out_activation=None)
         self(I(shape=vector_dim))
 
     def call(self, x):
-        q = tf.stack([net(x) for net in self.nets])  # [H, B, A]
+        q = self.net(x)  # [H, B, A]
+        return q
+
+
+class CriticValueEnsemble(M):
+    '''
+    `ensemble` critics like CriticValue, weights of members are stacked and evaluated by one batched matmul per layer.
+    input: vector of state
+    output: v(s) of all members, [N, B, 1]
+    '''
+
+    def __init__(self, vector_dim, network_settings, ensemble=2):
+        super().__init__()
+        self.net = stacked_mlp(ensemble, network_settings, output_shape=1, out_activation=None)
+        self(I(shape=vector_dim))
+
+    def call(self, x):
+        v = self.net(x)
+        return v
+
+
+class CriticQvalueOneEnsemble(M):
+    '''
+    `ensemble` critics like CriticQvalueOne, i.e. twin critics of TD3/SAC, weights of members are stacked.
+    input: tf.concat((state, action),axis = 1)
+    output: q(s,a) of all members, [N, B, 1]
+    '''
+
+    def __init__(self, vector_dim, action_dim, network_settings, ensemble=2):
+        super().__init__()
+        self.net = stacked_mlp(ensemble, network_settings, output_shape=1, out_activation=None)
+        self(I(shape=vector_dim), I(shape=action_dim))
+
+    def call(self, x, a):
+        q = self.net(tf.concat((x, a), axis=-1))
+        return q
+
+
+class CriticQvalueAllEnsemble(M):
+    '''
+    `ensemble` critics like CriticQvalueAll, weights of members are stacked.
+    input: vector of state
+    output: q(s, *) of all members, [N, B, A]
+    '''
+
+    def __init__(self, vector_dim, output_shape, network_settings, out_activation=None, ensemble=2):
+        super().__init__()
+        self.net = stacked_mlp(ensemble, network_settings, output_shape=output_shape, out_activation=out_activation)
+        self(I(shape=vector_dim))
+
+    def call(self, x):
+        q = self.net(x)
         return q
 
 
@@ -379,10 +445,7 @@ class ActorCriticValueCts(M):
         if self.condition_sigma:
             log_std = self.log_std(x_mu_logstd)
         else:
-            log_std = self.log_std
-            batch_size = mu.shape[0]
-            if batch_size:
-                log_std = tf.tile(log_std, [batch_size, 1])  # [1, N] => [B, N]
+            log_std = tf.tile(self.log_std, [tf.shape(mu)[0], 1])  # [1, N] => [B, N], B may be unknown in graph
         log_std = tf.clip_by_value(log_std, self.log_std_min, self.log_std_max)
         return (mu, log_std, v)
 
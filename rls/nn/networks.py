@@ -15,7 +15,8 @@ from tensorflow.keras.layers import (Conv2D,
                                      Dense,
                                      BatchNormalization)
 
-from rls.nn.layers import ConvLayer
+from rls.nn.layers import (ConvLayer,
+                           stacked_mlp)
 from rls.nn.activations import default_activation
 from rls.nn.initializers import initKernelAndBias
 from rls.utils.specs import (VectorNetworkType,
@@ -31,6 +32,17 @@ def get_vector_network_from_type(network_type: VectorNetworkType):
     return VECTOR_NETWORKS.get(network_type, VECTOR_NETWORKS[VectorNetworkType.CONCAT])
 
 
+def get_stacked_vector_network(stack, in_dim, network_type: VectorNetworkType):
+    '''
+    `stack` vector networks of network_type, stacked along the leading axis by rls.nn.layers.stacked_mlp,
+    weights of every member are in the same order as the network of get_vector_network_from_type.
+    '''
+    if network_type == VectorNetworkType.ADAPTIVE:
+        return stacked_mlp(stack, VectorAdaptiveNetwork.get_units(in_dim), out_layer=False)
+    else:
+        return lambda x: x
+
+
 def get_visual_network_from_type(network_type: VisualNetworkType):
     VISUAL_NETWORKS = {
         VisualNetworkType.SIMPLE: lambda: ConvLayer(Conv2D, [16, 32], [[8, 8], [4, 4]], [[4, 4], [2, 2]], padding='valid', activation='elu'),
@@ -60,14 +72,19 @@ class VectorAdaptiveNetwork(Sequential):
         assert 'in_dim' in kwargs.keys(), "assert dim in kwargs.keys()"
         self.in_dim = int(kwargs['in_dim'])
         self.h_dim = self.out_dim = int(kwargs.get('out_dim', 16))
-        x = math.log2(self.out_dim)
-        y = math.log2(self.in_dim)
+        for u in self.get_units(self.in_dim, self.out_dim):
+            self.add(Dense(u, default_activation, **initKernelAndBias))
+
+    @staticmethod
+    def get_units(in_dim, out_dim=16):
+        '''
+        units of all layers, halving from the power of 2 below in_dim down to out_dim.
+        '''
+        x = math.log2(out_dim)
+        y = math.log2(in_dim)
         l = math.ceil(x) + 1 if math.ceil(x) == math.floor(x) else math.ceil(x)
         r = math.floor(y) if math.ceil(y) == math.floor(y) else math.ceil(y)
-
-        for dim in range(l, r)[::-1]:
-            self.add(Dense(2**dim, default_activation, **initKernelAndBias))
-        self.add(Dense(self.out_dim, default_activation, **initKernelAndBias))
+        return [2**dim for dim in range(l, r)[::-1]] + [out_dim]
 
 
 class DeepConvNetwork(Sequential):
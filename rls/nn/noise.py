@@ -54,7 +54,7 @@ class NormalNoisedAction(NoisedAction):
         self.action_bound = action_bound
 
     def __call__(self, action):
-        return tf.clip_by_value(action + tf.random.normal(action.shape, self.mu, self.sigma), -self.action_bound, self.action_bound)
+        return tf.clip_by_value(action + tf.random.normal(tf.shape(action), self.mu, self.sigma), -self.action_bound, self.action_bound)
 
     def __repr__(self):
         return 'NormalNoisedAction(mu={}, sigma={}, action_bound={})'.format(self.mu, self.sigma, self.action_bound)
@@ -67,7 +67,7 @@ class ClippedNormalNoisedAction(NormalNoisedAction):
 
     def __call__(self, action):
         return tf.clip_by_value(
-            action + tf.clip_by_value(tf.random.normal(action.shape, self.mu, self.sigma), -self.noise_bound, self.noise_bound),
+            action + tf.clip_by_value(tf.random.normal(tf.shape(action), self.mu, self.sigma), -self.noise_bound, self.noise_bound),
             -self.action_bound, self.action_bound)
 
     def __repr__(self):
@@ -84,7 +84,7 @@ class OrnsteinUhlenbeckNoisedAction(NormalNoisedAction):
         self.reset()
 
     def __call__(self, action):
-        self.x_prev = self.x_prev + self.theta * (self.mu - self.x_prev) * self.dt + self.sigma * tf.math.sqrt(self.dt) * tf.random.normal(action.shape)
+        self.x_prev = self.x_prev + self.theta * (self.mu - self.x_prev) * self.dt + self.sigma * tf.math.sqrt(self.dt) * tf.random.normal(tf.shape(action))
         return tf.clip_by_value(action + self.x_prev, -self.action_bound, self.action_bound)
 
     def reset(self):
@@ -10,13 +10,15 @@ from tensorflow.keras import Model as M
 
 from rls.utils.specs import OutputNetworkType
 from rls.nn.networks import get_visual_network_from_type
-from rls.nn.models import get_output_network_from_type
+from rls.nn.models import (get_output_network_from_type,
+                           get_ensemble_network_type)
 from rls.nn.networks import (MultiVectorNetwork,
                              MultiVisualNetwork,
                              EncoderNetwork,
                              MemoryNetwork)
 from rls.utils.logging_utils import get_logger
 from rls.utils.specs import ObsSpec
+from rls.utils.tf2_utils import relaxed_function
 logger = get_logger(__name__)
 
 
@@ -85,7 +87,7 @@ class DefaultRepresentationNetwork(RepresentationNetwork):
 
         self.h_dim = self.memory_net.h_dim
 
-    @tf.function
+    @relaxed_function
     def __call__(self, obs, cell_state, *, need_split=False):
         '''
         params:
@@ -101,6 +103,7 @@ class DefaultRepresentationNetwork(RepresentationNetwork):
             # reshape feature from [B*T, x] to [B, T, x]
             feat = tf.reshape(feat, (batch_size, -1, feat.shape[-1]))
             feat, cell_state = self.memory_net(feat, *cell_state)
+            cell_state = tuple(cell_state)  # as initial_cell_state, so _get_action is not retraced by the returned list
 
             if need_split:
                 # reshape feature from [B, T+1, x] to ([B*T, x], [B*T, x])
@@ -202,7 +205,7 @@ class MultiAgentCentralCriticRepresentationNetwork(RepresentationNetwork):
             )
         self.h_dim = sum([rep_net.h_dim for rep_net in self.representation_nets])
 
-    @tf.function
+    @relaxed_function
     def __call__(self, obss, cell_state):
         # TODO: cell_state
         output = []
@@ -303,6 +306,9 @@ class DoubleValueNetwork(ValueNetwork):
          ↗ value_net1 -> outputs
     feat
          ↘ value_net2 -> outputs
+
+    stacked: both value nets are members of one ensemble value_net, see rls.nn.models.get_ensemble_network_type,
+        value_net returns outputs of both stacked, [2, B, ...], and there is no value_net2.
     '''
 
     def __init__(self,
@@ -310,7 +316,12 @@ class DoubleValueNetwork(ValueNetwork):
                  representation_net: RepresentationNetwork = None,
 
                  value_net_type: OutputNetworkType = None,
-                 value_net_kwargs: dict = {}):
+                 value_net_kwargs: dict = {},
+                 stacked: bool = False):
+        self.stacked = stacked
+        if self.stacked:
+            super().__init__(name, representation_net, get_ensemble_network_type(value_net_type), dict(value_net_kwargs, ensemble=2))
+            return
         super().__init__(name, representation_net, value_net_type, value_net_kwargs)
         if self.representation_net is not None:
             self.value_net2 = get_output_network_from_type(value_net_type)(
@@ -322,11 +333,13 @@ class DoubleValueNetwork(ValueNetwork):
     def __call__(self, obs, *args, cell_state=(None,), **kwargs):
         # feature [B, x]
         feat, cell_state = self.representation_net(obs, cell_state)
-        output = self.value_net(feat, *args, **kwargs)
-        output2 = self.value_net2(feat, *args, **kwargs)
+        output, output2 = self.get_value(feat, *args, **kwargs)
         return output, output2, cell_state
 
     def get_value(self, feat, *args, **kwargs):
+        if self.stacked:
+            output = self.value_net(feat, *args, **kwargs)
+            return output[0], output[1]
         output = self.value_net(feat, *args, **kwargs)
         output2 = self.value_net2(feat, *args, **kwargs)
         return output, output2
@@ -339,16 +352,21 @@ class DoubleValueNetwork(ValueNetwork):
 
     @property
     def trainable_variables(self):
+        if self.stacked:
+            return super().trainable_variables
         return super().trainable_variables + self.value_net2.trainable_variables
 
     @property
     def weights(self):
+        if self.stacked:
+            return super().weights
         return super().weights + self.value_net2.weights
 
     @property
     def _all_models(self):
         models = super()._all_models
-        models.update({self.name + '/' + 'value_net2': self.value_net2})
+        if not self.stacked:
+            models.update({self.name + '/' + 'value_net2': self.value_net2})
         return models
 
 
@@ -470,6 +488,8 @@ class ADoubleCNetwork(ACNetwork):
          ↗ policy_net -> outputs
     feat -> value_net  -> outputs
          ↘ value_net2  -> outputs
+
+    stacked: like DoubleValueNetwork, both critics are members of one ensemble value_net.
     '''
 
     def __init__(self,
@@ -480,7 +500,14 @@ class ADoubleCNetwork(ACNetwork):
                  policy_net_kwargs: dict = {},
 
                  value_net_type: OutputNetworkType = None,
-                 value_net_kwargs: dict = {}):
+                 value_net_kwargs: dict = {},
+                 stacked: bool = False):
+        self.stacked = stacked
+        if self.stacked:
+            super().__init__(name, representation_net,
+                             policy_net_type, policy_net_kwargs,
+                             get_ensemble_network_type(value_net_type), dict(value_net_kwargs, ensemble=2))
+            return
         super().__init__(name, representation_net,
                          policy_net_type, policy_net_kwargs,
                          value_net_type, value_net_kwargs)
@@ -492,6 +519,9 @@ class ADoubleCNetwork(ACNetwork):
                 **value_net_kwargs)
 
     def get_value(self, feat, *args, **kwargs):
+        if self.stacked:
+            output = self.value_net(feat, *args, **kwargs)
+            return output[0], output[1]
         output = self.value_net(feat, *args, **kwargs)
         output2 = self.value_net2(feat, *args, **kwargs)
         return output, output2
@@ -504,14 +534,19 @@ class ADoubleCNetwork(ACNetwork):
 
     @property
     def critic_trainable_variables(self):
+        if self.stacked:
+            return super().trainable_variables
         return super().trainable_variables + self.value_net2.trainable_variables
 
     @property
     def weights(self):
+        if self.stacked:
+            return super().weights
         return super().weights + self.value_net2.weights
 
     @property
     def _all_models(self):
         models = super()._all_models
-        models.update({self.name + '/' + 'value_net2': self.value_net2})
+        if not self.stacked:
+            models.update({self.name + '/' + 'value_net2': self.value_net2})
         return models
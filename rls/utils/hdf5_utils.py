@@ -1,14 +1,24 @@
 import h5py
 import numpy as np
 
+from collections import namedtuple
 from typing import NamedTuple
 
 
+def _field_type(data_type: type, k: str) -> type:
+    '''
+    _field_types was removed in python 3.9, use __annotations__ instead.
+    '''
+    annotations = getattr(data_type, '_field_types', None) or getattr(data_type, '__annotations__', {})
+    return annotations.get(k)
+
+
 def namedtuple2hdf5(path: str, data: NamedTuple):
     def save(hf, data):
         for k, v in data._asdict().items():
             if isinstance(v, tuple):
                 hfk = hf.create_group(k)
+                hfk.attrs['fields'] = list(v._fields)   # groups of hdf5 are sorted by names
                 save(hfk, v)
             else:
                 hf.create_dataset(k, data=v)
@@ -21,7 +31,10 @@ def hdf52namedtuple(path: str, data_type: type):
         x = {}
         for k, v in hf.items():
             if isinstance(v, h5py.Group):
-                x[k] = load(v, data_type._field_types.get(k))
+                sub_type = _field_type(data_type, k)
+                if not hasattr(sub_type, '_fields'):    # i.e. namedtuples generated by generate_obs_namedtuple
+                    sub_type = namedtuple(k, v.attrs['fields'] if 'fields' in v.attrs else list(v.keys()))
+                x[k] = load(v, sub_type)
             else:
                 x[k] = v[:]
         return data_type(**x)
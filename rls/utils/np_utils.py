@@ -5,19 +5,114 @@ import itertools
 import scipy.signal
 import numpy as np
 
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
 
 def intprod(x):
     return int(np.prod(x))
 
 
-def discounted_sum(x, gamma, init_value, dones):
-    l = len(x)
-    out = [0] * l
-    for i in reversed(range(l)):
-        out[i] = init_value = x[i] + init_value * gamma * (1 - dones[i])
+def _discounted_sum_kernel(x, gamma, init_value, dones, out):
+    running = init_value.copy()
+    for t in range(x.shape[0] - 1, -1, -1):
+        for m in range(x.shape[1]):
+            running[m] = x[t, m] + gamma * (1. - dones[t, m]) * running[m]
+            out[t, m] = running[m]
+
+
+def _gae_kernel(reward, value, dones, init_value, gamma, lambda_, dc_r, td_error, gae_adv):
+    next_dc_r = init_value.copy()
+    next_adv = np.zeros_like(init_value)
+    for t in range(reward.shape[0] - 1, -1, -1):
+        for m in range(reward.shape[1]):
+            not_done = 1. - dones[t, m]
+            next_value = value[t + 1, m] if t + 1 < reward.shape[0] else init_value[m]
+            next_dc_r[m] = reward[t, m] + gamma * not_done * next_dc_r[m]
+            td = reward[t, m] + gamma * not_done * next_value - value[t, m]
+            next_adv[m] = td + gamma * lambda_ * not_done * next_adv[m]
+            dc_r[t, m] = next_dc_r[m]
+            td_error[t, m] = td
+            gae_adv[t, m] = next_adv[m]
+
+
+if njit is not None:
+    _discounted_sum_kernel = njit(nogil=True)(_discounted_sum_kernel)
+    _gae_kernel = njit(nogil=True)(_gae_kernel)
+else:   # loops over B in python are too slow, fall back to loops over T only
+    _discounted_sum_kernel = _gae_kernel = None
+
+
+def _as_2d(x, T):
+    '''
+    [T, B, ...] or T * [B, ...] => contiguous float32 [T, B*...]
+    '''
+    return np.ascontiguousarray(np.asarray(x, dtype=np.float32).reshape(T, -1))
+
+
+def discounted_sum(x, gamma, init_value, dones, out=None):
+    '''
+    out[t] = x[t] + gamma * (1 - dones[t]) * out[t+1], out[T] = init_value
+    params:
+        x, dones: [T, B, ...] arrays or lists of T arrays with shape [B, ...]
+        init_value: scalar or array with shape [B, ...]
+        out: optional preallocated [T, B, ...] float32 array to write into
+    return:
+        [T, B, ...] float32 array
+    '''
+    T = len(x)
+    shape = (T,) + np.shape(x[0])
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+    x, dones = _as_2d(x, T), _as_2d(dones, T)
+    init_value = np.broadcast_to(np.asarray(init_value, dtype=np.float32), shape[1:]).reshape(-1).copy()
+    _out = out.reshape(T, -1)
+    if _discounted_sum_kernel is not None:
+        _discounted_sum_kernel(x, gamma, init_value, dones, _out)
+    else:
+        not_dones = gamma * (1. - dones)
+        for t in reversed(range(T)):
+            _out[t] = init_value = x[t] + not_dones[t] * init_value
     return out
 
 
+def gae_and_returns(rewards, values, dones, init_value, gamma, lambda_, out=None):
+    '''
+    fused GAE and discounted returns, one backward pass over T.
+        dc_r[t] = r[t] + gamma * (1 - d[t]) * dc_r[t+1], dc_r[T] = init_value
+        td[t] = r[t] + gamma * (1 - d[t]) * v[t+1] - v[t], v[T] = init_value
+        adv[t] = td[t] + gamma * lambda * (1 - d[t]) * adv[t+1], adv[T] = 0
+    "Generalized Advantage Estimation": https://arxiv.org/abs/1506.02438
+    params:
+        rewards, values, dones: [T, B, ...] arrays or lists of T arrays with shape [B, ...]
+        init_value: value of the last next state, [B, ...]
+        out: optional tuple of three preallocated [T, B, ...] float32 arrays to write into
+    return:
+        discounted returns, td errors, gae advantages, each with shape [T, B, ...]
+    '''
+    T = len(rewards)
+    shape = (T,) + np.shape(rewards[0])
+    if out is None:
+        out = tuple(np.empty(shape, dtype=np.float32) for _ in range(3))
+    dc_r, td_error, gae_adv = out
+    rewards, values, dones = _as_2d(rewards, T), _as_2d(values, T), _as_2d(dones, T)
+    init_value = np.broadcast_to(np.asarray(init_value, dtype=np.float32), shape[1:]).reshape(-1).copy()
+    _dc_r, _td_error, _gae_adv = dc_r.reshape(T, -1), td_error.reshape(T, -1), gae_adv.reshape(T, -1)
+    if _gae_kernel is not None:
+        _gae_kernel(rewards, values, dones, init_value, gamma, lambda_, _dc_r, _td_error, _gae_adv)
+    else:
+        not_dones = 1. - dones
+        _td_error[:-1] = values[1:]
+        _td_error[-1] = init_value
+        _td_error *= gamma * not_dones
+        _td_error += rewards - values
+        discounted_sum(rewards, gamma, init_value, dones, out=_dc_r)
+        discounted_sum(_td_error, gamma * lambda_, 0., dones, out=_gae_adv)
+    return dc_r, td_error, gae_adv
+
+
 def calculate_td_error(r, gamma, d, v, v_):
     r = np.array(r)
     v = np.array(v)
@@ -218,6 +218,13 @@ class ModelObservations(NamedTuple):
     vector: NamedTuple  # NamedTupleStaticClass.generate_obs_namedtuple
     visual: NamedTuple  # NamedTupleStaticClass.generate_obs_namedtuple
 
+    @property
+    def batch_size(self) -> int:
+        '''
+        number of observations, i.e. envs whose actions are chosen.
+        '''
+        return (self.vector + self.visual)[0].shape[0]
+
     def flatten_vector(self):
         '''
         TODO: Annotation
@@ -340,3 +347,6 @@ class OutputNetworkType(Enum):
     QRDQN_DISTRIBUTIONAL = 'QrdqnDistributional'
     RAINBOW_DUELING = 'RainbowDueling'
     IQN_NET = 'IqnNet'
+    CRITIC_VALUE_ENSEMBLE = 'CriticValueEnsemble'
+    CRITIC_QVALUE_ONE_ENSEMBLE = 'CriticQvalueOneEnsemble'
+    CRITIC_QVALUE_ALL_ENSEMBLE = 'CriticQvalueAllEnsemble'
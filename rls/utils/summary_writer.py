@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# encoding: utf-8
+
+import time
+import queue
+import atexit
+import threading
+import numpy as np
+import tensorflow as tf
+
+from collections import defaultdict
+from typing import (Dict,
+                    List,
+                    Union,
+                    NoReturn)
+
+
+class AsyncSummaryWriter(threading.Thread):
+    '''
+    Write scalars of a tf.summary.SummaryWriter from a background thread, so training steps do not block on
+    fetching device tensors or event-file I/O, they only put summary dicts into a bounded queue.
+    Scalars added with reduce=True are aggregated over windows of `interval` calls of add, and written once per window,
+    at the step of its last call. The first of `reduces` is written under the key itself, others under key_<reduce>.
+    Events are flushed every flush_secs seconds, by flush(), i.e. when saving checkpoints, and by close().
+    '''
+    REDUCES = dict(
+        mean=np.mean,
+        min=np.min,
+        max=np.max,
+        last=lambda x: x[-1]
+    )
+
+    def __init__(self,
+                 writer: tf.summary.SummaryWriter,
+                 interval: int = 1,
+                 reduces: List[str] = ['mean'],
+                 flush_secs: float = 10.,
+                 max_queue: int = 1000):
+        super().__init__(daemon=True)
+        assert interval >= 1, 'interval must be larger than zero'
+        for r in reduces:
+            assert r in self.REDUCES, f'reduce must be one of {list(self.REDUCES.keys())}, but got {r}'
+        self.writer = writer
+        self.interval = interval
+        self.reduces = list(reduces)
+        self.flush_secs = flush_secs
+        self.queue = queue.Queue(maxsize=max_queue)
+        self._window = defaultdict(list)    # key -> host values of the current window
+        self._count = 0
+        self._step = 0
+        self._error = None
+        self._closed = False
+        self.start()
+        atexit.register(self.close)
+
+    def add(self, step: Union[int, tf.Variable], summaries: Dict, reduce: bool = True) -> NoReturn:
+        '''
+        values of summaries may be python numbers, numpy arrays or tensors, they are fetched in the background thread.
+        blocks only when max_queue dicts are waiting.
+        '''
+        self._raise()
+        if isinstance(step, tf.Variable):
+            step = step.read_value()    # a snapshot, the variable keeps changing while this waits in the queue
+        self.queue.put(('add', (step, dict(summaries), reduce)))
+
+    def flush(self) -> NoReturn:
+        '''
+        write the unfinished window, flush events to disk, and wait until they are done.
+        '''
+        if self._closed:
+            return
+        done = threading.Event()
+        self.queue.put(('flush', done))
+        done.wait()
+        self._raise()
+
+    def close(self) -> NoReturn:
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(('close', None))
+        self.join()
+        self._raise()
+
+    def run(self):
+        last_flush = time.time()
+        while True:
+            try:
+                op, arg = self.queue.get(timeout=self.flush_secs)
+            except queue.Empty:
+                op, arg = 'timer', None
+            try:
+                if op == 'add':
+                    self._add(*arg)
+                elif op in ['flush', 'close']:
+                    self._write_window()
+                    self.writer.flush()
+                    last_flush = time.time()
+                if op == 'timer' or time.time() - last_flush > self.flush_secs:
+                    self.writer.flush()
+                    last_flush = time.time()
+            except Exception as e:  # raised again by add or flush, instead of dying silently
+                self._error = self._error or e
+            finally:
+                if op == 'flush':
+                    arg.set()
+            if op == 'close':
+                break
+
+    def _raise(self) -> NoReturn:
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _add(self, step, summaries: Dict, reduce: bool) -> NoReturn:
+        step = int(step)
+        if not reduce or self.interval == 1:
+            self._write(step, {k: float(np.asarray(v)) for k, v in summaries.items()})
+            return
+        for k, v in summaries.items():
+            self._window[k].append(float(np.asarray(v)))
+        self._step = step
+        self._count += 1
+        if self._count >= self.interval:
+            self._write_window()
+
+    def _write_window(self) -> NoReturn:
+        if self._count == 0:
+            return
+        scalars = {}
+        for k, values in self._window.items():
+            for i, r in enumerate(self.reduces):
+                scalars[k if i == 0 else f'{k}_{r}'] = self.REDUCES[r](values)
+        self._write(self._step, scalars)
+        self._window.clear()
+        self._count = 0
+
+    def _write(self, step: int, scalars: Dict) -> NoReturn:
+        with self.writer.as_default():
+            for k, v in scalars.items():
+                tf.summary.scalar(k, v, step=step)
@@ -1,7 +1,9 @@
 import sys
 sys.path.append('../..')
+import pytest
 import numpy as np
 
+from rls.utils import np_utils
 from rls.utils.np_utils import *
 
 
@@ -15,4 +17,53 @@ def test_all_equal():
     print('success')
 
 
+def _reference(rewards, values, dones, init_value, gamma, lambda_):
+    T = rewards.shape[0]
+    dc_r, td_error, gae_adv = (np.zeros_like(rewards) for _ in range(3))
+    next_dc_r, next_value, next_adv = init_value, init_value, np.zeros_like(init_value)
+    for t in reversed(range(T)):
+        not_done = 1. - dones[t]
+        dc_r[t] = next_dc_r = rewards[t] + gamma * not_done * next_dc_r
+        td_error[t] = rewards[t] + gamma * not_done * next_value - values[t]
+        gae_adv[t] = next_adv = td_error[t] + gamma * lambda_ * not_done * next_adv
+        next_value = values[t]
+    return dc_r, td_error, gae_adv
+
+
+@pytest.fixture(params=['kernel', 'numpy'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        monkeypatch.setattr(np_utils, '_discounted_sum_kernel', None)
+        monkeypatch.setattr(np_utils, '_gae_kernel', None)
+    elif np_utils._gae_kernel is None:
+        pytest.skip('numba is not installed')
+    return request.param
+
+
+def _rollout(T=7, B=3):
+    rng = np.random.RandomState(0)
+    rewards = rng.randn(T, B, 1).astype(np.float32)
+    values = rng.randn(T, B, 1).astype(np.float32)
+    dones = (rng.rand(T, B, 1) < 0.3).astype(np.float32)
+    init_value = rng.randn(B, 1).astype(np.float32)
+    return rewards, values, dones, init_value
+
+
+def test_gae_and_returns(backend):
+    rewards, values, dones, init_value = _rollout()
+    expected = _reference(rewards, values, dones, init_value, 0.99, 0.95)
+    for out in [None, tuple(np.empty_like(rewards) for _ in range(3))]:
+        results = gae_and_returns(list(rewards), values, dones, init_value, 0.99, 0.95, out=out)
+        for r, e in zip(results, expected):
+            assert r.shape == rewards.shape and np.allclose(r, e, atol=1e-5)
+
+
+def test_discounted_sum(backend):
+    rewards, _, dones, init_value = _rollout()
+    expected = _reference(rewards, np.zeros_like(rewards), dones, init_value, 0.9, 1.)[0]
+    assert np.allclose(discounted_sum(rewards, 0.9, init_value, dones), expected, atol=1e-5)
+    assert np.allclose(discounted_sum(rewards, 0.9, 0., np.zeros_like(dones)),
+                       _reference(rewards, np.zeros_like(rewards), np.zeros_like(dones), np.zeros_like(init_value), 0.9, 1.)[0], atol=1e-5)
+
+
 test_all_equal()
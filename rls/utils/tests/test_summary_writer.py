@@ -0,0 +1,24 @@
+import sys
+sys.path.append('../..')
+import glob
+import numpy as np
+import tensorflow as tf
+
+from rls.utils.summary_writer import AsyncSummaryWriter
+from rls.utils.tf2_summary import tf2summary2dict
+
+
+def test_async_summary_writer(tmp_path):
+    writer = AsyncSummaryWriter(tf.summary.create_file_writer(str(tmp_path)), interval=4, reduces=['mean', 'max', 'last'])
+    step = tf.Variable(0, dtype=tf.int64)
+    for i in range(10):
+        step.assign_add(1)
+        writer.add(step, {'LOSS/loss': tf.constant(float(i))})
+    writer.add(3, {'AGENT/reward': 1.5}, reduce=False)
+    writer.close()
+
+    data = tf2summary2dict(glob.glob(str(tmp_path / '*.v2'))[0])
+    assert data['LOSS/loss'] == [[1.5, 4], [5.5, 8], [8.5, 10]]  # the unfinished window is written by close
+    assert data['LOSS/loss_max'] == [[3., 4], [7., 8], [9., 10]]
+    assert data['LOSS/loss_last'] == data['LOSS/loss_max']
+    assert data['AGENT/reward'] == [[1.5, 3]]
@@ -0,0 +1,114 @@
+import sys
+sys.path.append('../..')
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from rls.utils.tf2_utils import (update_target_net_weights,
+                                 TargetNetUpdater,
+                                 relaxed_function,
+                                 trace_monitor)
+from rls.utils.specs import ModelObservations
+
+
+def _variables(seed):
+    rng = np.random.RandomState(seed)
+    return [tf.Variable(rng.randn(3, 4).astype(np.float32)),
+            tf.Variable(rng.randn(4).astype(np.float32)),
+            tf.Variable(rng.randint(0, 9, (2,)).astype(np.int64))]
+
+
+def test_target_net_updater_polyak():
+    src, tge, expected = _variables(0), _variables(1), _variables(1)
+    updater = TargetNetUpdater(tge, src, ployak=0.9)
+    for _ in range(3):
+        updater.update()
+        update_target_net_weights(expected[:2], src[:2], 0.9)
+        expected[2].assign(src[2])  # integer variables are copied
+    for t, e in zip(tge, expected):
+        assert np.allclose(t.numpy(), e.numpy())
+
+
+def test_target_net_updater_interval():
+    src, tge = _variables(0), _variables(1)
+    step = tf.Variable(0, dtype=tf.int64)
+    updater = TargetNetUpdater(tge, src, interval=3, step=step)
+    copied = []
+    for _ in range(6):
+        step.assign_add(1)
+        src[0].assign_add(tf.ones_like(src[0]))
+        updater.update()
+        copied.append(np.array_equal(tge[0].numpy(), src[0].numpy()))
+    assert copied == [False, False, True, False, False, True]
+    updater.copy()
+    assert all(np.array_equal(t.numpy(), s.numpy()) for t, s in zip(tge, src))
+    with pytest.raises(AssertionError):   # the phase would be lost on restoring without a checkpointed step
+        TargetNetUpdater(tge, src, interval=3)
+
+
+class _Net(tf.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.w = tf.Variable(2.)
+
+    @relaxed_function
+    def __call__(self, obs, cell_state, *, need_split=False):
+        feat = tf.concat(obs.vector, axis=-1) * self.w
+        return tf.split(feat, 2) if need_split else feat
+
+
+def test_relaxed_function_traces_once_for_batch_sizes():
+    trace_monitor.reset()
+    net = _Net()
+    for batch in [2, 6, 10]:
+        obs = ModelObservations(vector=(np.ones((batch, 3), np.float32), tf.ones((batch, 1))), visual=())
+        assert net(obs, (None,)).shape == (batch, 4)
+    assert trace_monitor.traces['_Net.__call__'] == 1 and trace_monitor.retraces['_Net.__call__'] == 0
+
+    feats = tf.function(lambda obs: net(obs, (None,)))(obs)     # nested in another tf.function, not counted
+    assert np.allclose(feats.numpy(), 2.)
+    assert net(obs, (None,), need_split=True)[0].shape == (5, 4)    # new static arguments, traced but not retraced
+    assert trace_monitor.traces['_Net.__call__'] == 2 and trace_monitor.summaries() == {'RETRACING/_Net.__call__': 0}
+    obs = ModelObservations(vector=(np.ones((5, 3), np.float32), tf.ones((5, 2))), visual=())
+    assert net(obs, (None,)).shape == (5, 5)
+    assert trace_monitor.summaries() == {'RETRACING/_Net.__call__': 1}
+
+
+class _Stacked(tf.Module):
+
+    @relaxed_function(batch_axis=1)
+    def sum_agents(self, x):
+        return tf.reduce_sum(x, axis=0)
+
+
+class _Agents(tf.Module):
+
+    def __init__(self):
+        super().__init__()
+        self.nets = [tf.keras.layers.Dense(2) for _ in range(3)]
+        for net in self.nets:
+            net.build((None, 3))
+
+    @relaxed_function
+    def _get_action(self, obs, net):
+        return net(obs)
+
+
+def test_relaxed_function_new_objects_are_not_retraced():
+    trace_monitor.reset()
+    agents = _Agents()
+    for _ in range(2):
+        for net in agents.nets:
+            assert agents._get_action(tf.ones((4, 3)), net).shape == (4, 2)
+    assert trace_monitor.traces['_Agents._get_action'] == 3 and trace_monitor.retraces['_Agents._get_action'] == 0
+
+
+def test_relaxed_function_batch_axis():
+    trace_monitor.reset()
+    net = _Stacked()
+    for batch in [2, 6]:
+        assert net.sum_agents(tf.ones((3, batch, 4))).shape == (batch, 4)
+    assert trace_monitor.traces['_Stacked.sum_agents'] == 1
+    net.sum_agents(tf.ones((2, 6, 4)))  # the agent dimension is not relaxed
+    assert trace_monitor.retraces['_Stacked.sum_agents'] == 1
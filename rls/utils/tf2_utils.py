@@ -1,13 +1,21 @@
 #!/usr/bin/env python3
 # encoding: utf-8
 
+import inspect
 import numpy as np
 import tensorflow as tf
 
-from typing import (List,
+from collections import defaultdict
+from typing import (Any,
+                    Callable,
+                    Dict,
+                    List,
                     Optional,
                     NoReturn)
 
+from rls.utils.logging_utils import get_logger
+logger = get_logger(__name__)
+
 
 def get_device():
     '''
@@ -38,11 +46,179 @@ def show_graph(name='my_func_trace'):
     return show_tf2_graph
 
 
-def get_TensorSpecs(*args):
+def get_TensorSpecs(*args, dtype=tf.float32):
     """
     get all inputs' shape in order to fix the problem of retracing in TF2.0
     """
-    return [tf.TensorSpec(shape=[None] + i if isinstance(i, list) else [i], dtype=tf.float32) for i in args]
+    return [tf.TensorSpec(shape=[None] + i if isinstance(i, list) else [i], dtype=dtype) for i in args]
+
+
+class TraceMonitor(object):
+    '''
+    Count traces of functions wrapped by relaxed_function, keyed by '<class>.<function>'.
+    A function traced again for the same instance and the same non-tensor arguments, i.e. with a new dtype or shape
+    of a tensor, is a retrace, it logs a warning with the input specs of the new trace and of the former ones.
+    The first trace for new non-tensor arguments, like a network of every agent, is not a retrace.
+    Counts of retraces are written to tensorboard by Base.write_training_summaries.
+    '''
+
+    def __init__(self):
+        self.traces = defaultdict(int)
+        self.retraces = defaultdict(int)
+
+    def record(self, name: str, signature: str, former: List[str]) -> NoReturn:
+        self.traces[name] += 1
+        if former:
+            self.retraces[name] += 1
+            logger.warning(f'{name} is retraced ({len(former) + 1} traces) with inputs: {signature}, former inputs: {former}')
+
+    def summaries(self) -> Dict[str, int]:
+        return {f'RETRACING/{k}': self.retraces[k] for k in self.traces.keys()}
+
+    def reset(self) -> NoReturn:
+        self.traces.clear()
+        self.retraces.clear()
+
+
+trace_monitor = TraceMonitor()
+_TENSOR = object()  # placeholder of tensors in the key of non-tensor arguments
+
+
+def _is_tensor(x) -> bool:
+    return isinstance(x, (tf.Tensor, np.ndarray, np.generic))
+
+
+def _relaxed_shape(x, batch_axis: int) -> tuple:
+    '''
+    shape of x with the batch dimension as None, shapes of tensors with no batch dimension are kept.
+    '''
+    shape = tuple(x.shape)
+    if len(shape) <= batch_axis:
+        return shape
+    return shape[:batch_axis] + (None,) + shape[batch_axis + 1:]
+
+
+def _signature_key(x, batch_axis: int = 0) -> Any:
+    '''
+    hashable key of a nested argument, tensors are keyed by dtype and shape without the batch dimension,
+    other objects by value, or by identity if they are not hashable, e.g. tf.Variable.
+    '''
+    if _is_tensor(x):
+        return ('tensor', tf.as_dtype(x.dtype).name, _relaxed_shape(x, batch_axis))
+    if hasattr(x, '_fields'):   # namedtuple, classes of empty observations are created for every call
+        return (type(x).__name__, x._fields, tuple(_signature_key(i, batch_axis) for i in x))
+    if isinstance(x, (tuple, list)):
+        return (type(x), tuple(_signature_key(i, batch_axis) for i in x))
+    if isinstance(x, dict):
+        return (type(x), tuple((k, _signature_key(x[k], batch_axis)) for k in sorted(x.keys())))
+    try:
+        hash(x)
+        return ('static', type(x), x)
+    except TypeError:
+        return ('static', type(x), id(x))
+
+
+def _relaxed_spec(x, batch_axis: int = 0) -> tf.TensorSpec:
+    '''
+    TensorSpec of x with the batch dimension relaxed to None.
+    '''
+    dtype = tf.as_dtype(x.dtype)
+    if batch_axis == 0 and len(x.shape) > 0:
+        return get_TensorSpecs(list(x.shape[1:]), dtype=dtype)[0]
+    return tf.TensorSpec(shape=_relaxed_shape(x, batch_axis), dtype=dtype)
+
+
+class _RelaxedMethod(object):
+    '''
+    A method of one instance, see relaxed_function.
+    '''
+
+    def __init__(self, func: Callable, instance: Any, batch_axis: int = 0):
+        self._func = func
+        self._instance = instance
+        self.batch_axis = batch_axis
+        self._signature = inspect.signature(func)
+        self._self = next(iter(self._signature.parameters))    # name of the instance argument, i.e. self
+        self.name = f'{type(instance).__name__}.{func.__name__}'
+        self._functions = {}    # signature key -> (tf.function, signature for logging, indexes of tensors in flattened arguments)
+        self._traced = defaultdict(list)    # key of non-tensor arguments -> signatures traced with them
+        self._nested = None
+
+    @tf.autograph.experimental.do_not_convert
+    def __call__(self, *args, **kwargs):
+        if not tf.executing_eagerly():
+            # called in another tf.function, it is traced as a nested function like before, without counting.
+            if self._nested is None:
+                self._nested = tf.function(self._func).__get__(self._instance, type(self._instance))
+            return self._nested(*args, **kwargs)
+        bound = self._signature.bind(self._instance, *args, **kwargs)
+        bound.apply_defaults()
+        names, values = tuple(bound.arguments.keys())[1:], tuple(bound.arguments.values())[1:]
+        key = (names, _signature_key(values, self.batch_axis))
+        if key not in self._functions:
+            self._functions[key] = self._build(names, values)
+        function, _, indexes = self._functions[key]
+        flat = tf.nest.flatten(values)
+        return function(*[flat[i] for i in indexes])
+
+    def _build(self, names, values):
+        flat = tf.nest.flatten(values)
+        indexes = [i for i, x in enumerate(flat) if _is_tensor(x)]
+        specs = [_relaxed_spec(flat[i], self.batch_axis) for i in indexes]
+        leaves = [None if _is_tensor(x) else x for x in flat]   # do not hold tensors of the first call
+        skeleton = tf.nest.pack_sequence_as(values, leaves)
+        signature = ', '.join(f'{n}={v}' for n, v in zip(names, tf.nest.pack_sequence_as(values, [
+            specs[indexes.index(i)] if i in indexes else x for i, x in enumerate(leaves)])))
+        static = (names, _signature_key(tf.nest.pack_sequence_as(values, [_TENSOR if _is_tensor(x) else x for x in flat])))
+        former = list(self._traced[static])
+        self._traced[static].append(signature)
+
+        def graph_function(*tensors):
+            trace_monitor.record(self.name, signature, former)
+            _leaves = list(leaves)
+            for i, t in zip(indexes, tensors):
+                _leaves[i] = t
+            arguments = dict(zip(names, tf.nest.pack_sequence_as(skeleton, _leaves)))
+            _bound = inspect.BoundArguments(self._signature, {self._self: self._instance, **arguments})
+            return self._func(*_bound.args, **_bound.kwargs)
+
+        graph_function.__name__ = self._func.__name__
+        return tf.function(graph_function, input_signature=specs), signature, indexes
+
+
+class relaxed_function(object):
+    '''
+    Decorate a method like tf.function, but trace it with an input_signature derived from its first call,
+    tensors of which are relaxed to None in the batch dimension, so the method is traced once for every batch size,
+    e.g. n_agents envs when choosing actions, batch_size or batch_size*T when training, and ObsSpec shaped
+    ModelObservations, BatchExperiences and cell_state nested in arguments are kept as they are.
+    None, python values and other objects in arguments, like need_split or cell_state of (None,),
+    are static, a new value of them, or of the dtype or rank of a tensor, builds a new signature.
+    trace_monitor records a retrace only for a new signature of the tensors with static arguments traced before.
+    Called in another tf.function, the method is traced into it as a nested tf.function.
+    batch_axis: the relaxed dimension, i.e. 1 for stacked [agents, B, ...] or [K, B, ...] arguments,
+        use it as @relaxed_function(batch_axis=1).
+    '''
+
+    def __init__(self, func: Optional[Callable] = None, *, batch_axis: int = 0):
+        self._func = func
+        self.batch_axis = batch_axis
+        if func is not None:
+            self._attr = f'_relaxed_{func.__name__}'
+            self.__doc__ = func.__doc__
+            self.__name__ = func.__name__
+
+    def __call__(self, func: Callable) -> 'relaxed_function':
+        assert self._func is None, 'relaxed_function decorates methods, call them on instances'
+        return relaxed_function(func, batch_axis=self.batch_axis)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self
+        method = instance.__dict__.get(self._attr)
+        if method is None:
+            method = instance.__dict__[self._attr] = _RelaxedMethod(self._func, instance, self.batch_axis)
+        return method
 
 
 def clip_nn_log_std(log_std, _min=-20, _max=2):
@@ -69,7 +245,7 @@ def gaussian_rsample(mu, log_std):
         the log probability of sample
     """
     std = tf.exp(log_std)
-    pi = mu + tf.random.normal(mu.shape) * std
+    pi = mu + tf.random.normal(tf.shape(mu)) * std
     log_pi = gaussian_likelihood(pi, mu, log_std)
     return pi, log_pi
 
@@ -87,7 +263,7 @@ def gaussian_clip_rsample(mu, log_std, _min=-1, _max=1):
         the log probability of sample
     """
     std = tf.exp(log_std)
-    pi = mu + tf.random.normal(mu.shape) * std
+    pi = mu + tf.random.normal(tf.shape(mu)) * std
     pi = tf.clip_by_value(pi, _min, _max)
     log_pi = gaussian_likelihood(pi, mu, log_std)
     return pi, log_pi
@@ -220,6 +396,65 @@ def update_target_net_weights(tge: List[tf.Tensor], src: List[tf.Tensor], ployak
         tf.group([t.assign(ployak * t + (1 - ployak) * s) for t, s in zip(tge, src)])
 
 
+class TargetNetUpdater(object):
+    '''
+    Update target networks from source networks registered once, by one tf.function call instead of
+    one eager assign per variable every train step, the polyak average of every variable is computed in place
+    inside that graph, integer variables are copied.
+    interval: update every `interval` steps, decided in graph by `step % interval == 0`, so schedules like
+        assign_interval need no host check.
+    step: a checkpointed counter of train steps, i.e. global_step, required if interval > 1,
+        so that the phase of the schedule survives restoring.
+    '''
+
+    def __init__(self,
+                 tge: List[tf.Variable],
+                 src: List[tf.Variable],
+                 ployak: Optional[float] = None,
+                 interval: int = 1,
+                 step: Optional[tf.Variable] = None):
+        assert len(tge) == len(src), 'assert len(tge) == len(src)'
+        for t, s in zip(tge, src):
+            assert t.shape == s.shape and t.dtype == s.dtype, f'target {t.name} does not match source {s.name}'
+        assert interval >= 1, 'interval must be larger than zero'
+        assert interval == 1 or step is not None, 'updating every interval steps needs a checkpointed step'
+        self.ployak = ployak
+        self.interval = interval
+        self.step = step
+        self._pairs = list(zip(tge, src))
+
+    @tf.function
+    def update(self) -> NoReturn:
+        if self.interval == 1 or self.step % self.interval == 0:
+            self._update(self.ployak)
+
+    @tf.function
+    def copy(self) -> NoReturn:
+        '''
+        hard copy now, regardless of ployak and interval.
+        '''
+        self._update(None)
+
+    def _update(self, ployak: Optional[float]) -> NoReturn:
+        for t, s in self._pairs:
+            if ployak is None or not t.dtype.is_floating:
+                t.assign(s)
+            else:
+                t.assign_sub((1 - ployak) * (t - s))    # ployak * t + (1 - ployak) * s
+
+
+def update_stacked_target_net_weights(tge: List[tf.Tensor], src: List[tf.Tensor], index, ployak: Optional[float] = None) -> NoReturn:
+    '''
+    update member `index` of target networks stacked along the leading axis, i.e. made of rls.nn.layers.StackedDense,
+    with weights of a single network in the same order, one sliced assign per stacked weight.
+    ployak = 1 - tau
+    '''
+    if ployak is None:
+        tf.group([t[index].assign(s) for t, s in zip(tge, src)])
+    else:
+        tf.group([t[index].assign(ployak * t[index] + (1 - ployak) * s) for t, s in zip(tge, src)])
+
+
 def grads_flatten(grads):
     return tf.concat(
         [tf.keras.backend.flatten(g) for g in grads],